@@ -1,17 +1,18 @@
-import os
 import asyncio # 引入aio异步库
-from google import genai
+from utils.genai_client import get_genai_client
+from utils.history import HistoryManager
 from dotenv import load_dotenv
 
 load_dotenv()
 
 class ProjectAssistant:
     def __init__(self, system_instruction):
-        self.client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+        self.client = get_genai_client()
         self.model_id = "gemini-2.0-flash-exp"
         self.system_instruction = system_instruction
         # 1. 我们手动管理历史记录，不依赖 SDK 内部属性
         self.history = [] 
+        self.history_manager = HistoryManager()  # 历史超过 token 预算时压缩
 
     # 使用异步方法
     async def ask(self, message):
@@ -20,6 +21,10 @@ class ProjectAssistant:
         # 这是最符合“无状态”转换“有状态”的逻辑
         
         # 组装当前的请求内容：历史记录 + 当前问题
+        self.history = self.history_manager.compact(self.history)
+        report = self.history_manager.format_last_report()
+        if report:
+            print(report)
         messages = self.history + [{"role": "user", "parts": [{"text": message}]}]
         
         # 注意：这里必须 await，否则返回的是一个 Coroutine 对象，而不是结果
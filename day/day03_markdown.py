@@ -1,6 +1,6 @@
 import asyncio
-import os
-from google import genai
+from utils.genai_client import get_genai_client
+from utils.history import HistoryManager
 from datetime import datetime
 
 # 1. 引入 dotenv 并加载环境变量
@@ -22,16 +22,21 @@ class ProjectAssistant:
         输出格式要求：请使用清晰的 Markdown 格式，包含标题、加粗和代码块。
         """
         
-        self.client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+        self.client = get_genai_client()
         self.model_id = "gemini-3-pro-preview" # 使用更强大的 Gemini 3 Pro 模型
         # 手动管理历史记录
         self.history = [] 
+        self.history_manager = HistoryManager()  # 历史超过 token 预算时压缩
 
     async def ask(self, message):
         """发送消息并获取回复 (Async)"""
         print(f"⏳ 正在思考架构方案... (这是最耗时的步骤，请耐心等待)")
         
         # 构造请求：历史 + 当前问题
+        self.history = self.history_manager.compact(self.history)
+        report = self.history_manager.format_last_report()
+        if report:
+            print(report)
         messages = self.history + [{"role": "user", "parts": [{"text": message}]}]
         
         # 调用 API
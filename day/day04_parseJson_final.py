@@ -1,6 +1,7 @@
-from google import genai
+from utils.genai_client import get_genai_client
+from utils.history import HistoryManager
+from utils.response_cache import with_response_cache
 import dotenv
-import os
 import json
 import asyncio
 from utils.ai_tools import AIToolkit  # 从工具包导入类
@@ -15,16 +16,21 @@ class ProjectAssistant:
         ### 角色：
         你是一个精通项目管理的系统架构师，对项目的健壮性和可靠性有着近乎偏执的追求，愿意花时间打磨产品，不为上线时间妥协。
         """
-        self.client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+        self.client = with_response_cache(get_genai_client())
         self.model_id = "gemini-3-pro-preview"  # 使用更强大的 Gemini 3 Pro 模型
         # 手动管理历史记录
         self.history = []
+        self.history_manager = HistoryManager()  # 历史超过 token 预算时压缩
 
     async def ask(self, message):
         """发送消息并获取回复 (Async)"""
         print(f"⏳ 正在由系统架构师处理... (这是非常耗时的步骤，请耐心等待)")
 
         # 构造请求：历史 + 当前问题
+        self.history = self.history_manager.compact(self.history)
+        report = self.history_manager.format_last_report()
+        if report:
+            print(report)
         messages = self.history + [{"role": "user", "parts": [{"text": message}]}]
         # 调用 API
         response = await self.client.aio.models.generate_content(
@@ -5,7 +5,12 @@ import glob
 import asyncio
 import dotenv
 from datetime import datetime
-from google import genai
+from utils.genai_client import (
+    aclose_genai_clients,
+    awarm_up_genai_client,
+    get_genai_client,
+)
+from utils.response_cache import CachedClient, format_cache_stats, with_response_cache
 
 # 加载环境变量 (确保 GEMINI_API_KEY 已配置)
 dotenv.load_dotenv()
@@ -16,7 +21,7 @@ dotenv.load_dotenv()
 # ==========================================
 class CodeAssistant:
     def __init__(self, name, system_instruction):
-        self.client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+        self.client = with_response_cache(get_genai_client())
         # 使用 gemini-2.0-flash，速度快且逻辑严谨，非常适合多轮审计
         self.model_id = "gemini-2.0-flash"
         self.name = name
@@ -41,13 +46,17 @@ class CodeAssistant:
 
         return clean_text.strip()
 
-    async def ask(self, message):
+    async def ask(self, message, fresh: bool = False):
+        """fresh=True：重试时用，不走响应缓存，保证拿到新的回复"""
         print(f"⏳ [{self.name}] 正在思考中...")
+        # 没挂响应缓存 (RAG_RESPONSE_CACHE 没开) 时 client 是原生的，不认 cache 参数
+        extra = {"cache": False} if fresh and isinstance(self.client, CachedClient) else {}
         try:
             response = await self.client.aio.models.generate_content(
                 model=self.model_id,
                 contents=[{"role": "user", "parts": [{"text": message}]}],
                 config={"system_instruction": self.system_instruction},
+                **extra,
             )
             return self.clean_json_string(response.text)
         except Exception as e:
@@ -87,13 +96,19 @@ REFACTOR_PROMPT = """你是一个重构工程师。根据历史评价优化代
 # 4. 主程序逻辑
 # ==========================================
 async def main():
-    # 1. 环境准备
-    history_data, file_name = load_latest_json("project_tasks_db")
+    # 1. 环境准备 (三个角色共用一个客户端；读文件放到线程里，同时在事件循环里把 TLS 连接先建好)
+    warm_up = asyncio.create_task(awarm_up_genai_client())
+    history_data, file_name = await asyncio.to_thread(
+        load_latest_json, "project_tasks_db"
+    )
     if not history_data:
+        warm_up.cancel()
         print("❌ 未找到项目设计 JSON 文件，请检查路径。")
         return
     print(f"✅ 已加载架构背景: {file_name}")
 
+    await warm_up
+
     # 2. 实例化 Agent 团队
     architect = CodeAssistant("系统架构师", ARCHITECT_PROMPT)
     auditor = CodeAssistant("安全审计师", AUDITOR_PROMPT)
@@ -103,6 +118,8 @@ async def main():
     history_records = []  # 存储每一轮的结果：{"score": 0, "code": "", "critiques": []}
     max_iterations = 5
     current_code = ""
+    # 重构解析失败、沿用上一版代码时，下一轮的请求和上一轮一字不差：要绕过响应缓存重新问
+    retrying = False
 
     # 第一步：由架构师生成初始代码
     print("\n--- 🏗️ 第一步：架构师生成初始方案 ---")
@@ -120,7 +137,7 @@ async def main():
         print(f"\n--- 🔄 第 {i+1} 轮进化开始 ---")
 
         # A. 审计阶段
-        audit_raw = await auditor.ask(f"请审计此代码：\n{current_code}")
+        audit_raw = await auditor.ask(f"请审计此代码：\n{current_code}", fresh=retrying)
 
         try:
             # 增加容错：如果 JSON 解析失败，尝试强制修复或给低分触发重构
@@ -154,13 +171,15 @@ async def main():
         if i < max_iterations - 1:
             # 将所有历史评价喂给重构工程师，让它“长记性”
             refactor_msg = f"历史代码：\n{current_code}\n\n历史审计意见：\n{json.dumps(critiques, ensure_ascii=False)}"
-            refactor_raw = await refactor.ask(refactor_msg)
+            refactor_raw = await refactor.ask(refactor_msg, fresh=retrying)
             try:
                 current_code = json.loads(refactor_raw, strict=False).get(
                     "pseudocode", ""
                 )
+                retrying = False
             except:
                 print("⚠️ 重构代码解析异常，沿用上一版进行下一轮。")
+                retrying = True
 
     # 5. 优中选优：从 history_records 中选出分数最高的一版
     best_version = max(history_records, key=lambda x: x["score"])
@@ -178,6 +197,19 @@ async def main():
         json.dump(best_version, f, ensure_ascii=False, indent=4)
     print(f"\n🔥 最终方案已保存至: {output_file}")
 
+    # 开了响应缓存 (RAG_RESPONSE_CACHE=1) 时，三个角色共用一个缓存
+    cache_summary = format_cache_stats(architect.client)
+    if cache_summary:
+        print(cache_summary)
+
+
+async def run():
+    try:
+        await main()
+    finally:
+        # 在同一个事件循环里关掉异步连接池
+        await aclose_genai_clients()
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(run())
@@ -2,8 +2,8 @@ from utils.ai_tools import AIToolkit
 import json
 from day04_parseJson_final import ProjectAssistant
 import asyncio
-from google import genai
-import os
+from utils.genai_client import get_genai_client
+from utils.response_cache import with_response_cache
 
 
 class RebuildAssiantant:
@@ -21,7 +21,7 @@ class RebuildAssiantant:
             "repseudocode": "local key = KEYS[1] local stock = redis.call('HGET', key, 'stock') if stock == nil or tonumber(stock) <= 0 then return 0 end local newStock = tonumber(stock) - 1 if newStock < 0 then return 0 end redis.call('HSET', key, 'stock', newStock) return 1"
         }
         """
-        self.client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+        self.client = with_response_cache(get_genai_client())
         self.model_id = "gemini-3-pro-preview"
 
     async def ask(self, message):
@@ -51,7 +51,7 @@ class ReviewAssistant:
             "critiques": ["Lua脚本未处理库存为负数的情况", "缺少分布式锁的过期保护"]
         }
         """
-        self.client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+        self.client = with_response_cache(get_genai_client())
         self.model_id = "gemini-3-pro-preview"
 
     async def ask(self, message):
@@ -3,7 +3,8 @@ import dotenv
 
 dotenv.load_dotenv()
 
-from google import genai
+from utils.genai_client import get_genai_client
+from utils.response_cache import format_cache_stats, with_response_cache
 import os
 import re
 import json
@@ -15,7 +16,7 @@ import asyncio
 class CodeAssistant:
     # name为角色名称，system_instruction角色指令
     def __init__(self, name, system_instruction):
-        self.client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+        self.client = with_response_cache(get_genai_client())
         self.model_id = "gemini-2.0-flash"
         self.name = name
         self.system_instruction = system_instruction
@@ -226,6 +227,11 @@ async def main():
         print("=" * 40)
         print(final_item)
 
+        # 开了响应缓存 (RAG_RESPONSE_CACHE=1) 时，看看这次有多少调用是重复的
+        cache_summary = format_cache_stats(sys_assistant.client)
+        if cache_summary:
+            print(cache_summary)
+
 
 if __name__ == "__main__":
     asyncio.run(main())
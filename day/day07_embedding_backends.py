@@ -0,0 +1,73 @@
+"""
+本地 Embedding 推理后端对比：torch (eager) vs torch-opt (TorchScript) vs onnx-int8 (ONNX Runtime)。
+对每个后端报告：
+    一致性：和 torch 后端的余弦相似度 (最小值 >= 0.99 才算通过)
+    吞吐：每秒 encode 多少条碎片，以及相对 torch 的加速比
+测试文本用 rst/ 里真实的日记和技术文档碎片 (不够时用内置样例补)。
+
+用法：
+    python day07_embedding_backends.py
+    RAG_EMBED_THREADS=16 python day07_embedding_backends.py --backends torch onnx-int8 --limit 2000
+选好后端后，设置环境变量 RAG_EMBED_BACKEND=onnx-int8 即可让索引脚本和搜索工具都用上。
+"""
+import argparse
+import glob
+import os
+
+from utils.chunking import build_chunks
+from utils.embeddings import DEFAULT_MODEL_NAME, get_model
+from utils.inference_backends import (
+    BACKENDS,
+    PARITY_TEXTS,
+    create_encoder,
+    parity_check,
+    throughput,
+)
+
+FILE_KINDS = {"tech": "*.md", "diary": "*.json"}
+
+
+def load_texts(directory: str, limit: int) -> list:
+    """把 rst/ 里的文件按索引时的方式切成碎片，取前 limit 条"""
+    texts = []
+    for kind, pattern in FILE_KINDS.items():
+        for file_path in glob.glob(os.path.join(directory, pattern)):
+            with open(file_path, "r", encoding="utf-8") as f:
+                content = f.read()
+            texts += build_chunks(kind, os.path.basename(file_path), content)["documents"]
+    while len(texts) < limit:
+        texts += PARITY_TEXTS
+    return texts[:limit]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比本地 Embedding 推理后端")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--limit", type=int, default=1000, help="参与吞吐测试的碎片数")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    texts = load_texts("./rst", args.limit)
+    model = get_model(DEFAULT_MODEL_NAME, "cpu")
+    reference = create_encoder(model, DEFAULT_MODEL_NAME, "torch")
+    print(f"📚 测试文本 {len(texts)} 条，模型 {DEFAULT_MODEL_NAME}")
+
+    baseline = None
+    print(f"\n{'后端':<12} | {'最小余弦':<8} | {'平均余弦':<8} | {'docs/sec':>9} | 加速比")
+    print("-" * 60)
+    for backend in args.backends:
+        try:
+            encoder = create_encoder(model, DEFAULT_MODEL_NAME, backend)
+        except Exception as e:
+            print(f"{backend:<12} | ❌ 初始化失败: {e}")
+            continue
+        parity = parity_check(encoder, reference, texts[:200])
+        docs_per_sec = throughput(encoder, texts, args.repeat)
+        if backend == "torch":
+            baseline = docs_per_sec
+        speedup = f"{docs_per_sec / baseline:.2f}x" if baseline else "-"
+        mark = "✅" if parity["passed"] else "⚠️"
+        print(
+            f"{backend:<12} | {parity['min_cosine']:.4f}   | {parity['mean_cosine']:.4f}   | "
+            f"{docs_per_sec:9.1f} | {speedup} {mark}"
+        )
@@ -76,10 +76,11 @@ class CloudEmbeddingService:
 class VectorMath:
     @staticmethod
     def cosine_similarity(vec_a, vec_b):
-        if not vec_a or not vec_b:
+        # 兼容 list 和 numpy 向量 (ndarray 不能直接用 not 判空)
+        if vec_a is None or vec_b is None or len(vec_a) == 0 or len(vec_b) == 0:
             return 0.0
-        a = np.array(vec_a)
-        b = np.array(vec_b)
+        a = np.asarray(vec_a, dtype=np.float32)
+        b = np.asarray(vec_b, dtype=np.float32)
         return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
 
@@ -1,25 +1,11 @@
 import chromadb
-from chromadb import Documents, EmbeddingFunction, Embeddings
-from sentence_transformers import SentenceTransformer
 
-# 1. 初始化本地模型
-print("🤖 正在加载本地语义引擎 (paraphrase-multilingual-MiniLM-L12-v2)...")
-local_model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
+from utils.embeddings import get_embedding_function
+from utils.index_config import get_or_create_collection
+from utils.relevance_gate import calibrate_gate, save_gate
 
-
-class LocalEmbeddingFunction(EmbeddingFunction):
-    """
-    修复版：继承官方基类，并实现 name() 方法
-    """
-
-    def __call__(self, input: Documents) -> Embeddings:
-        # encode 方法默认返回 numpy array，Chroma 需要 list
-        embeddings = local_model.encode(input)
-        return [e.tolist() for e in embeddings]
-
-    def name(self) -> str:
-        # ✅ 关键修复：ChromaDB 需要这个方法来验证模型身份
-        return "local_sentence_transformer_v2"
+# 1. 本地语义引擎 (paraphrase-multilingual-MiniLM-L12-v2)
+# 模型由 utils.embeddings 统一管理，第一次写入/查询时才加载
 
 
 def main():
@@ -28,9 +14,9 @@ def main():
     # 2. 初始化持久化客户端
     client = chromadb.PersistentClient(path="rst/chroma_db")
 
-    # 3. 创建记忆集合
-    collection = client.get_or_create_collection(
-        name="pangdundun_memory", embedding_function=LocalEmbeddingFunction()
+    # 3. 创建记忆集合 (距离空间和 HNSW 参数见 utils/index_config.py)
+    collection = get_or_create_collection(
+        client, "pangdundun_memory", get_embedding_function()
     )
 
     # 4. 准备一些“非结构化”的日记数据
@@ -54,6 +40,11 @@ def main():
     collection.upsert(documents=documents, ids=ids, metadatas=metadatas)
     print(f"✅ 成功存储了 {collection.count()} 条记忆！")
 
+    # 按这批数据校准相关性阈值，和库存在一起 (day09_rag_bot.py 会读)
+    gate = calibrate_gate(collection, samples=collection.count())
+    save_gate("rst/chroma_db", "pangdundun_memory", gate)
+    print(f"🚦 校准后的相关性阈值 ({gate.space}): {gate.threshold:.4f}")
+
     # 5. 见证奇迹时刻：语义搜索
     print("\n🔍 开始意图匹配测试 (RAG 的核心)：")
     print("-" * 50)
@@ -65,9 +56,9 @@ def main():
         "Python编程语言怎么学？",
     ]
 
-    # 设定一个阈值（经过观察，25 以下的才是靠谱的）
-    # 注意：Chroma 默认的 L2 距离是越小越好
-    DISTANCE_THRESHOLD = 25.0
+    # 阈值用刚才校准出来的 (以前是拍脑袋的 L2 距离 25)
+    # 注意：不管 L2 还是 cosine，距离都是越小越好
+    DISTANCE_THRESHOLD = gate.threshold
 
     for q in test_queries:
         print(f"\n❓ 提问: {q}")
@@ -79,7 +70,7 @@ def main():
             distance = results["distances"][0][0]  # 获取距离
 
             # 🛑 核心逻辑：加了这层判断，AI 就不敢乱说了
-            if distance < DISTANCE_THRESHOLD:
+            if distance <= DISTANCE_THRESHOLD:
                 print(f"💡 找到答案 (距离 {distance:.4f}):\n   👉 {found_doc}")
             else:
                 print(
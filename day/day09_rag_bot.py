@@ -1,11 +1,12 @@
 from google import genai
 from google.genai import types
 import chromadb
-from chromadb import EmbeddingFunction, Documents, Embeddings
-from sentence_transformers import SentenceTransformer
 import os
 from dotenv import load_dotenv
 
+from utils.embeddings import get_embedding_function
+from utils.relevance_gate import get_gate
+
 load_dotenv()
 
 # --- 1. 初始化配置 ---
@@ -15,26 +16,15 @@ load_dotenv()
 client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
 
 
-# 初始化本地 Embedding 模型 (复用昨天的逻辑)
-class LocalEmbeddingFunction(EmbeddingFunction):
-    def __init__(self):
-        print("🤖 正在加载本地 Embedding 模型...")
-        self.model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
-
-    def __call__(self, input: Documents) -> Embeddings:
-        embeddings = self.model.encode(input)
-        return [e.tolist() for e in embeddings]
-
-    def name(self):
-        return "local_sentence_transformer_v2"
-
-
 # 连接 ChromaDB
 print("💾 正在连接记忆库...")
 chroma_client = chromadb.PersistentClient(path="rst/chroma_db")
 collection = chroma_client.get_collection(
-    name="pangdundun_memory", embedding_function=LocalEmbeddingFunction()
+    name="pangdundun_memory", embedding_function=get_embedding_function()
 )
+# 相关性闸门：优先用 day08 校准后存进库里的阈值，没校准过就用距离空间的经验值 (L2 30 / cosine 0.5)
+gate = get_gate("rst/chroma_db", "pangdundun_memory", collection)
+NOT_FOUND_ANSWER = "根据现有的资料，我没找到这个问题的答案。"
 
 # --- 2. 定义系统指令 (System Instruction) ---
 # 💡 新版 SDK 的强项：把“人设”和“约束”放在系统层级，权重更高！
@@ -60,20 +50,18 @@ def rag_chat(user_query):
     documents = results["documents"][0]
     distances = results["distances"][0]
 
-    # 简单的阈值过滤 (比如距离 > 30 就不看了，防止噪声)
-    valid_docs = []
-    for doc, dist in zip(documents, distances):
-        if dist < 30:  # 这里的30是经验值，根据不同模型调整
-            valid_docs.append(doc)
+    # 阈值过滤 (距离超过校准阈值的就不看了，防止噪声)
+    valid_docs = [doc for doc, dist in zip(documents, distances) if gate.is_relevant(dist)]
 
     if not valid_docs:
-        print("❌ 没找到相关记忆 (可能是距离太远被过滤了)")
-        context_str = "无"
-    else:
-        print(f"✅ 找到了 {len(valid_docs)} 条有效记忆！")
-        # 把列表拼成一个长字符串
-        context_str = "\n".join(valid_docs)
-        print(f"📖 相关记忆内容如下：\n{context_str}")
+        # 一条相关的都没有：不用再问大模型了，直接本地回答，省一次 LLM 往返
+        print(f"❌ 没找到相关记忆 (最近距离都超过阈值 {gate.threshold:.2f})，跳过 Gemini")
+        return NOT_FOUND_ANSWER
+
+    print(f"✅ 找到了 {len(valid_docs)} 条有效记忆！")
+    # 把列表拼成一个长字符串
+    context_str = "\n".join(valid_docs)
+    print(f"📖 相关记忆内容如下：\n{context_str}")
 
     # --- 4. 组装用户 Prompt ---
     # 这里只放“动态内容”：上下文 + 问题
@@ -1,57 +1,26 @@
 import os
 import glob
 import chromadb
-from chromadb import EmbeddingFunction, Documents, Embeddings
-from sentence_transformers import SentenceTransformer
 
+from utils.embeddings import get_embedding_function
+from utils.index_config import get_or_create_collection
 
-# --- 复用之前的配置 (保持一致) ---
-class LocalEmbeddingFunction(EmbeddingFunction):
-    def __init__(self):
-        self.model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
-
-    def __call__(self, input: Documents) -> Embeddings:
-        embeddings = self.model.encode(input)
-        return [e.tolist() for e in embeddings]
-
-    def name(self):
-        return "local_sentence_transformer_v2"
+# --- 核心逻辑 1: 文本切片器 (Text Splitter) ---
+# 滑动窗口切片，和 day10_02 共用 utils/chunking.py 里的实现
+from utils.chunking import split_text
 
 
 # 连接数据库
 print("💾 连接 ChromaDB...")
 client = chromadb.PersistentClient(path="rst/chroma_db")
 # ⚠️ 注意：我们可以用同一个集合，也可以新建一个专门存技术文档的
-collection = client.get_or_create_collection(
-    name="pangdundun_memory",  # 这里我们继续往同一个脑子里塞知识
-    embedding_function=LocalEmbeddingFunction(),
+collection = get_or_create_collection(
+    client,
+    "pangdundun_memory",  # 这里我们继续往同一个脑子里塞知识
+    get_embedding_function(),
 )
 
 
-# --- 核心逻辑 1: 文本切片器 (Text Splitter) ---
-def split_text(text, chunk_size=300, chunk_overlap=50):
-    """
-    手动实现滑动窗口切片
-    chunk_size: 每个块大约多少字符
-    chunk_overlap: 重叠多少字符 (防止上下文切断)
-    """
-    chunks = []
-    start = 0
-    text_len = len(text)
-
-    while start < text_len:
-        end = start + chunk_size
-        # 截取片段
-        chunk = text[start:end]
-        chunks.append(chunk)
-
-        # 移动窗口 (步长 = 大小 - 重叠)
-        # 这样下一次循环就会回退一点点，包含上一块的尾巴
-        start += chunk_size - chunk_overlap
-
-    return chunks
-
-
 # --- 核心逻辑 2: 读取文件并处理 ---
 def process_markdown_files(directory):
     # 找到目录下所有的 .md 文件
@@ -1,155 +1,352 @@
 import os
 import glob
-import json
+import argparse
 import chromadb
-from chromadb import EmbeddingFunction, Documents, Embeddings
-from sentence_transformers import SentenceTransformer
 
-
-# --- 1. 复用 Embedding 配置 ---
-class LocalEmbeddingFunction(EmbeddingFunction):
-    def __init__(self):
-        # 既然是处理文档，我们用这一款支持多语言的模型，效果比较均衡
-        self.model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
-
-    def __call__(self, input: Documents) -> Embeddings:
-        embeddings = self.model.encode(input)
-        # 列表推导式，把每个 numpy array 转成 list
-        return [e.tolist() for e in embeddings]
-
-    def name(self):
-        return "local_sentence_transformer_v2"
-
-
-# 连接数据库，定义好数据库地址，这里为rst/chroma_db
-print("💾 正在连接记忆库...")
-client = chromadb.PersistentClient(path="rst/chroma_db")
-
-# ⚠️ 注意：为了演示效果，我们这次创建一个全新的集合，叫 "categorized_memory" (分类记忆)，相当于表名
-# 这样不会和之前的混乱数据混在一起
-collection = client.get_or_create_collection(
-    name="categorized_memory", embedding_function=LocalEmbeddingFunction()
+from utils.embeddings import get_embedding_function
+from utils.encode_pool import EncodePool
+from utils.index_config import IndexConfig, get_or_create_collection
+from utils.index_manifest import IndexManifest
+from utils.ingest import BulkIngestor, run_file_pipeline
+from utils.numpy_index import (
+    DEFAULT_INDEX_PATH,
+    NumpyVectorIndex,
+    export_from_chroma,
+    recall_report,
+)
+from utils.lexical_index import DEFAULT_LEXICAL_INDEX_PATH, get_lexical_index
+from utils.partitions import delete_partitions, open_partitioned_collection
+from utils.relevance_gate import calibrate_gate, save_gate
+from utils.chunking import (
+    STREAMING_CHUNKERS,
+    TOKEN_STREAMING_CHUNKERS,
+    build_chunks,
+    truncation_report,
 )
 
 
-# --- 2. 核心工具：切片器 ---
-"""
-text: 待切片的文本
-chunk_size: 每个切片的最大长度，默认300字符
-chunk_overlap: 切片之间重叠的部分，保证上下文连贯，默认50字符
-"""
-
-
-def split_text(text, chunk_size=300, chunk_overlap=50) -> list:
-    """滑动窗口切片：保证上下文连贯"""
-    chunks = []
-    # 游标位置
-    start = 0
-    # 切片文本长度
-    text_len = len(text)
-
-    # 当游标没到文本末尾时，循环持续切片
-    while start < text_len:
-        # 切片结束位置
-        end = start + chunk_size
-        # 切片文本，取游标到结束位置之间的内容
-        chunk = text[start:end]
-        # 加入集合
-        chunks.append(chunk)
-        # 步长 = 窗口大小 - 重叠部分
-        start += chunk_size - chunk_overlap
-    return chunks
-
-
-# --- 3. 处理不同类型的文件 ---
-# 处理*.md 技术文档，打上 category: tech 标签
-def process_tech_docs(directory) -> None:
-    """处理技术文档 (.md) -> 打上 category: tech"""
-    files = glob.glob(os.path.join(directory, "*.md"))
-    print(f"\n📘 发现 {len(files)} 个技术文档")
-
-    for file_path in files:
-        filename = os.path.basename(file_path)
-        with open(file_path, "r", encoding="utf-8") as f:
-            content = f.read()
-
-        # 切片，每片400字符，重叠50字符
-        chunks = split_text(content, chunk_size=400, chunk_overlap=50)
-
-        # 准备入库数据
-        ids = [f"tech_{filename}_{i}" for i in range(len(chunks))]
-
-        # 🔥 关键步骤：打标签！
-        # 我们明确指定这是 "tech" 类，作者是 "赵一清"
-        # 列表推导式生成 metadatas
-        metadatas = [
-            {
-                "category": "tech",
-                "author": "赵一清",
-                "source": filename,
-                "chunk_index": i,
-            }
-            for i in range(len(chunks))
-        ]
-
-        print(f"   ↳ 正在存入 '{filename}': {len(chunks)} 个碎片 (Tag: tech)")
-        # 入库，每次读到.md 文件就存一批
-        collection.upsert(ids=ids, documents=chunks, metadatas=metadatas)
-
-
-# 处理*.json 日记文件，打上 category: diary 标签
-def process_diary_logs(directory):
-    """处理日记文件 (.json) -> 打上 category: diary"""
-    files = glob.glob(os.path.join(directory, "*.json"))
-    print(f"\nCb 发现 {len(files)} 个日记文件")
-
-    for file_path in files:
+# --- 1. 连接数据库 ---
+# ⚠️ 放进函数里而不是模块顶层：多进程 spawn 模式下子进程会重新 import 本文件，
+# 顶层代码会在每个解析进程里再连一次库、再加载一次模型
+def open_collection(index_config=None, rebuild=False, partitioned=False):
+    # 连接数据库，定义好数据库地址，这里为rst/chroma_db
+    print("💾 正在连接记忆库...")
+    client = chromadb.PersistentClient(path="rst/chroma_db")
+    if rebuild or partitioned:
+        # 距离空间 / M / construction_ef 只能在建集合时指定，换配置得删掉重建
+        # 分区模式下单集合用不上了，也删掉 (切换布局时清单配置会变，所有文件都会重新入库)
+        try:
+            client.delete_collection("categorized_memory")
+            print("🗑️ 已删除旧的单集合" + ("，改为按分类分区" if partitioned else "，按新索引配置重建"))
+        except Exception:
+            pass  # 集合本来就不存在
+    if rebuild or not partitioned:
+        for name in delete_partitions(client, "categorized_memory"):
+            print(f"🗑️ 已删除旧分区 {name}")
+
+    # 索引时挂上磁盘缓存：没改过的碎片直接复用上次的向量，不用重新 encode
+    embedding_fn = get_embedding_function(cache_path="rst/embedding_cache.sqlite3")
+
+    # ⚠️ 注意：为了演示效果，我们这次创建一个全新的集合，叫 "categorized_memory" (分类记忆)，相当于表名
+    # 这样不会和之前的混乱数据混在一起
+    # 距离空间和 HNSW 参数由 IndexConfig 决定 (默认读 RAG_HNSW_* 环境变量)
+    if partitioned:
+        # 每个分类一个物理集合 (categorized_memory__diary / __tech)，新分类写入时自动建分区
+        collection = open_partitioned_collection(
+            client, "categorized_memory", embedding_fn, index_config, create=True
+        )
+    else:
+        collection = get_or_create_collection(
+            client, "categorized_memory", embedding_fn, index_config
+        )
+    return collection, embedding_fn
+
+
+# --- 2. 找出需要处理的文件 ---
+# 切片器和 .md / .json 的解析逻辑在 utils/chunking.py 里 (纯函数，能在子进程里跑)
+# 文件类型 -> glob 模式：*.md 技术文档打 tech 标签，*.json 日记打 diary 标签
+FILE_KINDS = {"tech": "*.md", "diary": "*.json"}
+
+
+def find_changed_files(directory, manifest) -> list:
+    """扫描目录，跳过内容没变的文件，返回 [(file_path, kind), ...]"""
+    tasks = []
+    for kind, pattern in FILE_KINDS.items():
+        files = glob.glob(os.path.join(directory, pattern))
+        changed = [f for f in files if not manifest.is_unchanged(f)]
+        print(f"\n📂 [{kind}] 发现 {len(files)} 个文件，其中 {len(changed)} 个有变化")
+        tasks += [(f, kind) for f in changed]
+    return tasks
+
+
+# --- 3. 单一写入方：把解析结果交给批量入库器 ---
+def make_writer(manifest, ingestor, stale_ids):
+    """生成 run_file_pipeline 的回调，只在主线程里执行"""
+    # 大文件会分好几批送过来，先攒着每个文件的 id，文件收尾时再更新清单
+    pending_ids = {}
+
+    def on_result(file_path, kind, result, error):
         filename = os.path.basename(file_path)
-        with open(file_path, "r", encoding="utf-8") as f:
-            try:
-                data = json.load(f)  # 假设是 list of dict
-                # 判断是列表还是字典，如果是[]就继续，同理，{}是dict
-                if not isinstance(data, list):
-                    print(f"   ⚠️ 跳过 {filename}: 格式不是列表")
-                    continue
-            except:
-                print(f"   ⚠️ 跳过 {filename}: JSON 解析失败")
-                continue
-
-        chunks = []
-        ids = []
-        metadatas = []
-
-        # 同时获取角标和对象的写法，从0开始，entry是个dict对象，直接可以get字段
-        for i, entry in enumerate(data):
-            # 把 JSON 对象转成这种易读的字符串
-            # 假设 entry 长这样: {"timestamp": "...", "event": "..."}
-            text_chunk = f"时间: {entry.get('timestamp', '未知')}\n事件: {entry.get('event', str(entry))}"
-
-            chunks.append(text_chunk)
-            ids.append(f"diary_{filename}_{i}")
-
-            # 🔥 关键步骤：打标签！
-            # 明确这是 "diary" 类，主角是 "胖墩墩"
-            metadatas.append(
-                {"category": "diary", "subject": "胖墩墩", "source": filename}
-            )
-
-        if chunks:
-            print(f"   ↳ 正在存入 '{filename}': {len(chunks)} 条记录 (Tag: diary)")
-            collection.upsert(ids=ids, documents=chunks, metadatas=metadatas)
+        if error is not None:
+            # 读文件出错：清单不更新，下次再试
+            pending_ids.pop(file_path, None)
+            print(f"   ❌ 处理 {filename} 出错: {error}")
+            return
+
+        file_ids = pending_ids.setdefault(file_path, [])
+        if result["skip"]:
+            print(f"   ⚠️ 跳过 {filename}: {result['skip']}")
+        elif result["ids"]:
+            print(f"   ↳ 正在存入 '{filename}': {len(result['ids'])} 个碎片 (Tag: {kind})")
+            # 交给批量入库器：跨文件攒成大批再统一 encode + upsert
+            ingestor.add(result["ids"], result["documents"], result["metadatas"])
+            file_ids.extend(result["ids"])
+
+        if not result["partial"]:
+            # 文件变短 / 变成无效格式时，多出来的旧碎片 id 记下来，最后统一删
+            stale_ids.extend(manifest.update(file_path, pending_ids.pop(file_path)))
+
+    return on_result
+
+
+# --- 4. 截断报告：看看有多少 token 在 encode 时被模型窗口截掉了 ---
+def report_truncation(directory, streaming_chunkers) -> dict:
+    """用当前的切片方式切一遍所有文件 (不写库)，统计被截掉的 token"""
+
+    def iter_documents():
+        for kind, pattern in FILE_KINDS.items():
+            for file_path in glob.glob(os.path.join(directory, pattern)):
+                if kind in streaming_chunkers:
+                    for piece in streaming_chunkers[kind](file_path):
+                        yield from piece["documents"]
+                else:
+                    with open(file_path, "r", encoding="utf-8") as f:
+                        content = f.read()
+                    result = build_chunks(kind, os.path.basename(file_path), content)
+                    yield from result["documents"]
+
+    return truncation_report(iter_documents())
 
 
 # --- 运行主程序 ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="增量重建 categorized_memory 索引")
+    parser.add_argument(
+        "--batch-size", type=int, default=512, help="每批 encode + upsert 的碎片数"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="读文件线程数 / 解析切片进程数，1 表示单线程顺序处理",
+    )
+    parser.add_argument(
+        "--encode-workers",
+        type=int,
+        default=0,
+        help="encode 进程数 (每个进程加载一份模型)，0 表示在主进程里 encode；全量重建大库时建议设成核数 / 4",
+    )
+    parser.add_argument(
+        "--chunking",
+        choices=["chars", "tokens"],
+        default="chars",
+        help="chars: 按字符滑动窗口切; tokens: 按模型 tokenizer 长度 + 句子边界切",
+    )
+    parser.add_argument(
+        "--export-numpy",
+        action="store_true",
+        help=f"索引完成后把集合导出成 NumPy 内存索引 ({DEFAULT_INDEX_PATH})，供 RAG_BACKEND=numpy 使用",
+    )
+    parser.add_argument(
+        "--quantization-report",
+        action="store_true",
+        help="对比 NumPy 索引 int8 / binary 量化检索和精确检索的 recall@k 与常驻内存 (需先 --export-numpy)",
+    )
+    parser.add_argument(
+        "--calibrate-gate",
+        action="store_true",
+        help="索引完成后重新校准检索置信度闸门 (相关性阈值)，和索引存在一起",
+    )
+    parser.add_argument(
+        "--truncation-report",
+        action="store_true",
+        help="只统计当前切片方式下有多少 token 会被模型窗口截掉，不写库",
+    )
+    parser.add_argument(
+        "--space",
+        choices=["l2", "cosine"],
+        help="新建集合的距离空间 (默认读 RAG_HNSW_SPACE，未设置为 l2)",
+    )
+    parser.add_argument("--hnsw-m", type=int, help="HNSW 每个节点的邻居数 M")
+    parser.add_argument("--construction-ef", type=int, help="HNSW 建索引时的 ef")
+    parser.add_argument("--search-ef", type=int, help="HNSW 查询时的 ef")
+    parser.add_argument(
+        "--partition",
+        action="store_true",
+        help="每个分类 (diary / tech) 单独建一个集合，按分类过滤的查询只查对应分区；不加则用单集合",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="删掉集合按新的索引配置全量重建 (改 --space / --hnsw-m / --construction-ef 后需要)",
+    )
+    args = parser.parse_args()
+
     target_dir = "./rst"  # 你的文件都在这里
+    streaming_chunkers = (
+        TOKEN_STREAMING_CHUNKERS if args.chunking == "tokens" else STREAMING_CHUNKERS
+    )
+
+    if args.truncation_report:
+        report = report_truncation(target_dir, streaming_chunkers)
+        print(
+            f"\n✂️ [{args.chunking}] 共 {report['chunks']} 个碎片 / {report['tokens']} 个 token，"
+            f"其中 {report['truncated_chunks']} 个碎片超出模型窗口，"
+            f"浪费 {report['wasted_tokens']} 个 token ({report['wasted_ratio']:.1%})"
+        )
+        raise SystemExit(0)
+
+    # 命令行参数覆盖环境变量里的索引配置
+    overrides = {
+        "space": args.space,
+        "M": args.hnsw_m,
+        "construction_ef": args.construction_ef,
+        "search_ef": args.search_ef,
+    }
+    index_config = IndexConfig.from_env(
+        **{k: v for k, v in overrides.items() if v is not None}
+    )
+    collection, embedding_fn = open_collection(
+        index_config, rebuild=args.rebuild, partitioned=args.partition
+    )
 
     # 1. 清空旧数据 (为了演示纯净的效果)
     # collection.delete(where={}) # 如果你想追加而不是覆盖，就把这行注释掉
 
-    # 2. 分类处理
-    process_tech_docs(target_dir)
-    process_diary_logs(target_dir)
+    # 2. 分类处理 (增量：只处理新增/修改过的文件；读文件、切片并行，写库串行)
+    # 切片方式也记进清单：换了切法，所有文件都得重切
+    # lexical 也记进去：第一次启用关键词索引时，老文件也要全部重切一遍才能补进倒排索引
+    # 分区布局也记进去 (只在开启时记，老的单集合清单不受影响)：切换布局时所有文件都要重新入库
+    manifest_config = {"chunking": args.chunking, "lexical": True}
+    if args.partition:
+        manifest_config["partitioned"] = True
+    manifest = IndexManifest(config=manifest_config)
+    if args.rebuild:
+        manifest.files = {}  # 集合是新建的，所有文件都要重新入库
+    # 关键词倒排索引 (BM25)，和向量库同步写入、同步删除
+    lexical_index = get_lexical_index(DEFAULT_LEXICAL_INDEX_PATH, create=True)
+    if args.rebuild or collection.count() == 0:
+        # 向量集合是新建的 (--rebuild / 切换分区布局)：倒排索引也从头建。
+        # 清单已清空，forget_missing 看不到以前删掉的文件，旧碎片只能在这里一起清掉
+        if lexical_index.count():
+            print(f"🗑️ 已清空关键词索引 ({lexical_index.count()} 条旧碎片)")
+        lexical_index.clear()
+    stale_ids = []
+    tasks = find_changed_files(target_dir, manifest)
+
+    # 可选：多进程 encode 池 (缓存没命中的碎片按片分给各个进程，结果按原顺序拼回)
+    pool = None
+    batch_size = args.batch_size
+    if args.encode_workers > 1 and tasks:
+        pool = EncodePool(
+            args.encode_workers,
+            model_name=embedding_fn.model_name,
+            normalize=embedding_fn.normalize,
+            backend=embedding_fn.backend,
+        )
+        embedding_fn.use_pool(pool)
+        # 每批至少让每个进程分到 128 条，否则进程间通信的开销占大头
+        batch_size = max(batch_size, args.encode_workers * 128)
+
+    ingestor = BulkIngestor(
+        collection, embedding_fn, batch_size=batch_size, lexical_index=lexical_index
+    )
+    failed = True
+    try:
+        run_file_pipeline(
+            tasks,
+            make_writer(manifest, ingestor, stale_ids),
+            workers=args.workers,
+            streaming_chunkers=streaming_chunkers,
+        )
+        ingestor.flush()
+        failed = False
+    finally:
+        if pool is not None:
+            # 正常结束时等所有片跑完再关；出错 / Ctrl+C 时丢掉排队中的片，尽快退出
+            embedding_fn.use_pool(None)
+            pool.close(cancel=failed)
+
+    # 3. 已删除文件留下的碎片 + 文件变短多出来的碎片，一次性批量删除
+    current_files = [
+        f
+        for pattern in FILE_KINDS.values()
+        for f in glob.glob(os.path.join(target_dir, pattern))
+    ]
+    stale_ids += manifest.forget_missing(current_files)
+    if stale_ids:
+        print(f"\n🧹 正在删除 {len(stale_ids)} 个过期碎片...")
+        collection.delete(ids=stale_ids)
+        lexical_index.delete(stale_ids)
+    manifest.save()
+
+    # 4. 可选：导出 NumPy 索引 (vectors.npy + meta.json)
+    if args.export_numpy:
+        exported = export_from_chroma(collection, DEFAULT_INDEX_PATH)
+        print(f"\n🧮 已导出 {exported} 条向量到 NumPy 索引: {DEFAULT_INDEX_PATH}")
+
+    # 5. 可选：校准检索置信度闸门 (低于阈值的问题直接本地回答“没找到”，不调 Gemini)
+    if args.calibrate_gate:
+        targets = [("rst/chroma_db", "categorized_memory", collection)]
+        if os.path.exists(os.path.join(DEFAULT_INDEX_PATH, "meta.json")):
+            targets.append(
+                (
+                    DEFAULT_INDEX_PATH,
+                    "numpy_index",
+                    NumpyVectorIndex.load(DEFAULT_INDEX_PATH, embedding_fn),
+                )
+            )
+        for index_dir, name, target in targets:
+            gate = calibrate_gate(target)
+            path = save_gate(index_dir, name, gate)
+            print(
+                f"\n🚦 [{name}] 相关性阈值 ({gate.space}) = {gate.threshold:.4f}，"
+                f"命中率 {gate.stats['tpr']:.1%}，误放率 {gate.stats['fpr']:.1%} → {path}"
+            )
+
+    # 6. 可选：量化检索的召回率 / 内存报告
+    if args.quantization_report:
+        if not os.path.exists(os.path.join(DEFAULT_INDEX_PATH, "meta.json")):
+            print(
+                f"\n⚠️ 还没有 NumPy 索引 ({DEFAULT_INDEX_PATH})，跳过量化报告；"
+                f"请加上 --export-numpy 一起运行"
+            )
+        else:
+            print("\n📏 量化检索 recall@3 (以精确检索为基准):")
+            for mode, row in recall_report(DEFAULT_INDEX_PATH, embedding_fn).items():
+                print(
+                    f"   {mode:>6}: recall {row['recall']:.1%}, "
+                    f"常驻 {row['resident_bytes'] / 1024:.0f} KB ({row['compression']:.0f}x 压缩), "
+                    f"{row['avg_ms']:.2f} ms/查询"
+                )
 
     print("\n✅ 索引重建完成！数据已打上 Metadata 标签。")
+    print(f"🔤 关键词索引: {lexical_index.count()} 条碎片 ({DEFAULT_LEXICAL_INDEX_PATH})")
+    report = ingestor.report()
+    print(
+        f"⚡ 共写入 {report['docs']} 条碎片 / {report['batches']} 批, "
+        f"耗时 {report['seconds']:.2f}s (encode {report['encode_seconds']:.2f}s, "
+        f"upsert {report['upsert_seconds']:.2f}s), {report['docs_per_sec']:.1f} docs/sec"
+    )
+    if pool is not None:
+        pool_report = pool.report()
+        print(
+            f"🏭 encode 池: {pool_report['workers']} 个进程 / {pool_report['shards']} 片, "
+            f"{pool_report['docs_per_sec']:.1f} docs/sec"
+        )
+    stats = embedding_fn.cache.stats()
+    print(
+        f"🗄️ Embedding 缓存: 命中 {stats['hits']} / 未命中 {stats['misses']} "
+        f"(命中率 {stats['hit_ratio']:.1%}, 共 {stats['size']} 条)"
+    )
     print("现在 Gemini 不会再把胖墩墩当成架构师了！🐶")
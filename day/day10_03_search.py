@@ -1,12 +1,12 @@
 import chromadb
 
-# 引入上面的 Embedding 类 (为了省事，实际项目中应该单独放一个文件)
-from day10_02_indexer import LocalEmbeddingFunction
+# Embedding 函数统一从 utils.embeddings 获取，和索引时用的是同一个模型
+from utils.embeddings import get_embedding_function
+from utils.partitions import open_collection
 
 client = chromadb.PersistentClient(path="rst/chroma_db")
-collection = client.get_collection(
-    name="categorized_memory", embedding_function=LocalEmbeddingFunction()
-)
+# 单集合 / 按分类分区 (day10_02_indexer.py --partition) 两种布局都能打开，用法一样
+collection = open_collection(client, "categorized_memory", get_embedding_function())
 
 
 def ask_with_filter(question, category_filter):
@@ -0,0 +1,159 @@
+"""
+HNSW 调参：在真实的 rst/ 语料上扫一遍 距离空间 × M × construction_ef × search_ef，
+对每组参数报告 建索引耗时 / 索引大小 / 查询延迟 p50、p99 / 相对暴力检索的 recall@k。
+
+向量直接从 day10_02_indexer.py 建好的 categorized_memory 集合里读 (不用重新 encode)，
+每组 (space, M, construction_ef) 在临时目录里建一个新集合；search_ef 建好后可以在线改，
+所以同一个索引上依次试多个 search_ef。
+
+用法：
+    python day10_04_hnsw_tuning.py
+    python day10_04_hnsw_tuning.py --spaces l2 cosine --M 8 16 32 --search-ef 10 50 100 --json rst/hnsw_tuning.report
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+
+from utils.index_config import IndexConfig
+from utils.numpy_index import exact_top_k
+from utils.partitions import open_collection
+
+
+def load_corpus(db_path="rst/chroma_db", name="categorized_memory", page_size=5000):
+    """分页读出集合里所有碎片的 id 和向量 (分区布局时按分区顺序读出全部分区)"""
+    client = chromadb.PersistentClient(path=db_path)
+    collection = open_collection(client, name)
+    ids, vectors = [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        ids += page["ids"]
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        offset += len(page["ids"])
+    if not ids:
+        raise SystemExit(f"❌ 集合 {name} 是空的，先运行 day10_02_indexer.py")
+    return ids, np.vstack(vectors)
+
+
+def dir_size(path) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, f))
+        for root, _, files in os.walk(path)
+        for f in files
+    )
+
+
+def build_index(path, config, ids, vectors, batch_size=1000):
+    """在临时目录里按 config 建集合并写入全部向量，返回 (集合, 建索引耗时)"""
+    client = chromadb.PersistentClient(path=path)
+    collection = client.create_collection(
+        name="tuning", configuration=config.to_chroma(), embedding_function=None
+    )
+    start = time.perf_counter()
+    for i in range(0, len(ids), batch_size):
+        collection.add(ids=ids[i : i + batch_size], embeddings=vectors[i : i + batch_size])
+    return collection, time.perf_counter() - start
+
+
+def measure(collection, ids, queries, truth, k):
+    """逐条查询，统计延迟分位数和 recall@k"""
+    id_to_row = {doc_id: row for row, doc_id in enumerate(ids)}
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        found = collection.query(query_embeddings=query[None, :], n_results=k)["ids"][0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len({id_to_row[i] for i in found} & expected)
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "recall": hits / (k * len(queries)),
+    }
+
+
+def sweep(args):
+    ids, vectors = load_corpus()
+    rng = np.random.default_rng(args.seed)
+    rows = rng.choice(len(ids), min(args.queries, len(ids)), replace=False)
+    # 用库里的碎片加一点噪声当查询，避免查询向量和库里某条完全重合
+    queries = vectors[rows] + rng.normal(0, args.noise, vectors[rows].shape).astype(
+        np.float32
+    )
+    k = min(args.k, len(ids))
+    print(f"📚 语料 {len(ids)} 条碎片 × {vectors.shape[1]} 维，{len(queries)} 个查询，k={k}")
+
+    results = []
+    for space in args.spaces:
+        truth = [set(rows) for rows in exact_top_k(vectors, queries, k, space)]
+        for m in args.M:
+            for construction_ef in args.construction_ef:
+                config = IndexConfig(
+                    space=space, M=m, construction_ef=construction_ef
+                )
+                workdir = tempfile.mkdtemp(prefix="hnsw_tuning_")
+                try:
+                    collection, build_seconds = build_index(workdir, config, ids, vectors)
+                    size = dir_size(workdir)
+                    for search_ef in args.search_ef:
+                        collection.modify(
+                            configuration={"hnsw": {"ef_search": search_ef}}
+                        )
+                        row = {
+                            "space": space,
+                            "M": m,
+                            "construction_ef": construction_ef,
+                            "search_ef": search_ef,
+                            "build_seconds": build_seconds,
+                            "index_bytes": size,
+                            **measure(collection, ids, queries, truth, k),
+                        }
+                        results.append(row)
+                        print(
+                            f"   {space:>6} M={m:<3} c_ef={construction_ef:<4} s_ef={search_ef:<4} "
+                            f"建索引 {build_seconds:6.2f}s  大小 {size / 1024 / 1024:6.1f} MB  "
+                            f"p50 {row['p50_ms']:6.2f}ms  p99 {row['p99_ms']:6.2f}ms  "
+                            f"recall@{k} {row['recall']:.1%}"
+                        )
+                finally:
+                    shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HNSW 参数扫描 (召回率 vs 延迟)")
+    parser.add_argument("--spaces", nargs="+", default=["l2", "cosine"])
+    parser.add_argument("--M", nargs="+", type=int, default=[8, 16, 32])
+    parser.add_argument("--construction-ef", nargs="+", type=int, default=[100, 200])
+    parser.add_argument("--search-ef", nargs="+", type=int, default=[10, 50, 100, 200])
+    parser.add_argument("--queries", type=int, default=200, help="测试查询条数")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.05, help="查询向量的噪声标准差")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="把结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    results = sweep(args)
+
+    # 每个距离空间下，召回率 >= 95% 里延迟最低的一组
+    for space in args.spaces:
+        good = [r for r in results if r["space"] == space and r["recall"] >= 0.95]
+        if good:
+            best = min(good, key=lambda r: r["p50_ms"])
+            print(
+                f"\n🏆 [{space}] recall >= 95% 时最快: M={best['M']}, "
+                f"construction_ef={best['construction_ef']}, search_ef={best['search_ef']} "
+                f"(p50 {best['p50_ms']:.2f}ms, recall {best['recall']:.1%})"
+            )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 结果已保存到 {args.json}")
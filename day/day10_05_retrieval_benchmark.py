@@ -0,0 +1,373 @@
+"""
+检索基准测试：在 1k / 10k / 100k / 1M 条合成碎片上跑真实的检索代码，输出机器可读的 JSON，
+方便每次发版前对比有没有性能回退。
+
+合成语料的形状和 day10_02_indexer.py 入库的一模一样：
+    日记：一条条 {"timestamp", "event"} 交给 build_diary_chunks 切
+    技术文档：拼成 Markdown 交给 build_tech_chunks 切
+入库走 BulkIngestor (真实的批量 encode + upsert)，NumPy 索引用 export_from_chroma 导出。
+检索路径：
+    search_knowledge_base: 不过滤，和 utils/ai_tools.py 里一样调用 hybrid_query
+    query_rag_system: 按分类过滤 (where={"category": ...})，和 day11_01_rag.py 里一样
+后端 chroma-partitioned 是 day10_02_indexer.py --partition 的布局：每个分类一个集合 (向量从单集合复制过去)，
+按分类过滤的查询只查对应分区，对比 chroma 看后过滤的开销。
+每个 (规模, 后端, 路径) 报告：
+    查询 encode 耗时、向量检索耗时、端到端延迟 p50/p95/p99、N 个线程并发时的 QPS、
+    以及相对 NumPy 精确检索的 recall@k
+
+用法：
+    python day10_05_retrieval_benchmark.py --sizes 1000 10000
+    python day10_05_retrieval_benchmark.py --sizes 100000 1000000 --embedder hash --threads 1 4 8
+--embedder hash 用文本哈希出来的伪向量代替模型 (百万级语料用模型 encode 要跑好几个小时)，
+此时 encode 耗时没有参考意义，但检索耗时、QPS、recall 仍然有效。
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import chromadb
+import numpy as np
+from chromadb import EmbeddingFunction
+
+from utils.chunking import build_diary_chunks, build_tech_chunks
+from utils.embeddings import get_embedding_function
+from utils.index_config import get_or_create_collection
+from utils.ingest import BulkIngestor
+from utils.lexical_index import LexicalIndex, hybrid_query, tokenize
+from utils.numpy_index import NumpyIndexHandle, NumpyVectorIndex, export_from_chroma
+from utils.partitions import open_partitioned_collection
+from utils.vector_store import CollectionHandle
+
+COLLECTION_NAME = "categorized_memory"
+BACKENDS = ("chroma", "chroma-partitioned", "numpy", "numpy-int8", "numpy-binary")
+PATHS = {
+    # 路径名 -> 怎么从查询对应的分类得到 where 条件
+    "search_knowledge_base": lambda category: None,
+    "query_rag_system": lambda category: {"category": category},
+}
+
+# --- 1. 合成语料 ---
+SUBJECTS = ["胖墩墩", "赵一清", "小黑", "邻居家的柯基", "宝"]
+ACTIONS = ["去公园散步", "接飞盘", "洗澡", "打疫苗", "吃鸡胸肉", "在草地上打滚", "拆快递", "看医生", "学坐下", "晒太阳"]
+PLACES = ["小区楼下", "宠物医院", "滨江公园", "家里客厅", "常州老家", "咖啡店门口"]
+MOODS = ["特别开心", "有点害怕", "很累", "兴奋得转圈", "不太情愿", "一直摇尾巴"]
+TOPICS = ["Redis", "ChromaDB", "RAG", "Python 多进程", "FastAPI", "向量检索", "Gemini API", "Streamlit", "SQLite", "HNSW"]
+ASPECTS = ["连接池", "缓存失效", "批量写入", "超时重试", "索引重建", "并发安全", "内存占用", "日志排查"]
+FINDINGS = [
+    "需要在启动时预热，否则第一次请求很慢",
+    "批量大小设成 512 时吞吐最高",
+    "锁的粒度太粗会导致排队",
+    "最好按长度排序以减少 padding",
+    "版本号变化时要清空旧缓存",
+    "量化之后召回率几乎不变",
+]
+
+
+def _diary_entry(rng, i):
+    return {
+        "timestamp": f"2026-{rng.integers(1, 13):02d}-{rng.integers(1, 29):02d} {rng.integers(0, 24):02d}:{rng.integers(0, 60):02d}",
+        "event": f"{rng.choice(SUBJECTS)}在{rng.choice(PLACES)}{rng.choice(ACTIONS)}，{rng.choice(MOODS)}。(记录 {i})",
+    }
+
+
+def _tech_paragraph(rng, i):
+    topic, aspect = rng.choice(TOPICS), rng.choice(ASPECTS)
+    return (
+        f"## {topic} 的{aspect} ({i})\n"
+        f"在项目里用 {topic} 处理{aspect}时，{rng.choice(FINDINGS)}。"
+        f"另外{rng.choice(FINDINGS)}，排查时先看{rng.choice(ASPECTS)}。\n"
+    )
+
+
+def generate_corpus(size: int, seed: int = 0) -> dict:
+    """生成大约 size 条碎片 (一半日记、一半技术文档)，用真实的切片函数切"""
+    rng = np.random.default_rng(seed)
+    corpus = {"ids": [], "documents": [], "metadatas": []}
+
+    def extend(result):
+        for key in corpus:
+            corpus[key] += result[key]
+
+    file_no = 0
+    # 日记：每个文件 50 条记录，每条记录一个碎片
+    while len(corpus["ids"]) < size // 2:
+        entries = [_diary_entry(rng, f"{file_no}-{i}") for i in range(50)]
+        extend(build_diary_chunks(f"dog_life_log_{file_no:07d}.json", json.dumps(entries)))
+        file_no += 1
+    # 技术文档：每个文件 40 段，按 400 字 / 50 字重叠滑窗切
+    while len(corpus["ids"]) < size:
+        content = "".join(_tech_paragraph(rng, f"{file_no}-{i}") for i in range(40))
+        extend(build_tech_chunks(f"design_{file_no:07d}.md", content))
+        file_no += 1
+    for key in corpus:
+        del corpus[key][size:]
+    return corpus
+
+
+def generate_queries(corpus: dict, n: int, seed: int = 0) -> list:
+    """从语料里抽碎片截一段当问题，返回 [(问题, 分类), ...]"""
+    rng = np.random.default_rng(seed + 1)
+    queries = []
+    for row in rng.choice(len(corpus["ids"]), n, replace=len(corpus["ids"]) < n):
+        # 取碎片里最长的一行 (跳过 "时间: ..." 和被切断的标题)
+        text = max(corpus["documents"][row].split("\n"), key=len)
+        start = int(rng.integers(0, max(len(text) - 12, 1)))
+        queries.append((text[start : start + 12], corpus["metadatas"][row]["category"]))
+    return queries
+
+
+class HashEmbeddingFunction(EmbeddingFunction):
+    """
+    不加载模型的伪向量：每个词 (utils.lexical_index.tokenize 切出来的) 对应一个固定的随机向量，
+    一段文本的向量是前 16 个词向量之和再归一化。用词相近的文本向量也相近，百万级语料几分钟就能 encode 完。
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self._terms = {}
+
+    def _term_vector(self, term):
+        vector = self._terms.get(term)
+        if vector is None:
+            rng = np.random.default_rng(zlib.crc32(term.encode("utf-8")))
+            vector = self._terms[term] = rng.standard_normal(self.dim).astype(np.float32)
+        return vector
+
+    def __call__(self, input):
+        matrix = np.zeros((len(input), self.dim), dtype=np.float32)
+        for row, text in enumerate(input):
+            for term in tokenize(text)[:16]:
+                matrix[row] += self._term_vector(term)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    @staticmethod
+    def name() -> str:
+        return "benchmark_hash_embedding"
+
+
+# --- 2. 建库 ---
+def copy_to_partitions(collection, db_path, embedding_fn, page_size=5000) -> None:
+    """把单集合里的向量原样复制成按分类分区的库 (不重新 encode)"""
+    client = chromadb.PersistentClient(path=db_path)
+    partitioned = open_partitioned_collection(
+        client, COLLECTION_NAME, embedding_fn, create=True
+    )
+    offset = 0
+    while True:
+        page = collection.get(
+            include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset
+        )
+        if not page["ids"]:
+            break
+        partitioned.upsert(
+            ids=page["ids"],
+            documents=page["documents"],
+            metadatas=page["metadatas"],
+            embeddings=page["embeddings"],
+        )
+        offset += len(page["ids"])
+
+
+def build_stores(workdir, corpus, embedding_fn, backends, hybrid, batch_size):
+    """入库 Chroma (+ 可选的倒排索引)，再导出 NumPy 索引；返回 (句柄表, 倒排索引, 建库统计)"""
+    db_path = os.path.join(workdir, "chroma_db")
+    numpy_path = os.path.join(workdir, "numpy_index")
+    partitioned_path = os.path.join(workdir, "chroma_partitioned")
+    client = chromadb.PersistentClient(path=db_path)
+    collection = get_or_create_collection(client, COLLECTION_NAME, embedding_fn)
+    lexical_index = LexicalIndex(os.path.join(workdir, "lexical.sqlite3")) if hybrid else None
+
+    ingestor = BulkIngestor(collection, embedding_fn, batch_size, lexical_index)
+    ingestor.add(corpus["ids"], corpus["documents"], corpus["metadatas"])
+    ingestor.flush()
+    build = ingestor.report()
+
+    start = time.perf_counter()
+    export_from_chroma(collection, numpy_path)
+    build["numpy_export_seconds"] = time.perf_counter() - start
+    if "chroma-partitioned" in backends:
+        start = time.perf_counter()
+        copy_to_partitions(collection, partitioned_path, embedding_fn)
+        build["partition_copy_seconds"] = time.perf_counter() - start
+    client.clear_system_cache()
+
+    handles = {}
+    for backend in backends:
+        if backend == "chroma":
+            handles[backend] = CollectionHandle(db_path, COLLECTION_NAME, embedding_fn)
+        elif backend == "chroma-partitioned":
+            # 同一个句柄类：库里有分区就自动走分区路由
+            handles[backend] = CollectionHandle(partitioned_path, COLLECTION_NAME, embedding_fn)
+        else:
+            quantization = backend.split("-")[1] if "-" in backend else "none"
+            handles[backend] = NumpyIndexHandle(
+                numpy_path, embedding_fn, quantization=quantization
+            )
+    exact = NumpyVectorIndex.load(numpy_path, embedding_fn)
+    return handles, lexical_index, exact, build
+
+
+# --- 3. 测量 ---
+def percentiles(samples_ms) -> dict:
+    samples = np.asarray(samples_ms)
+    return {
+        "mean": float(samples.mean()),
+        "p50": float(np.percentile(samples, 50)),
+        "p95": float(np.percentile(samples, 95)),
+        "p99": float(np.percentile(samples, 99)),
+    }
+
+
+def measure_path(handle, lexical_index, exact, queries, where_of, k, threads) -> dict:
+    embedding_fn = handle.embedding_function
+    index = handle.get()
+    embed_ms, search_ms, latency_ms = [], [], []
+    hits = 0
+
+    for query, category in queries:
+        where = where_of(category)
+
+        # 1) 查询 encode
+        start = time.perf_counter()
+        embedding = np.asarray(embedding_fn([query]))
+        embed_ms.append((time.perf_counter() - start) * 1000)
+
+        # 2) 纯向量检索 (已经有向量)，顺便和精确检索对比 recall
+        kwargs = {"query_embeddings": embedding, "n_results": k}
+        if where:
+            kwargs["where"] = where
+        start = time.perf_counter()
+        found = index.query(**kwargs)["ids"][0]
+        search_ms.append((time.perf_counter() - start) * 1000)
+        truth = exact.query(**kwargs)["ids"][0]
+        hits += len(set(found) & set(truth))
+
+        # 3) 端到端：和工具函数里完全一样的调用 (不走结果缓存，否则重复的问题测不到真实检索)
+        start = time.perf_counter()
+        hybrid_query(handle, lexical_index, query, k, where, use_cache=False)
+        latency_ms.append((time.perf_counter() - start) * 1000)
+
+    # 4) 并发吞吐
+    qps = {}
+    for n_threads in threads:
+        with ThreadPoolExecutor(max_workers=n_threads) as pool:
+            start = time.perf_counter()
+            list(
+                pool.map(
+                    lambda item: hybrid_query(
+                        handle,
+                        lexical_index,
+                        item[0],
+                        k,
+                        where_of(item[1]),
+                        use_cache=False,
+                    ),
+                    queries,
+                )
+            )
+            qps[str(n_threads)] = len(queries) / (time.perf_counter() - start)
+
+    return {
+        "query_embed_ms": percentiles(embed_ms),
+        "vector_search_ms": percentiles(search_ms),
+        "latency_ms": percentiles(latency_ms),
+        "qps": qps,
+        f"recall@{k}": hits / (k * len(queries)),
+    }
+
+
+def run(args) -> dict:
+    if args.embedder == "hash":
+        embedding_fn = HashEmbeddingFunction()
+    else:
+        # 归一化向量：L2 和余弦的排序一致，NumPy 精确检索才能当 Chroma (默认 L2) 的基准
+        embedding_fn = get_embedding_function(normalize=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "embedder": args.embedder,
+            "k": args.k,
+            "queries": args.queries,
+            "threads": args.threads,
+            "hybrid": args.hybrid,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "chromadb": chromadb.__version__,
+            "cpu_count": os.cpu_count(),
+        },
+        "runs": [],
+    }
+
+    for size in args.sizes:
+        print(f"\n🧪 规模 {size} 条碎片")
+        corpus = generate_corpus(size, args.seed)
+        queries = generate_queries(corpus, args.queries, args.seed)
+        workdir = tempfile.mkdtemp(prefix="retrieval_bench_")
+        lexical_index = None
+        try:
+            handles, lexical_index, exact, build = build_stores(
+                workdir, corpus, embedding_fn, args.backends, args.hybrid, args.batch_size
+            )
+            print(
+                f"   📦 入库 {build['docs']} 条，{build['seconds']:.1f}s "
+                f"(encode {build['encode_seconds']:.1f}s, upsert {build['upsert_seconds']:.1f}s)"
+            )
+            for backend, handle in handles.items():
+                for path, where_of in PATHS.items():
+                    result = measure_path(
+                        handle, lexical_index, exact, queries, where_of, args.k, args.threads
+                    )
+                    report["runs"].append(
+                        {"size": size, "backend": backend, "path": path, "build": build, **result}
+                    )
+                    print(
+                        f"   {backend:>18} {path:<22} "
+                        f"encode {result['query_embed_ms']['p50']:6.2f}ms  "
+                        f"search {result['vector_search_ms']['p50']:6.2f}ms  "
+                        f"p50/p95/p99 {result['latency_ms']['p50']:.2f}/"
+                        f"{result['latency_ms']['p95']:.2f}/{result['latency_ms']['p99']:.2f}ms  "
+                        f"QPS {', '.join(f'{t}线程={q:.0f}' for t, q in result['qps'].items())}  "
+                        f"recall@{args.k} {result[f'recall@{args.k}']:.1%}"
+                    )
+                handle.close()
+        finally:
+            if lexical_index is not None:
+                lexical_index.close()
+            shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="检索延迟 / 召回率基准测试")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000])
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--embedder", choices=["model", "hash"], default="model")
+    parser.add_argument("--queries", type=int, default=200, help="每个规模的查询条数")
+    parser.add_argument("--k", type=int, default=3, help="和工具函数一样默认取 top 3")
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, 4, 8])
+    parser.add_argument("--batch-size", type=int, default=2048, help="入库时每批碎片数")
+    parser.add_argument("--hybrid", action="store_true", help="同时建关键词倒排索引，测混合检索")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output",
+        default=f"rst/benchmarks/retrieval_{datetime.now():%Y%m%d%H%M%S}.json",
+        help="JSON 报告路径 (放在 rst/benchmarks/ 子目录，不会被索引脚本当成日记)",
+    )
+    args = parser.parse_args()
+
+    report = run(args)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 基准结果已保存到 {args.output}")
@@ -3,46 +3,33 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-# 自定义本地嵌入函数，使用 SentenceTransformer
-from chromadb import EmbeddingFunction, Documents, Embeddings
-from sentence_transformers import SentenceTransformer
+# 本地嵌入函数统一从 utils.embeddings 获取 (进程内只加载一次模型)
+from utils.embeddings import get_embedding_function
 
-
-class LocalEmbeddingFunction(EmbeddingFunction):
-    def __init__(self):
-
-        # 既然是处理文档，我们用这一款支持多语言的模型，效果比较均衡
-        self.model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
-
-    def __call__(self, input: Documents) -> Embeddings:
-        embeddings = self.model.encode(input)
-        # 列表推导式，把每个 numpy array 转成 list
-        return [e.tolist() for e in embeddings]
-
-    def name(self):
-        return "local_sentence_transformer_v2"
+# 检索句柄：默认查 Chroma，设置 RAG_BACKEND=numpy 时查内存 NumPy 索引
+from utils.vector_store import open_knowledge_base
+from utils.lexical_index import get_lexical_index, hybrid_query
+from utils.relevance_gate import get_gate_for_handle
 
 
 # 连接数据库，定义好数据库地址，这里为rst/chroma_db
-import chromadb
-from google import genai
-import os
+from utils.genai_client import get_genai_client
 import streamlit as st
 
 
 @st.cache_resource
-def get_chromadb_collection():
-    return chromadb.PersistentClient(path="rst/chroma_db").get_collection(
-        name="categorized_memory", embedding_function=LocalEmbeddingFunction()
+def get_knowledge_base():
+    return open_knowledge_base(
+        "rst/chroma_db", "categorized_memory", get_embedding_function()
     )
 
 
 @st.cache_resource
 def get_gemini_client():
-    return genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+    return get_genai_client()
 
 
-collection = get_chromadb_collection()
+knowledge_base = get_knowledge_base()
 # Gemini API 客户端
 gemini_client = get_gemini_client()
 
@@ -55,16 +42,23 @@ def query_rag_system(user_query: str, category_filter: str) -> tuple[str, list]:
     # 根据用户选择的模式，动态构造 where 过滤条件
     where_condition = {"category": category_filter}
 
-    results = collection.query(
-        # 假设只有一个问题
-        query_texts=[user_query],
+    # 混合检索：关键词 (BM25) + 向量 (带缓存) 融合排序；关键词能确定答案时省掉向量检索
+    # 关键词倒排索引由 day10_02_indexer.py 生成，还没建过时 get_lexical_index() 为 None，退回纯向量
+    results = hybrid_query(
+        knowledge_base,
+        get_lexical_index(),
+        user_query,
         n_results=3,  # 找 3 条证据
         where=where_condition,  # 🔥 Day 10 的核心魔法
+        fill_distances=True,  # 下面要过相关性闸门：只有关键词命中的碎片也要有向量距离
     )
 
+    # 相关性闸门：距离超过校准阈值的证据丢掉；一条都不剩就直接本地回答，不调 Gemini
+    results = get_gate_for_handle(knowledge_base).filter(results)
+
     # 2. 组装 Context
-    valid_docs = results["documents"][0]
-    metadatas = results["metadatas"][0]
+    valid_docs = results["documents"]
+    metadatas = results["metadatas"]
 
     if not valid_docs:
         return "没有找到相关资料。", []
@@ -1,8 +1,10 @@
-import os
 from dotenv import load_dotenv
-from google import genai
+from utils.genai_client import get_genai_client
+from utils.response_cache import with_response_cache
 from google.genai import types
 from utils.ai_tools import get_current_weather, calculate_dog_food, tools_list
+from utils.tool_registry import call_tool, format_tool_cache_stats
+from utils.history import HistoryManager
 
 # 1. 初始化
 load_dotenv()
@@ -19,9 +21,10 @@ class Agent:
         """
         初始化 Agent，给它装上大脑 (Client) 和记忆 (History)
         """
-        self.client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+        self.client = with_response_cache(get_genai_client())
         self.model_id = model_id
         self.chat_history = []  # 记忆槽
+        self.history_manager = HistoryManager()  # 记忆超预算时压缩
 
         # 定义系统提示词：赋予它“思考”的人设
         self.system_instruction = """
@@ -57,7 +60,11 @@ class Agent:
             turn_count += 1
             print(f"🔄 [第 {turn_count} 轮思考]...")
 
-            # --- A. 调用 LLM 大脑 ---
+            # --- A. 调用 LLM 大脑 (先把超预算的记忆压一压) ---
+            self.chat_history = self.history_manager.compact(self.chat_history)
+            report = self.history_manager.format_last_report()
+            if report:
+                print(report)
             response = self.client.models.generate_content(
                 model=self.model_id,
                 contents=self.chat_history,
@@ -117,7 +124,7 @@ class Agent:
                 # 动态分发
                 if fn_name in FUNCTION_MAP:
                     try:
-                        result = FUNCTION_MAP[fn_name](**fn_args)
+                        result = call_tool(FUNCTION_MAP, fn_name, fn_args)
                         print(f"📦 [方法结果]:{result}")
                     except Exception as e:
                         result = f"Error: {str(e)}"
@@ -148,3 +155,4 @@ if __name__ == "__main__":
 
     query = "胖墩墩现在在常州，8.5kg。请帮我判断今天适不适合带它去公园，以及如果运动量大，它今天该吃多少狗粮？"
     my_agent.chat(query)
+    print(format_tool_cache_stats())
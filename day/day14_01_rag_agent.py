@@ -1,15 +1,18 @@
-import os
 import sys
 
 from dotenv import load_dotenv
-from google import genai
+from utils.genai_client import get_genai_client
+from utils.response_cache import with_response_cache
 from google.genai import types
 
+from utils.tool_registry import call_tool, format_tool_cache_stats
+from utils.history import HistoryManager
 from utils.ai_tools import (
     tools_list,
     get_current_weather,
     calculate_dog_food,
     search_knowledge_base,
+    search_knowledge_base_batch,
 )
 
 load_dotenv()
@@ -18,23 +21,19 @@ load_dotenv()
 FUNCTION_MAP = {
     "get_current_weather": get_current_weather,
     "calculate_dog_food": calculate_dog_food,
-    "search_knowledge_base": search_knowledge_base,  # 👈 新增：RAG 工具注册
+    "search_knowledge_base": search_knowledge_base,
+    "search_knowledge_base_batch": search_knowledge_base_batch,  # 👈 新增：RAG 工具注册
 }
 
 
-class AdvancedAgent:
-    def __init__(self, model_id="gemini-2.0-flash"):
-        self.client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
-        self.model_id = model_id
-        self.chat_history = []
-
-        # 🔥 2. 升级系统提示词 (注入灵魂)
-        self.system_instruction = """
+# 🔥 2. 升级系统提示词 (注入灵魂)；day14_02_async_agent.py 的异步版本也用这一份
+SYSTEM_INSTRUCTION = """
         你是一个全能型智能助手，名字叫“胖墩墩管家”。
         你拥有以下强力工具：
         1. `search_knowledge_base`: **核心工具**。当问题涉及“我”、“胖墩墩”、“日记”、“以前”或“笔记”等私有信息时，**必须优先调用**此工具查库，不要瞎编。
         2. `get_current_weather`: 查询实时天气。
         3. `calculate_dog_food`: 计算狗粮用量。
+        4. `search_knowledge_base_batch`: 需要同时查好几件私有信息时，把问题放进一个列表一次查完，不要连续多次调用 `search_knowledge_base`。
 
         思考与行动策略 (ReAct Loop):
         - 收到问题后，先分析需要哪些信息。
@@ -43,6 +42,15 @@ class AdvancedAgent:
         - 拿到工具结果后，结合你的常识进行综合回答。
         """
 
+
+class AdvancedAgent:
+    def __init__(self, model_id="gemini-2.0-flash"):
+        self.client = with_response_cache(get_genai_client())
+        self.model_id = model_id
+        self.chat_history = []
+        self.history_manager = HistoryManager()
+        self.system_instruction = SYSTEM_INSTRUCTION
+
     def chat(self, user_query):
         print(f"\n🟢 [用户]: {user_query}")
         self.chat_history.append(
@@ -56,7 +64,11 @@ class AdvancedAgent:
             turn_count += 1
             print(f"🔄 [第 {turn_count} 轮思考]...")
 
-            # 调用 LLM
+            # 调用 LLM (历史超预算时先压缩：旧的 RAG 结果截断、最早几轮折叠成摘要)
+            self.chat_history = self.history_manager.compact(self.chat_history)
+            report = self.history_manager.format_last_report()
+            if report:
+                print(report)
             response = self.client.models.generate_content(
                 model=self.model_id,
                 contents=self.chat_history,
@@ -103,7 +115,7 @@ class AdvancedAgent:
                 if fn_name in FUNCTION_MAP:
                     try:
                         # 动态执行函数
-                        result = FUNCTION_MAP[fn_name](**fn_args)
+                        result = call_tool(FUNCTION_MAP, fn_name, fn_args)
                         # 为了终端显示好看，如果是长文本(RAG结果)，截断显示
                         display_result = (
                             str(result)[:100] + "..."
@@ -137,3 +149,6 @@ if __name__ == "__main__":
 
     query = "结合胖墩墩的身体情况（查日记），看看今天常州的天气适合带它去户外玩吗？"
     agent.chat(query)
+    # 同一段对话里再问一次：工具结果直接走缓存
+    agent.chat("再确认一下，今天常州天气怎么样？")
+    print(format_tool_cache_stats())
@@ -0,0 +1,67 @@
+"""
+异步 Agent：一个进程、一个事件循环，同时服务多个会话。
+
+和 day14_01_rag_agent.py 的 AdvancedAgent 用同一套提示词和工具，区别在 utils/async_agent.py：
+    模型调用走 client.aio，等回复时不占线程
+    同一轮的多个工具调用并发执行 (同步工具放进有界线程池)，结果按调用顺序交还给模型
+下面同时开几个会话跑不同的问题，看总耗时和串行相比省了多少。
+
+用法：
+    python day14_02_async_agent.py
+    RAG_TOOL_WORKERS=16 python day14_02_async_agent.py --sessions 20
+"""
+import argparse
+import asyncio
+import time
+
+from day14_01_rag_agent import FUNCTION_MAP, SYSTEM_INSTRUCTION
+from utils.ai_tools import tools_list, warm_up_knowledge_base
+from utils.async_agent import AsyncAgent
+from utils.genai_client import aclose_genai_clients, awarm_up_genai_client
+from utils.tool_registry import format_tool_cache_stats
+
+QUESTIONS = [
+    "结合胖墩墩的身体情况（查日记），看看今天常州的天气适合带它去户外玩吗？",
+    "胖墩墩现在 8.5kg，一天该吃多少狗粮？顺便查查它最爱吃什么。",
+    "胖墩墩以前玩过飞盘吗？今天北京和常州哪边天气更适合玩飞盘？",
+    "我的笔记里 Redis Lua 脚本是怎么保证原子性的？",
+]
+
+
+async def main(sessions: int):
+    # 模型和集合句柄先在主线程里加载好，工具线程池里的检索直接复用
+    warm_up_knowledge_base()
+    await awarm_up_genai_client()
+
+    agents = [
+        AsyncAgent(
+            SYSTEM_INSTRUCTION, tools_list, FUNCTION_MAP, name=f"会话{i + 1}"
+        )
+        for i in range(sessions)
+    ]
+    start = time.perf_counter()
+    try:
+        answers = await asyncio.gather(
+            *(
+                agent.chat(QUESTIONS[i % len(QUESTIONS)])
+                for i, agent in enumerate(agents)
+            ),
+            return_exceptions=True,
+        )
+    finally:
+        await aclose_genai_clients()
+
+    failed = sum(1 for a in answers if isinstance(a, Exception))
+    print(
+        f"\n⏱️ {sessions} 个会话并发完成，总耗时 {time.perf_counter() - start:.2f}s"
+        + (f"，其中 {failed} 个失败" if failed else "")
+    )
+    # 会话之间共享工具缓存：不同会话问同一个城市的天气只查一次
+    print(format_tool_cache_stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多会话并发的异步 Agent")
+    parser.add_argument("--sessions", type=int, default=4, help="同时跑几个会话")
+    args = parser.parse_args()
+    asyncio.run(main(args.sessions))
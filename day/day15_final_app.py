@@ -5,37 +5,57 @@ import os
 import sys
 import time
 from dotenv import load_dotenv
-from google import genai
 from google.genai import types
 
 # 确保能引用到 utils
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from day.utils.genai_client import get_genai_client, warm_up_genai_client
+from day.utils.response_cache import with_response_cache
+from day.utils.tool_registry import call_tool, tool_cache_stats
+from day.utils.history import HistoryManager
 from day.utils.ai_tools import (
     tools_list,
     get_current_weather,
     calculate_dog_food,
     search_knowledge_base,
+    search_knowledge_base_batch,
+    warm_up_knowledge_base,
+    knowledge_base_cache_stats,
 )
 
 # 1. 初始化环境
 load_dotenv()
 st.set_page_config(page_title="胖墩墩全能管家", page_icon="🐶", layout="centered")
 
+
+# 整个服务进程只预热一次知识库 (模型 + 集合句柄)，后面每个会话都直接复用
+@st.cache_resource
+def warm_up():
+    warm_up_knowledge_base()
+    # 共享的 Gemini 客户端也提前建好 TLS 连接，所有会话共用一个连接池
+    warm_up_genai_client()
+    return True
+
+
+warm_up()
+
 # --- 核心：定义支持 UI 反馈的 Agent ---
 # 我们把 Day 14 的逻辑搬过来，并加上 Streamlit 的视觉反馈
 FUNCTION_MAP = {
     "get_current_weather": get_current_weather,
     "calculate_dog_food": calculate_dog_food,
     "search_knowledge_base": search_knowledge_base,
+    "search_knowledge_base_batch": search_knowledge_base_batch,
 }
 
 
 class StreamlitAgent:
     def __init__(self, model_id="gemini-2.0-flash-exp"):
-        self.client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+        self.client = with_response_cache(get_genai_client())
         self.model_id = model_id
         self.chat_history = []
+        self.history_manager = HistoryManager()
 
         # Day 14 的终极 Prompt
         self.system_instruction = """
@@ -44,6 +64,7 @@ class StreamlitAgent:
         1. `search_knowledge_base`: **核心工具**。当问题涉及“我”、“胖墩墩”、“日记”、“以前”或“笔记”等私有信息时，**必须优先调用**此工具查库。
         2. `get_current_weather`: 查询实时天气。
         3. `calculate_dog_food`: 计算狗粮用量。
+        4. `search_knowledge_base_batch`: 需要同时查好几件私有信息时，把问题放进一个列表一次查完，不要连续多次调用 `search_knowledge_base`。
 
         思考与行动策略 (ReAct Loop):
         - 收到问题后，先分析需要哪些信息。
@@ -68,7 +89,11 @@ class StreamlitAgent:
                 turn_count += 1
                 st.write(f"🔄 第 {turn_count} 轮思考...")
 
-                # 调用 Gemini
+                # 调用 Gemini (历史超预算时先压缩)
+                self.chat_history = self.history_manager.compact(self.chat_history)
+                report = self.history_manager.format_last_report()
+                if report:
+                    st.write(report)
                 response = self.client.models.generate_content(
                     model=self.model_id,
                     contents=self.chat_history,
@@ -123,14 +148,14 @@ class StreamlitAgent:
                 fn_args = part.function_call.args
 
                 # UI 反馈：如果是查库，显示个特别的 Toast
-                if fn_name == "search_knowledge_base":
+                if fn_name.startswith("search_knowledge_base"):
                     st.toast(f"📚 正在翻阅日记库...", icon="📖")
                 elif fn_name == "get_current_weather":
                     st.toast(f"☁️ 正在查询天气...", icon="🌦️")
 
                 if fn_name in FUNCTION_MAP:
                     try:
-                        result = FUNCTION_MAP[fn_name](**fn_args)
+                        result = call_tool(FUNCTION_MAP, fn_name, fn_args)
                         # 在状态栏里折叠显示详细结果，避免刷屏
                         with st.expander(f"📦 工具 {fn_name} 返回结果"):
                             st.code(str(result)[:500])  # 只显示前500字
@@ -175,6 +200,21 @@ with st.sidebar:
         st.session_state.agent = StreamlitAgent()  # 重置 Agent
         st.rerun()
 
+    # 检索缓存命中率 (整个服务进程共享)
+    cache_stats = knowledge_base_cache_stats()
+    st.caption(
+        f"📚 检索缓存: 命中 {cache_stats['hits']} 次 / "
+        f"命中率 {cache_stats['hit_ratio']:.0%}"
+    )
+    # 工具结果缓存命中率 (同样是整个服务进程共享)
+    tool_stats = tool_cache_stats().values()
+    tool_hits = sum(s["hits"] for s in tool_stats)
+    tool_lookups = tool_hits + sum(s["misses"] for s in tool_stats)
+    st.caption(
+        f"🧰 工具缓存: 命中 {tool_hits} 次 / "
+        f"命中率 {tool_hits / tool_lookups if tool_lookups else 0:.0%}"
+    )
+
 # 初始化 Session
 if "messages" not in st.session_state:
     st.session_state.messages = []
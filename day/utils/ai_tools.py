@@ -7,6 +7,9 @@ from rich.table import Table
 from rich.panel import Panel
 import glob
 import os
+from typing import Optional
+
+from .tool_registry import tool
 
 
 class AIToolkit:
@@ -127,6 +130,8 @@ class AIToolkit:
         console.print(table)
 
 
+# 天气变化慢：同一个城市 10 分钟内直接用缓存
+@tool(ttl=600)
 def get_current_weather(city: str = "上海") -> str:
     """
     查询指定城市的实时天气。
@@ -142,6 +147,8 @@ def get_current_weather(city: str = "上海") -> str:
     return mock_data.get(city, "未知天气, 建议看天气预报")
 
 
+# 纯函数：同样的参数永远同样的结果
+@tool(cache="pure")
 def calculate_dog_food(weight_kg: float = 7.5, is_active: bool = True) -> int:
     """
     根据体重计算狗狗每天需要的狗粮克数。
@@ -159,22 +166,59 @@ def calculate_dog_food(weight_kg: float = 7.5, is_active: bool = True) -> int:
     return int(base_amount)
 
 
-import chromadb
-from chromadb.utils import embedding_functions
 import os
 
+from .embeddings import get_embedding_function
+from .vector_store import open_knowledge_base
+from .query_cache import query_cache
+from .lexical_index import get_lexical_index, hybrid_query, hybrid_query_batch
+
 # 1. 配置 ChromaDB 路径 (确保指向你之前生成的数据库文件夹)
 DB_PATH = "rst/chroma_db"
 COLLECTION_NAME = "categorized_memory"
 
-# 初始化 Embedding 函数 (和 Day 10 一样，用本地模型)
-# 如果你之前用的是其他模型，请保持一致
-embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name="paraphrase-multilingual-MiniLM-L12-v2"
-)
+# Embedding 函数 (和 Day 10 一样，用本地模型)
+# 从共享注册表获取，模型在第一次搜索时才加载，且整个进程只加载一次
+embedding_fn = get_embedding_function()
+
+# 进程级共享的检索句柄：第一次搜索时才连接，之后每轮对话复用，索引更新后自动重开
+# 后端 (chroma / numpy) 由环境变量 RAG_BACKEND 决定
+knowledge_base = open_knowledge_base(DB_PATH, COLLECTION_NAME, embedding_fn)
+
+
+def warm_up_knowledge_base():
+    """预热知识库 (加载模型 + 打开集合)，适合在应用启动时调用"""
+    try:
+        knowledge_base.warm_up()
+    except Exception as e:
+        print(f"⚠️ 知识库预热失败: {e}")
+
+
+def close_knowledge_base():
+    """显式关闭知识库连接"""
+    knowledge_base.close()
 
 
-# 2. 定义 RAG 搜索工具
+def knowledge_base_cache_stats() -> dict:
+    """检索结果缓存的命中率统计"""
+    return query_cache.stats()
+
+
+def knowledge_base_version():
+    """当前索引的版本号 (重建索引后会变)，检索工具的结果缓存跟着它失效"""
+    try:
+        knowledge_base.get()
+    except Exception:
+        return None  # 库还没建好：检索工具会返回“搜索失败”，不会被缓存
+    return knowledge_base.version
+
+
+def _cacheable_search_result(result) -> bool:
+    return not str(result).startswith("搜索失败")
+
+
+# 2. 定义 RAG 搜索工具 (索引不变，同样的问题结果就不变)
+@tool(cache="index", version=knowledge_base_version, cache_if=_cacheable_search_result)
 def search_knowledge_base(query: str):
     """
     搜索本地知识库(日记、文档)，获取与问题相关的背景信息。
@@ -186,17 +230,13 @@ def search_knowledge_base(query: str):
     print(f"\n📚 [RAG Tool] 正在搜索知识库: {query}...")
 
     try:
-        client = chromadb.PersistentClient(path=DB_PATH)
-        collection = client.get_collection(
-            name=COLLECTION_NAME, embedding_function=embedding_fn
-        )
-
-        # 搜索 Top 3 相关片段
-        results = collection.query(query_texts=[query], n_results=3)
+        # 搜索 Top 3 相关片段：关键词 + 向量混合排序 (向量部分在索引没变时直接命中缓存)
+        # 关键词倒排索引由 day10_02_indexer.py 生成，还没建过时只走向量检索
+        results = hybrid_query(knowledge_base, get_lexical_index(), query, n_results=3)
 
         # 格式化结果
-        documents = results["documents"][0]
-        metadatas = results["metadatas"][0]
+        documents = results["documents"]
+        metadatas = results["metadatas"]
 
         context_text = ""
         for i, doc in enumerate(documents):
@@ -213,4 +253,49 @@ def search_knowledge_base(query: str):
         return f"搜索失败: {str(e)}"
 
 
-tools_list = [get_current_weather, calculate_dog_food, search_knowledge_base]
+@tool(cache="index", version=knowledge_base_version, cache_if=_cacheable_search_result)
+def search_knowledge_base_batch(
+    queries: list[str], categories: Optional[list[str]] = None
+):
+    """
+    一次性搜索本地知识库中的多个问题 (比多次调用 search_knowledge_base 快得多)。
+    当一个问题需要同时查好几件事时 (例如“胖墩墩的身体情况”和“以前的户外活动”)，请优先用这个工具一次查完。
+
+    参数:
+        queries: 搜索关键词列表，例如 ["胖墩墩生病", "胖墩墩玩飞盘"]
+        categories: 与 queries 一一对应的分类过滤："diary" 只查日记，"tech" 只查技术文档，"" 不过滤；可省略
+    """
+    print(f"\n📚 [RAG Tool] 正在批量搜索知识库: {queries}...")
+
+    categories = list(categories or [])
+    # 分类列表比问题少时，剩下的问题不过滤
+    categories += [""] * (len(queries) - len(categories))
+    wheres = [{"category": c} if c else None for c in categories[: len(queries)]]
+
+    try:
+        # 关键词能确定答案的问题直接返回；其余问题一次 encode，同一分类的合并成一次向量检索
+        batch_results = hybrid_query_batch(
+            knowledge_base, get_lexical_index(), queries, 3, wheres
+        )
+
+        context_text = ""
+        for query, results in zip(queries, batch_results):
+            context_text += f"\n### 问题: {query}\n"
+            if not results["documents"]:
+                context_text += "知识库中未找到相关信息。\n"
+            for doc, meta in zip(results["documents"], results["metadatas"]):
+                source = meta.get("source", "未知来源")
+                context_text += f"[来源: {source}] 内容: {doc}\n"
+        return context_text
+
+    except Exception as e:
+        print(f"❌ RAG 批量搜索出错: {e}")
+        return f"搜索失败: {str(e)}"
+
+
+tools_list = [
+    get_current_weather,
+    calculate_dog_food,
+    search_knowledge_base,
+    search_knowledge_base_batch,
+]
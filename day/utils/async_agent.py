@@ -0,0 +1,164 @@
+# utils/async_agent.py
+"""
+基于 client.aio 的异步 Agent。
+
+Agent / AdvancedAgent / StreamlitAgent 的 chat 用的是阻塞的 client.models.generate_content，
+模型一轮里要调好几个工具时 _execute_tool_calls 还是一个接一个串行执行，一个线程同一时间只能服务一个会话。
+AsyncAgent 的思考循环和它们一样 (手动挡函数调用，最多 max_turns 轮)，区别是：
+    等模型回复时不占线程：同一个事件循环上可以同时跑几十个会话 (asyncio.gather 多个 agent.chat)
+    同一轮里的多个函数调用并发执行：async 工具直接 await，同步工具 (search_knowledge_base 这种)
+    放进进程共享的有界线程池 (RAG_TOOL_WORKERS，默认 8)，结果按调用顺序拼回去交给模型
+"""
+import asyncio
+import functools
+import inspect
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from google.genai import types
+
+from .genai_client import get_genai_client
+from .history import HistoryManager
+from .response_cache import with_response_cache
+from .tool_registry import call_tool, lookup, store
+
+# 所有会话共用的工具线程池：限制同时跑的同步工具个数，免得几十个会话把检索 / 模型推理挤爆
+TOOL_WORKERS = int(os.environ.get("RAG_TOOL_WORKERS", 8))
+_TOOL_EXECUTOR = None
+
+
+def get_tool_executor() -> ThreadPoolExecutor:
+    global _TOOL_EXECUTOR
+    if _TOOL_EXECUTOR is None:
+        _TOOL_EXECUTOR = ThreadPoolExecutor(
+            max_workers=TOOL_WORKERS, thread_name_prefix="agent-tool"
+        )
+    return _TOOL_EXECUTOR
+
+
+async def run_tool(function_map: dict, name: str, args: dict, executor=None):
+    """
+    执行一个工具调用 (可缓存的工具先查 utils/tool_registry 的共享缓存)；
+    出错时返回错误信息给模型，不抛异常
+    """
+    fn = function_map.get(name)
+    if fn is None:
+        return f"Error: Unknown tool {name}"
+    try:
+        if inspect.iscoroutinefunction(fn):
+            hit, result, key = lookup(name, args)
+            if not hit:
+                result = await fn(**args)
+                store(name, key, result)
+            return result
+        # 同步工具连同查缓存一起放进线程池 (算版本号可能要读磁盘，不阻塞事件循环)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor or get_tool_executor(),
+            functools.partial(call_tool, function_map, name, args),
+        )
+    except Exception as e:
+        return f"Error: {e}"
+
+
+class AsyncAgent:
+    """
+    参数:
+        system_instruction: 系统提示词
+        tools: 交给模型的工具列表 (同 GenerateContentConfig.tools)
+        function_map: 工具名 -> Python 函数 (同步或 async 都行)
+        model_id: 模型
+        name: 会话名，多个会话同时跑时用来区分日志
+        max_turns: 最多思考几轮
+    """
+
+    def __init__(
+        self,
+        system_instruction: str,
+        tools: list,
+        function_map: dict,
+        model_id: str = "gemini-2.0-flash",
+        name: str = "Agent",
+        max_turns: int = 5,
+    ):
+        self.client = with_response_cache(get_genai_client())
+        self.system_instruction = system_instruction
+        self.tools = tools
+        self.function_map = function_map
+        self.model_id = model_id
+        self.name = name
+        self.max_turns = max_turns
+        self.chat_history = []
+        self.history_manager = HistoryManager()
+
+    async def chat(self, user_query: str):
+        print(f"\n🟢 [{self.name}] 用户: {user_query}")
+        self.chat_history.append(
+            types.Content(role="user", parts=[types.Part.from_text(text=user_query)])
+        )
+
+        for turn in range(1, self.max_turns + 1):
+            print(f"🔄 [{self.name}] 第 {turn} 轮思考...")
+            self.chat_history = self.history_manager.compact(self.chat_history)
+            report = self.history_manager.format_last_report()
+            if report:
+                print(f"[{self.name}] {report}")
+            response = await self.client.aio.models.generate_content(
+                model=self.model_id,
+                contents=self.chat_history,
+                config=types.GenerateContentConfig(
+                    tools=self.tools,
+                    temperature=0.0,
+                    system_instruction=self.system_instruction,
+                    automatic_function_calling={"disable": True},  # 手动挡
+                ),
+            )
+
+            if self._has_function_call(response):
+                self.chat_history.append(response.candidates[0].content)
+                await self._execute_tool_calls(response.candidates[0].content.parts)
+                continue
+
+            if response.text:
+                print(f"🤖 [{self.name}] 最终回答: {response.text}")
+                self.chat_history.append(response.candidates[0].content)
+                return response.text
+
+            print(f"⚠️ [{self.name}] 无输出，跳出循环")
+            break
+
+    def _has_function_call(self, response):
+        if not response.candidates:
+            return False
+        for part in response.candidates[0].content.parts:
+            if part.function_call:
+                return True
+        return False
+
+    async def _execute_tool_calls(self, parts):
+        """同一轮的所有函数调用并发执行，结果按调用顺序放回 (gather 保证顺序)"""
+        calls = [part.function_call for part in parts if part.function_call]
+        for call in calls:
+            print(f"🔨 [{self.name}] 调用工具 {call.name} | 参数: {call.args}")
+
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(run_tool(self.function_map, call.name, call.args or {}) for call in calls)
+        )
+        if len(calls) > 1:
+            print(
+                f"⚡ [{self.name}] {len(calls)} 个工具并发执行，"
+                f"耗时 {time.perf_counter() - start:.2f}s"
+            )
+
+        response_parts = []
+        for call, result in zip(calls, results):
+            # 为了终端显示好看，长文本 (RAG 结果) 截断显示
+            display_result = str(result)[:100] + "..." if len(str(result)) > 100 else result
+            print(f"📦 [{self.name}] {call.name} 返回: {display_result}")
+            response_parts.append(
+                types.Part.from_function_response(name=call.name, response={"result": result})
+            )
+        if response_parts:
+            self.chat_history.append(types.Content(role="tool", parts=response_parts))
@@ -0,0 +1,380 @@
+# utils/chunking.py
+"""
+切片与解析：把一个源文件变成 (ids, documents, metadatas)。
+
+给进程池用的切片函数都是无副作用的纯函数 (不连数据库、不加载模型)，
+所以可以直接丢进多进程池里跑，macOS 的 spawn 模式下子进程也不会重复初始化 Chroma。
+大文件 (比如几百 MB 的 Markdown 导出) 走 iter_text_chunks 流式切片，内存占用和文件大小无关。
+
+按字符切有个问题：paraphrase-multilingual-MiniLM-L12-v2 最多只看 128 个 word-piece，
+中文 400 字的碎片大半会在 encode 时被截掉。iter_token_chunks 用模型自己的 tokenizer 量长度
+(上限取自模型的 max_seq_length，见 get_token_chunk_size)，
+并且尽量在句子边界 (。！？\n) 处断开，保证每个碎片都能完整塞进模型窗口。
+"""
+import json
+import os
+import re
+from functools import lru_cache
+
+# 技术文档：每片400字符，重叠50字符
+TECH_CHUNK_SIZE = 400
+TECH_CHUNK_OVERLAP = 50
+# 流式读取时每次从文件读多少字符
+READ_BLOCK_SIZE = 64 * 1024
+
+# 碎片最多多少 token 不写死，由 get_token_chunk_size() 从模型的 max_seq_length 推出来
+TOKEN_CHUNK_OVERLAP = 16
+# 句子结束符：中文标点 + 英文标点 + 换行
+SENTENCE_END_RE = re.compile(r"(?<=[。！？!?\n])")
+
+
+def split_text(text, chunk_size=300, chunk_overlap=50) -> list:
+    """
+    滑动窗口切片：保证上下文连贯
+    text: 待切片的文本
+    chunk_size: 每个切片的最大长度，默认300字符
+    chunk_overlap: 切片之间重叠的部分，保证上下文连贯，默认50字符
+    """
+    chunks = []
+    # 游标位置
+    start = 0
+    # 切片文本长度
+    text_len = len(text)
+
+    # 当游标没到文本末尾时，循环持续切片
+    while start < text_len:
+        # 切片结束位置
+        end = start + chunk_size
+        # 切片文本，取游标到结束位置之间的内容
+        chunk = text[start:end]
+        # 加入集合
+        chunks.append(chunk)
+        # 步长 = 窗口大小 - 重叠部分
+        start += chunk_size - chunk_overlap
+    return chunks
+
+
+def iter_text_chunks(
+    file_path, chunk_size=300, chunk_overlap=50, block_size=READ_BLOCK_SIZE
+):
+    """
+    流式滑动窗口切片：和 split_text 切出来的结果完全一样，但不需要把整个文件读进内存。
+    逐块读文件，边读边产出 (chunk_index, text, (start, end))，start/end 是字符偏移。
+    """
+    step = chunk_size - chunk_overlap
+    buffer = ""
+    # buffer[0] 在全文中的字符偏移
+    buffer_start = 0
+    index = 0
+
+    with open(file_path, "r", encoding="utf-8") as f:
+        eof = False
+        while not eof:
+            block = f.read(block_size)
+            eof = not block
+            buffer += block
+
+            # 游标在 buffer 内移动；没到文件末尾时，只切完整的窗口，剩下的等下一块
+            pos = 0
+            while pos < len(buffer) and (eof or len(buffer) - pos >= chunk_size):
+                chunk = buffer[pos : pos + chunk_size]
+                start = buffer_start + pos
+                yield index, chunk, (start, start + len(chunk))
+                index += 1
+                # 步长 = 窗口大小 - 重叠部分
+                pos += step
+
+            # 丢掉已经切完的部分，buffer 最多只留一个窗口 + 一个读块
+            buffer = buffer[pos:]
+            buffer_start += pos
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model_name: str = None):
+    """
+    只加载模型的 tokenizer (不加载权重)，每个进程只加载一次。
+    model_name 为 None 时用默认的 Embedding 模型。
+    """
+    from transformers import AutoTokenizer
+
+    if model_name is None:
+        from .embeddings import DEFAULT_MODEL_NAME
+
+        model_name = DEFAULT_MODEL_NAME
+    # sentence-transformers 的短名字在 HF Hub 上挂在 sentence-transformers/ 下面
+    if "/" not in model_name:
+        model_name = f"sentence-transformers/{model_name}"
+    return AutoTokenizer.from_pretrained(model_name)
+
+
+@lru_cache(maxsize=None)
+def get_token_chunk_size(model_name: str = None) -> int:
+    """
+    模型窗口能装下的正文 token 数：max_seq_length 扣掉 [CLS] / [SEP] 这些特殊 token。
+    读的是共享的 get_model()，换了模型或改了 max_seq_length，碎片长度跟着变。
+    """
+    from .embeddings import DEFAULT_MODEL_NAME, get_model
+
+    model = get_model(model_name or DEFAULT_MODEL_NAME)
+    return model.max_seq_length - model.tokenizer.num_special_tokens_to_add()
+
+
+def split_sentences(text: str) -> list:
+    """按 。！？!?\n 断句，标点留在句尾，拼回去和原文一字不差"""
+    return [s for s in SENTENCE_END_RE.split(text) if s]
+
+
+def iter_sentences(file_path: str, block_size: int = READ_BLOCK_SIZE):
+    """流式断句：逐块读文件，最后一个没结束的半句留到下一块再切"""
+    with open(file_path, "r", encoding="utf-8") as f:
+        tail = ""
+        for block in iter(lambda: f.read(block_size), ""):
+            sentences = split_sentences(tail + block)
+            tail = sentences.pop() if sentences else ""
+            yield from sentences
+        if tail:
+            yield tail
+
+
+def _split_long_sentence(sentence: str, tokenizer, max_tokens: int):
+    """单句就超过窗口时，只能按 token 边界硬切"""
+    encoded = tokenizer(
+        sentence, add_special_tokens=False, return_offsets_mapping=True
+    )
+    offsets = encoded["offset_mapping"]
+    # 每段紧接着上一段开始，空白等没被编码的字符也不会丢
+    char_start = 0
+    for start in range(0, len(offsets), max_tokens):
+        window = offsets[start : start + max_tokens]
+        char_end = (
+            len(sentence) if start + max_tokens >= len(offsets) else window[-1][1]
+        )
+        yield sentence[char_start:char_end], len(window)
+        char_start = char_end
+
+
+def pack_sentences(
+    sentences,
+    tokenizer,
+    max_tokens: int = None,
+    overlap_tokens: int = TOKEN_CHUNK_OVERLAP,
+    tokenize_batch: int = 256,
+):
+    """
+    把句子贪心地装进不超过 max_tokens 的碎片里，碎片之间保留最多 overlap_tokens 的整句重叠。
+    产出 (chunk_index, text, (start, end))，和 iter_text_chunks 的格式一致。
+    max_tokens 为 None 时用 get_token_chunk_size()。
+    """
+    max_tokens = max_tokens or get_token_chunk_size()
+    current = []  # [(text, n_tokens, char_start)]
+    current_tokens = 0
+    offset = 0
+    index = 0
+
+    def sized_sentences():
+        # 一次给 tokenizer 喂一批句子，比逐句调用快得多
+        batch = []
+        for sentence in sentences:
+            batch.append(sentence)
+            if len(batch) >= tokenize_batch:
+                yield from _measure(batch)
+                batch = []
+        if batch:
+            yield from _measure(batch)
+
+    def _measure(batch):
+        nonlocal offset
+        counts = tokenizer(batch, add_special_tokens=False)["input_ids"]
+        for sentence, ids in zip(batch, counts):
+            if len(ids) > max_tokens:
+                pieces = _split_long_sentence(sentence, tokenizer, max_tokens)
+            else:
+                pieces = [(sentence, len(ids))]
+            for piece, n_tokens in pieces:
+                yield piece, n_tokens, offset
+                offset += len(piece)
+
+    for sentence, n_tokens, start in sized_sentences():
+        if current and current_tokens + n_tokens > max_tokens:
+            text = "".join(t for t, _, _ in current)
+            yield index, text, (current[0][2], current[0][2] + len(text))
+            index += 1
+
+            # 从尾部往回留几句做重叠，但要给新句子留出位置
+            kept, kept_tokens = [], 0
+            for item in reversed(current):
+                if kept_tokens + item[1] > min(overlap_tokens, max_tokens - n_tokens):
+                    break
+                kept.insert(0, item)
+                kept_tokens += item[1]
+            current, current_tokens = kept, kept_tokens
+
+        current.append((sentence, n_tokens, start))
+        current_tokens += n_tokens
+
+    if current:
+        text = "".join(t for t, _, _ in current)
+        yield index, text, (current[0][2], current[0][2] + len(text))
+
+
+def split_text_by_tokens(text: str, tokenizer=None, **kwargs) -> list:
+    """按 token 切片 (整段文本版本)，参数同 pack_sentences"""
+    tokenizer = tokenizer or get_tokenizer()
+    return [c for _, c, _ in pack_sentences(split_sentences(text), tokenizer, **kwargs)]
+
+
+def iter_token_chunks(file_path: str, tokenizer=None, **kwargs):
+    """按 token 流式切片 (文件版本)，参数同 pack_sentences"""
+    tokenizer = tokenizer or get_tokenizer()
+    yield from pack_sentences(iter_sentences(file_path), tokenizer, **kwargs)
+
+
+def truncation_report(
+    texts, tokenizer=None, max_tokens: int = None, batch_size: int = 256
+) -> dict:
+    """
+    统计一批碎片在 encode 时会被截掉多少 token：
+    tokenizer 照样要处理这些 token，但它们永远不会进入向量。
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    max_tokens = max_tokens or get_token_chunk_size()
+    report = {"chunks": 0, "truncated_chunks": 0, "tokens": 0, "wasted_tokens": 0}
+
+    batch = []
+
+    def measure(batch):
+        for ids in tokenizer(batch, add_special_tokens=False)["input_ids"]:
+            wasted = max(0, len(ids) - max_tokens)
+            report["chunks"] += 1
+            report["tokens"] += len(ids)
+            report["wasted_tokens"] += wasted
+            report["truncated_chunks"] += 1 if wasted else 0
+
+    for text in texts:
+        batch.append(text)
+        if len(batch) >= batch_size:
+            measure(batch)
+            batch = []
+    if batch:
+        measure(batch)
+
+    report["wasted_ratio"] = (
+        report["wasted_tokens"] / report["tokens"] if report["tokens"] else 0.0
+    )
+    return report
+
+
+def _tech_metadata(filename: str, i: int, offsets: tuple = None) -> dict:
+    # 🔥 关键步骤：打标签！
+    # 我们明确指定这是 "tech" 类，作者是 "赵一清"
+    metadata = {
+        "category": "tech",
+        "author": "赵一清",
+        "source": filename,
+        "chunk_index": i,
+    }
+    if offsets is not None:
+        # 记下碎片在原文中的位置，方便回溯出处
+        metadata["char_start"], metadata["char_end"] = offsets
+    return metadata
+
+
+def iter_tech_chunks(file_path: str, batch_size: int = 256, chunker=None):
+    """
+    流式处理技术文档 (.md)：每攒够 batch_size 个碎片就产出一次，
+    写库那边可以在文件还没读完时就开始 encode 前面的碎片。
+    chunker: 切片生成器 chunker(file_path)，默认按字符滑动窗口切
+    """
+    filename = os.path.basename(file_path)
+    if chunker is None:
+        chunks = iter_text_chunks(
+            file_path, chunk_size=TECH_CHUNK_SIZE, chunk_overlap=TECH_CHUNK_OVERLAP
+        )
+    else:
+        chunks = chunker(file_path)
+
+    batch = {"ids": [], "documents": [], "metadatas": [], "skip": None}
+    for i, chunk, offsets in chunks:
+        batch["ids"].append(f"tech_{filename}_{i}")
+        batch["documents"].append(chunk)
+        batch["metadatas"].append(_tech_metadata(filename, i, offsets))
+        if len(batch["ids"]) >= batch_size:
+            yield batch
+            batch = {"ids": [], "documents": [], "metadatas": [], "skip": None}
+    if batch["ids"]:
+        yield batch
+
+
+def build_tech_chunks(filename: str, content: str) -> dict:
+    """技术文档 (.md) -> 打上 category: tech"""
+    chunks = split_text(
+        content, chunk_size=TECH_CHUNK_SIZE, chunk_overlap=TECH_CHUNK_OVERLAP
+    )
+
+    # 准备入库数据
+    ids = [f"tech_{filename}_{i}" for i in range(len(chunks))]
+    step = TECH_CHUNK_SIZE - TECH_CHUNK_OVERLAP
+    metadatas = [
+        _tech_metadata(filename, i, (i * step, i * step + len(chunk)))
+        for i, chunk in enumerate(chunks)
+    ]
+    return {"ids": ids, "documents": chunks, "metadatas": metadatas, "skip": None}
+
+
+def build_diary_chunks(filename: str, content: str) -> dict:
+    """日记文件 (.json) -> 打上 category: diary；格式不对时 skip 字段给出原因"""
+    try:
+        data = json.loads(content)  # 假设是 list of dict
+    except ValueError:
+        return {"ids": [], "documents": [], "metadatas": [], "skip": "JSON 解析失败"}
+
+    # 判断是列表还是字典，如果是[]就继续，同理，{}是dict
+    if not isinstance(data, list):
+        return {"ids": [], "documents": [], "metadatas": [], "skip": "格式不是列表"}
+
+    chunks = []
+    ids = []
+    metadatas = []
+
+    # 同时获取角标和对象的写法，从0开始，entry是个dict对象，直接可以get字段
+    for i, entry in enumerate(data):
+        # 把 JSON 对象转成这种易读的字符串
+        # 假设 entry 长这样: {"timestamp": "...", "event": "..."}
+        text_chunk = f"时间: {entry.get('timestamp', '未知')}\n事件: {entry.get('event', str(entry))}"
+
+        chunks.append(text_chunk)
+        ids.append(f"diary_{filename}_{i}")
+
+        # 🔥 关键步骤：打标签！
+        # 明确这是 "diary" 类，主角是 "胖墩墩"
+        metadatas.append({"category": "diary", "subject": "胖墩墩", "source": filename})
+
+    return {"ids": ids, "documents": chunks, "metadatas": metadatas, "skip": None}
+
+
+# 文件类型 -> 解析函数
+CHUNK_BUILDERS = {
+    "tech": build_tech_chunks,
+    "diary": build_diary_chunks,
+}
+
+
+def iter_tech_token_chunks(file_path: str, batch_size: int = 256):
+    """流式处理技术文档 (.md)，按模型 tokenizer 的长度 + 句子边界切片"""
+    return iter_tech_chunks(file_path, batch_size, chunker=iter_token_chunks)
+
+
+# 文件类型 -> 流式切片函数 (这些类型不读整个文件，直接在读文件线程里边读边切)
+STREAMING_CHUNKERS = {
+    "tech": iter_tech_chunks,
+}
+
+# 按 token 切片时用的流式切片函数
+TOKEN_STREAMING_CHUNKERS = {
+    "tech": iter_tech_token_chunks,
+}
+
+
+def build_chunks(kind: str, filename: str, content: str) -> dict:
+    """按文件类型分发 (给进程池用的入口，必须是模块顶层函数才能被 pickle)"""
+    return CHUNK_BUILDERS[kind](filename, content)
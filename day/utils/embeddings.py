@@ -0,0 +1,182 @@
+# utils/embeddings.py
+"""
+本地 Embedding 模型的统一入口。
+
+以前每个脚本都自己 new 一个 SentenceTransformer，同一个进程里 import 几个模块，
+就会把 paraphrase-multilingual-MiniLM-L12-v2 重复加载好几遍。
+现在所有索引脚本、搜索工具、Streamlit 应用都从这里拿 Embedding 函数：
+模型按 (model_name, device) 懒加载，每个进程只加载一次。
+推理后端 (torch / torch-opt / onnx-int8) 见 utils/inference_backends.py。
+"""
+import threading
+
+import numpy as np
+from chromadb import EmbeddingFunction, Documents, Embeddings
+
+from .embedding_cache import EmbeddingCache, make_cache_key
+from .inference_backends import DEFAULT_BACKEND, get_encoder
+
+DEFAULT_MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+
+# 进程级注册表：(model_name, device) -> SentenceTransformer / LocalEmbeddingFunction
+_MODEL_REGISTRY = {}
+_EMBEDDING_FN_REGISTRY = {}
+# 缓存文件路径 -> EmbeddingCache (同一个文件只开一个连接)
+_CACHE_REGISTRY = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_model(model_name: str = DEFAULT_MODEL_NAME, device: str = None):
+    """
+    获取共享的 SentenceTransformer 模型 (首次调用时才加载)。
+    参数:
+        model_name: 模型名称
+        device: 运行设备，例如 "cpu"；None 表示由 sentence-transformers 自动选择
+    """
+    key = (model_name, device)
+    model = _MODEL_REGISTRY.get(key)
+    if model is not None:
+        return model
+
+    with _REGISTRY_LOCK:
+        # 双重检查：防止多个线程同时加载同一个模型
+        model = _MODEL_REGISTRY.get(key)
+        if model is None:
+            # 延迟导入：只导入本模块时不需要付出 torch 的启动开销
+            from sentence_transformers import SentenceTransformer
+
+            print(f"🤖 正在加载本地 Embedding 模型 ({model_name})...")
+            model = SentenceTransformer(model_name, device=device)
+            _MODEL_REGISTRY[key] = model
+    return model
+
+
+class LocalEmbeddingFunction(EmbeddingFunction):
+    """
+    给 ChromaDB 用的本地 Embedding 函数，底层模型来自进程级注册表。
+    传入 cache (EmbeddingCache) 后，只有缓存未命中的文本才会送去 encode。
+
+    返回的是 (n, dim) 的 float32 矩阵，不再逐个 tolist() 成 Python float，
+    Chroma / 缓存 / 相似度计算都直接吃这个矩阵。
+    normalize=True 时在 encode 阶段就做 L2 归一化 (之后点积 = 余弦相似度)；
+    ⚠️ 已有集合是用未归一化的向量建的，切换前要重建索引。
+    backend 选择 CPU 推理后端，None 表示读环境变量 RAG_EMBED_BACKEND (默认 torch)。
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL_NAME,
+        device: str = None,
+        cache: EmbeddingCache = None,
+        normalize: bool = False,
+        backend: str = None,
+    ):
+        self.model_name = model_name
+        self.device = device
+        self.cache = cache
+        self.normalize = normalize
+        self.backend = backend or DEFAULT_BACKEND
+        # 多进程 encode 池 (utils/encode_pool.py)，由索引脚本挂上
+        self.encode_pool = None
+        self._namespace = None
+
+    @property
+    def model(self):
+        return get_model(self.model_name, self.device)
+
+    @property
+    def encoder(self):
+        return get_encoder(self.model, self.model_name, self.backend)
+
+    @property
+    def _cache_namespace(self) -> str:
+        """
+        缓存 key 里要区分是否归一化、用的哪个后端 (int8 量化的向量有细微差别)，否则会互相串。
+        后端取 encoder 实际用的那个：一致性检查没过退回 torch 时，算出来的就是 torch 的向量
+        """
+        if self._namespace is None:
+            namespace = self.model_name + ("|l2" if self.normalize else "")
+            # 请求的就是 torch 时不用为了拿名字去加载模型
+            if self.backend != "torch" and self.encoder.backend != "torch":
+                namespace += f"|{self.encoder.backend}"
+            self._namespace = namespace
+        return self._namespace
+
+    def use_pool(self, pool) -> None:
+        """挂上 / 摘掉 (传 None) 多进程 encode 池；之后缓存没命中的文本都交给池子算"""
+        self.encode_pool = pool
+
+    def __call__(self, input: Documents) -> Embeddings:
+        if self.cache is None:
+            return self.encode(input)
+        return self._encode_with_cache(input)
+
+    def encode(self, texts: list) -> np.ndarray:
+        """直接调用推理后端 (挂了 encode 池就交给池子)，返回连续内存的 float32 矩阵"""
+        if self.encode_pool is not None:
+            return self.encode_pool.encode(texts)
+        return self.encoder.encode(texts, normalize=self.normalize)
+
+    def _encode_with_cache(self, texts: Documents) -> np.ndarray:
+        """先查缓存，未命中的文本去重后一次性 encode，再写回缓存"""
+        keys = [make_cache_key(self._cache_namespace, t) for t in texts]
+        found = self.cache.get_many(keys)
+
+        # 同一批里重复的文本只算一次；规范化只用来算缓存 key，encode 的是原文，
+        # 这样挂不挂缓存 (索引端挂、查询端不挂) 同一段文本得到的向量都一样
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        if missing:
+            vectors = self.encode(list(missing.values()))
+            new_items = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(new_items)
+            found.update(new_items)
+
+        # 直接拼成一个矩阵，避免中间再产生 Python list
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def name(self):
+        # ⚠️ 已有集合都是用这个名字建的，改了 Chroma 会认为是另一个模型
+        return "local_sentence_transformer_v2"
+
+
+def get_embedding_cache(path: str) -> EmbeddingCache:
+    """获取共享的磁盘缓存 (同一个路径返回同一个实例)"""
+    with _REGISTRY_LOCK:
+        cache = _CACHE_REGISTRY.get(path)
+        if cache is None:
+            cache = EmbeddingCache(path)
+            _CACHE_REGISTRY[path] = cache
+    return cache
+
+
+def get_embedding_function(
+    model_name: str = DEFAULT_MODEL_NAME,
+    device: str = None,
+    cache_path: str = None,
+    normalize: bool = False,
+    backend: str = None,
+) -> LocalEmbeddingFunction:
+    """
+    获取共享的 Chroma Embedding 函数 (同一组参数返回同一个实例)。
+    参数:
+        cache_path: 磁盘缓存文件路径，例如 "rst/embedding_cache.sqlite3"；None 表示不用缓存
+        normalize: 是否在 encode 时做 L2 归一化
+        backend: CPU 推理后端 ("torch" / "torch-opt" / "onnx-int8")，None 表示读 RAG_EMBED_BACKEND
+    """
+    cache = get_embedding_cache(cache_path) if cache_path else None
+    backend = backend or DEFAULT_BACKEND
+    key = (model_name, device, cache_path, normalize, backend)
+    with _REGISTRY_LOCK:
+        embedding_fn = _EMBEDDING_FN_REGISTRY.get(key)
+        if embedding_fn is None:
+            embedding_fn = LocalEmbeddingFunction(
+                model_name, device, cache, normalize, backend
+            )
+            _EMBEDDING_FN_REGISTRY[key] = embedding_fn
+    return embedding_fn
@@ -0,0 +1,132 @@
+# utils/encode_pool.py
+"""
+多进程 encode 池：全量重建 rst/ 索引时，把一批碎片切成小片分给 N 个 encode 进程。
+
+单个 SentenceTransformer.encode 只靠 intra-op 线程并行，分词、pooling 这些 Python 代码还是单核，
+32 核的机器跑不满。这里起 N 个 worker 进程，每个进程只加载一次模型、只用 cpu_count / N 个线程，
+主进程按片分发、按原顺序拼回结果。
+用法 (配合 LocalEmbeddingFunction，缓存命中的文本不会送进池子)：
+    with EncodePool(workers=8) as pool:
+        embedding_fn.use_pool(pool)
+        ...
+"""
+import math
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+from . import inference_backends
+from .embeddings import DEFAULT_MODEL_NAME
+
+# 每片至少多少条：太小的话进程间传数据的开销比 encode 还大
+MIN_SHARD_SIZE = 32
+
+# worker 进程里的 Embedding 函数 (每个进程一份)
+_WORKER_FN = None
+
+
+def _init_worker(model_name, normalize, backend, threads):
+    """worker 进程启动时执行一次：限制线程数、加载模型"""
+    global _WORKER_FN
+    # Ctrl+C 只让主进程处理，由主进程统一关池，避免子进程各自打印一堆 traceback
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # 每个进程只用自己那一份核，N 个进程加起来正好用满，不互相抢
+    inference_backends.NUM_THREADS = threads
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    from .embeddings import get_embedding_function
+
+    _WORKER_FN = get_embedding_function(model_name, normalize=normalize, backend=backend)
+    _WORKER_FN.encode(["warm up"])  # 把模型加载放在启动阶段，不算进第一片的耗时
+
+
+def _encode_shard(texts):
+    return _WORKER_FN.encode(texts)
+
+
+class EncodePool:
+    """
+    参数:
+        workers: encode 进程数
+        model_name / normalize / backend: 和主进程的 LocalEmbeddingFunction 保持一致
+        threads_per_worker: 每个进程的 intra-op 线程数，默认 cpu_count // workers
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        model_name: str = DEFAULT_MODEL_NAME,
+        normalize: bool = False,
+        backend: str = None,
+        threads_per_worker: int = None,
+    ):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or max(
+            1, (os.cpu_count() or 1) // workers
+        )
+        backend = backend or inference_backends.DEFAULT_BACKEND
+        if backend != "torch":
+            # 先在主进程把后端产物 (traced.pt / model.int8.onnx) 建好：
+            # 否则模型缓存目录是空的时候，N 个 worker 会同时 trace / 导出同一个文件
+            from .embeddings import get_model
+
+            inference_backends.get_encoder(get_model(model_name), model_name, backend)
+        # spawn：不继承主进程里已经加载的模型 / 打开的数据库连接
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, normalize, backend, self.threads_per_worker),
+        )
+        self.total_docs = 0
+        self.total_shards = 0
+        self.encode_seconds = 0.0
+        print(
+            f"🏭 启动 {workers} 个 encode 进程 (每个 {self.threads_per_worker} 个线程)..."
+        )
+
+    def encode(self, texts: list):
+        """切片分发给 worker，按原顺序拼回 (n, dim) 的 float32 矩阵"""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        shard_size = max(MIN_SHARD_SIZE, math.ceil(len(texts) / self.workers))
+        shards = [texts[i : i + shard_size] for i in range(0, len(texts), shard_size)]
+
+        start = time.perf_counter()
+        # executor.map 按提交顺序返回结果，天然保证顺序
+        results = list(self._executor.map(_encode_shard, shards))
+        self.encode_seconds += time.perf_counter() - start
+        self.total_docs += len(texts)
+        self.total_shards += len(shards)
+        return np.vstack(results)
+
+    def close(self, cancel: bool = False) -> None:
+        """等正在跑的片跑完再关；cancel=True 时丢掉还没开始的片 (出错 / Ctrl+C 时用)"""
+        self._executor.shutdown(wait=True, cancel_futures=cancel)
+
+    def report(self) -> dict:
+        return {
+            "workers": self.workers,
+            "docs": self.total_docs,
+            "shards": self.total_shards,
+            "encode_seconds": self.encode_seconds,
+            "docs_per_sec": (
+                self.total_docs / self.encode_seconds if self.encode_seconds else 0.0
+            ),
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(cancel=exc_type is not None)
+        return False
@@ -0,0 +1,158 @@
+# utils/genai_client.py
+"""
+进程级共享的 genai.Client。
+
+以前每个助手 (CodeAssistant / ProjectAssistant / Agent / StreamlitAgent ...) 都自己 new 一个 genai.Client，
+day05_gemini.py 的三个角色就是三套连接池，Streamlit 每开一个会话又多一套；
+每套连接池第一次请求都要重新 TCP + TLS 握手，这部分延迟每个角色都要付一遍。
+现在按 (api_key, http_options) 共享同一个客户端：
+    同步调用 (client.models) 和异步调用 (client.aio.models) 各有一个 keep-alive 连接池，所有助手共用
+    连接池大小可配 (环境变量 RAG_GENAI_MAX_CONNECTIONS / RAG_GENAI_MAX_KEEPALIVE / RAG_GENAI_KEEPALIVE_EXPIRY)
+    warm_up_genai_client() 提前把 TLS 连接建好；进程退出时自动关闭连接池
+⚠️ 异步连接池绑定在第一次使用它的事件循环上。异步程序结束前请 await aclose_genai_clients()，
+   之后再 asyncio.run 新的事件循环会拿到新的客户端。
+"""
+import asyncio
+import atexit
+import json
+import os
+import threading
+
+import httpx
+from google import genai
+from google.genai import types
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com/"
+MAX_CONNECTIONS = int(os.environ.get("RAG_GENAI_MAX_CONNECTIONS", 20))
+MAX_KEEPALIVE = int(os.environ.get("RAG_GENAI_MAX_KEEPALIVE", 10))
+KEEPALIVE_EXPIRY = float(os.environ.get("RAG_GENAI_KEEPALIVE_EXPIRY", 60))
+# 预热请求的超时：连接池本身不设超时，网络被黑洞时预热不能跟着一直卡住
+WARM_UP_TIMEOUT = float(os.environ.get("RAG_GENAI_WARM_UP_TIMEOUT", 3))
+
+# (api_key, http_options, 连接池大小) -> _PooledClient
+_CLIENT_REGISTRY = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _options_dict(http_options) -> dict:
+    """http_options 可以是 dict 或 types.HttpOptions，统一成 dict"""
+    if http_options is None:
+        return {}
+    if isinstance(http_options, dict):
+        return dict(http_options)
+    return http_options.model_dump(exclude_none=True)
+
+
+class _PooledClient:
+    """一个 genai.Client + 它用的两个 httpx 连接池 (同步 / 异步)"""
+
+    def __init__(self, api_key, options: dict, limits: httpx.Limits):
+        self.base_url = options.get("base_url") or DEFAULT_BASE_URL
+        # timeout=None：超时交给 genai 按 http_options.timeout 控制，不用 httpx 默认的 5 秒
+        self.httpx_client = httpx.Client(limits=limits, timeout=None)
+        self.httpx_async_client = httpx.AsyncClient(limits=limits, timeout=None)
+        self.client = genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(
+                **options,
+                httpx_client=self.httpx_client,
+                httpx_async_client=self.httpx_async_client,
+            ),
+        )
+
+    def close(self) -> None:
+        self.httpx_client.close()
+        if not self.httpx_async_client.is_closed:
+            try:
+                # 进程退出时事件循环一般已经没了，临时起一个关掉；原来的循环关了的话连接由系统回收
+                asyncio.run(self.httpx_async_client.aclose())
+            except Exception:
+                pass
+
+    async def aclose(self) -> None:
+        self.httpx_client.close()
+        await self.httpx_async_client.aclose()
+
+
+def get_genai_client(
+    api_key: str = None,
+    http_options=None,
+    max_connections: int = None,
+    max_keepalive: int = None,
+):
+    """
+    获取共享的 genai.Client (同一个 api_key + http_options + 连接池大小返回同一个实例)。
+    参数:
+        api_key: 省略时读环境变量 GEMINI_API_KEY
+        http_options: 同 genai.Client 的 http_options (dict 或 types.HttpOptions)，例如 {"api_version": "v1alpha"}
+        max_connections / max_keepalive: 连接池上限，省略时用环境变量配置
+    """
+    api_key = api_key or os.environ.get("GEMINI_API_KEY")
+    options = _options_dict(http_options)
+    limits = httpx.Limits(
+        max_connections=max_connections or MAX_CONNECTIONS,
+        max_keepalive_connections=max_keepalive or MAX_KEEPALIVE,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+    key = (
+        api_key,
+        json.dumps(options, sort_keys=True, default=str),
+        limits.max_connections,
+        limits.max_keepalive_connections,
+    )
+    with _REGISTRY_LOCK:
+        pooled = _CLIENT_REGISTRY.get(key)
+        if pooled is None:
+            pooled = _PooledClient(api_key, options, limits)
+            _CLIENT_REGISTRY[key] = pooled
+    return pooled.client
+
+
+def _find(client) -> _PooledClient:
+    with _REGISTRY_LOCK:
+        for pooled in _CLIENT_REGISTRY.values():
+            if pooled.client is client:
+                return pooled
+    raise ValueError("这个 client 不是 get_genai_client 创建的")
+
+
+def warm_up_genai_client(client=None, timeout: float = WARM_UP_TIMEOUT) -> bool:
+    """
+    预热同步连接池：提前把 TCP + TLS 连接建好 (只发一个 HEAD，不消耗配额)，
+    第一个真正的请求直接复用 keep-alive 连接。网络不通 / timeout 秒内没连上时返回 False，不影响后续调用。
+    """
+    pooled = _find(client or get_genai_client())
+    try:
+        pooled.httpx_client.head(pooled.base_url, timeout=timeout)
+        return True
+    except httpx.HTTPError:
+        return False
+
+
+async def awarm_up_genai_client(client=None, timeout: float = WARM_UP_TIMEOUT) -> bool:
+    """预热异步连接池 (要在实际使用它的事件循环里调用)，参数同 warm_up_genai_client"""
+    pooled = _find(client or get_genai_client())
+    try:
+        await pooled.httpx_async_client.head(pooled.base_url, timeout=timeout)
+        return True
+    except httpx.HTTPError:
+        return False
+
+
+async def aclose_genai_clients() -> None:
+    """异步程序结束前调用：在当前事件循环里关掉所有连接池，并清空注册表"""
+    with _REGISTRY_LOCK:
+        pooled_clients = list(_CLIENT_REGISTRY.values())
+        _CLIENT_REGISTRY.clear()
+    for pooled in pooled_clients:
+        await pooled.aclose()
+
+
+@atexit.register
+def close_genai_clients() -> None:
+    """关闭所有连接池 (进程退出时自动调用)"""
+    with _REGISTRY_LOCK:
+        pooled_clients = list(_CLIENT_REGISTRY.values())
+        _CLIENT_REGISTRY.clear()
+    for pooled in pooled_clients:
+        pooled.close()
@@ -0,0 +1,294 @@
+# utils/history.py
+"""
+按 token 预算压缩对话历史。
+
+Agent / AdvancedAgent / StreamlitAgent 的 chat_history 和 ProjectAssistant 的 history 只增不减：
+每一轮都把之前所有 RAG 工具返回的大段原文再发一遍，输入 token 和延迟随会话长度线性上涨。
+HistoryManager.compact() 在每次调模型前检查历史的估算 token 数，超出预算时按顺序压缩：
+    1. 较早轮次 (最近 keep_recent_turns 轮之外) 的工具返回截断成一小段，注明省略了多少字
+    2. 还超的话，把最早的几轮整轮折叠成一条“之前对话的摘要”记忆消息 (放在历史最前面)
+    3. 还超的话，除当前这一轮外所有工具返回都截断
+当前这一轮 (最后一条用户提问之后的内容) 永远不动；删除只按整轮删、截断只改结果内容，
+所以 function_call 和 function_response 始终成对、顺序不变。
+token 是离线估算的 (中日韩字符按 1 个，其他按 4 个字符 1 个)，只用来判断预算和报告省了多少，
+不额外调用 count_tokens 接口。历史可以是 types.Content 列表，也可以是 {"role", "parts"} 字典列表。
+"""
+import os
+import re
+
+from google.genai import types
+
+TOKEN_BUDGET = int(os.environ.get("RAG_HISTORY_TOKEN_BUDGET", 6000))
+KEEP_RECENT_TURNS = int(os.environ.get("RAG_HISTORY_KEEP_TURNS", 2))
+TOOL_OUTPUT_CHARS = 200
+SUMMARY_MAX_CHARS = 2000
+SUMMARY_PREFIX = "【之前对话的摘要】"
+ELIDED_MARK = "…(已省略"
+
+_CJK_RE = re.compile(r"[぀-ヿ㐀-鿿가-힯＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """离线估算 token 数：中日韩字符每个算 1 个，其余每 4 个字符算 1 个"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+# --- 兼容 types.Content 和 dict 两种写法的小工具 ---
+def _role(message) -> str:
+    return message["role"] if isinstance(message, dict) else message.role
+
+
+def _parts(message) -> list:
+    return (message.get("parts") if isinstance(message, dict) else message.parts) or []
+
+
+def _part_field(part, name):
+    return part.get(name) if isinstance(part, dict) else getattr(part, name, None)
+
+
+def _part_text(part) -> str:
+    """一个 part 里对估算 token 有意义的文本"""
+    text = _part_field(part, "text")
+    if text:
+        return text
+    call = _part_field(part, "function_call")
+    if call:
+        return f"{_part_field(call, 'name')}{_part_field(call, 'args')}"
+    response = _part_field(part, "function_response")
+    if response:
+        return f"{_part_field(response, 'name')}{_part_field(response, 'response')}"
+    return ""
+
+
+def message_tokens(message) -> int:
+    return sum(estimate_tokens(_part_text(p)) for p in _parts(message)) + 4
+
+
+def history_tokens(history: list) -> int:
+    return sum(message_tokens(m) for m in history)
+
+
+def _is_user_question(message) -> bool:
+    """用户提问 (不是工具结果，也不是摘要消息)：新一轮从这里开始"""
+    if _role(message) != "user":
+        return False
+    texts = [_part_field(p, "text") for p in _parts(message)]
+    return any(texts) and not any(t and t.startswith(SUMMARY_PREFIX) for t in texts)
+
+
+def _split(history: list):
+    """拆成 (摘要消息, [每一轮的消息列表])；摘要前面的消息不存在，轮次之前的零散消息并进第一轮"""
+    summary = []
+    rest = history
+    if history and not _is_user_question(history[0]) and any(
+        (_part_field(p, "text") or "").startswith(SUMMARY_PREFIX) for p in _parts(history[0])
+    ):
+        # 摘要是一问一答两条：用户侧的摘要 + 模型的确认
+        summary, rest = history[:2], history[2:]
+    turns = []
+    for message in rest:
+        if _is_user_question(message) or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return summary, turns
+
+
+def _summary_text(summary: list) -> str:
+    if not summary:
+        return ""
+    text = _part_field(_parts(summary[0])[0], "text") or ""
+    return text[len(SUMMARY_PREFIX) :].strip()
+
+
+def summarize_turn(turn: list) -> str:
+    """把一轮对话压成一行：问了什么、用了哪些工具、最后怎么答的"""
+    question = next(
+        (_part_field(p, "text") for p in _parts(turn[0]) if _part_field(p, "text")), ""
+    )
+    tools = []
+    answer = ""
+    for message in turn[1:]:
+        for part in _parts(message):
+            call = _part_field(part, "function_call")
+            if call:
+                tools.append(_part_field(call, "name"))
+            elif _role(message) == "model" and _part_field(part, "text"):
+                answer = _part_field(part, "text")
+    line = f"- 用户问: {question.strip()[:80]}"
+    if tools:
+        line += f"；查过: {', '.join(dict.fromkeys(tools))}"
+    if answer:
+        line += f"；回答: {answer.strip()[:120]}"
+    return line
+
+
+class HistoryManager:
+    """
+    参数:
+        token_budget: 发给模型的历史最多多少 token (估算值)
+        keep_recent_turns: 最近几轮完整保留 (工具结果不截断、不折叠进摘要)
+        tool_output_chars: 截断后的工具结果保留多少字
+        summarizer: 把若干轮对话压成摘要的函数 (list[轮] -> str)，省略时逐轮抽取要点 (不调模型)
+    """
+
+    def __init__(
+        self,
+        token_budget: int = TOKEN_BUDGET,
+        keep_recent_turns: int = KEEP_RECENT_TURNS,
+        tool_output_chars: int = TOOL_OUTPUT_CHARS,
+        summarizer=None,
+    ):
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.tool_output_chars = tool_output_chars
+        self.summarizer = summarizer or (
+            lambda turns: "\n".join(summarize_turn(t) for t in turns)
+        )
+        self.reports = []  # 每次 compact 的报告
+        self.total_saved = 0
+        # 不压缩的话历史现在有多少 token：每次把新追加的消息累加上去
+        self._uncompacted_tokens = 0
+        self._seen = 0
+
+    # --- 压缩步骤 ---
+    def _elide_tool_outputs(self, turn: list) -> tuple:
+        """截断一轮里的工具返回，返回 (新的一轮, 截断了几个)"""
+        elided = 0
+        new_turn = []
+        for message in turn:
+            parts = _parts(message)
+            if not any(_part_field(p, "function_response") for p in parts):
+                new_turn.append(message)
+                continue
+            new_parts = []
+            for part in parts:
+                response = _part_field(part, "function_response")
+                short = self._shorten(response) if response else None
+                if short is None:
+                    new_parts.append(part)
+                    continue
+                elided += 1
+                if isinstance(part, dict):
+                    new_parts.append(
+                        {"function_response": {**response, "response": short}}
+                    )
+                else:
+                    new_parts.append(
+                        types.Part(
+                            function_response=types.FunctionResponse(
+                                id=response.id, name=response.name, response=short
+                            )
+                        )
+                    )
+            if isinstance(message, dict):
+                new_turn.append({**message, "parts": new_parts})
+            else:
+                new_turn.append(types.Content(role=message.role, parts=new_parts))
+        return new_turn, elided
+
+    def _shorten(self, response):
+        """工具结果太长时返回截断后的 response dict，不需要截断时返回 None"""
+        payload = _part_field(response, "response") or {}
+        result = str(payload.get("result", payload)) if isinstance(payload, dict) else str(payload)
+        if len(result) <= self.tool_output_chars or ELIDED_MARK in result:
+            return None
+        omitted = len(result) - self.tool_output_chars
+        return {"result": f"{result[: self.tool_output_chars]}{ELIDED_MARK} {omitted} 字)"}
+
+    def _make_summary(self, text: str, like) -> list:
+        text = text[-SUMMARY_MAX_CHARS:]  # 摘要也有上限：太长时丢掉最早的部分
+        user_text = f"{SUMMARY_PREFIX}\n{text}"
+        ack = "好的，我记住了之前的对话要点。"
+        if isinstance(like, dict):
+            return [
+                {"role": "user", "parts": [{"text": user_text}]},
+                {"role": "model", "parts": [{"text": ack}]},
+            ]
+        return [
+            types.Content(role="user", parts=[types.Part.from_text(text=user_text)]),
+            types.Content(role="model", parts=[types.Part.from_text(text=ack)]),
+        ]
+
+    def compact(self, history: list) -> list:
+        """返回压缩后的历史 (没超预算时原样返回)；调用方用返回值替换自己的历史"""
+        if len(history) < self._seen:
+            # 调用方清空 / 换了一份历史，重新计数
+            self._uncompacted_tokens, self._seen = 0, 0
+        self._uncompacted_tokens += history_tokens(history[self._seen :])
+        before = history_tokens(history)
+        report = {
+            "uncompacted": self._uncompacted_tokens,
+            "before": before,
+            "after": before,
+            "saved": self._uncompacted_tokens - before,
+            "elided": 0,
+            "summarized_turns": 0,
+        }
+        if before <= self.token_budget or not history:
+            self._finish(report, history)
+            return history
+
+        summary, turns = _split(history)
+        # 最后一轮是正在进行的 (ReAct 循环还没结束)，永远不动
+        current, done = turns[-1:], turns[:-1]
+        keep = max(self.keep_recent_turns, 0)
+
+        def rebuild():
+            return summary + [m for turn in done + current for m in turn]
+
+        # 1. 较早轮次的工具结果截断
+        for i in range(max(len(done) - keep, 0)):
+            done[i], n = self._elide_tool_outputs(done[i])
+            report["elided"] += n
+        compacted = rebuild()
+
+        # 2. 最早的几轮折叠进摘要
+        fold = 0
+        tokens = history_tokens(compacted)
+        while tokens > self.token_budget and fold < len(done) - keep:
+            tokens -= sum(message_tokens(m) for m in done[fold])
+            fold += 1
+        if fold:
+            text = "\n".join(t for t in (_summary_text(summary), self.summarizer(done[:fold])) if t)
+            summary = self._make_summary(text, history[0])
+            done = done[fold:]
+            report["summarized_turns"] = fold
+            compacted = rebuild()
+
+        # 3. 还超的话，最近几轮的工具结果也截断 (当前这一轮除外)
+        if history_tokens(compacted) > self.token_budget:
+            for i in range(len(done)):
+                done[i], n = self._elide_tool_outputs(done[i])
+                report["elided"] += n
+            compacted = rebuild()
+
+        report["after"] = history_tokens(compacted)
+        report["saved"] = self._uncompacted_tokens - report["after"]
+        self._finish(report, compacted)
+        return compacted
+
+    def _finish(self, report: dict, compacted: list) -> None:
+        self._seen = len(compacted)
+        self.total_saved += report["saved"]
+        self.reports.append(report)
+
+    @property
+    def last_report(self) -> dict:
+        return self.reports[-1] if self.reports else {}
+
+    def format_last_report(self) -> str:
+        """这次请求比不压缩少发了多少 token；没省时返回空字符串"""
+        report = self.last_report
+        if not report.get("saved"):
+            return ""
+        line = (
+            f"🗜️ [History] 本次发送历史 {report['after']} tokens (不压缩是 {report['uncompacted']})，"
+            f"省 {report['saved']}，累计省 {self.total_saved}"
+        )
+        if report["elided"] or report["summarized_turns"]:
+            line += f"；刚截断 {report['elided']} 个工具结果，折叠 {report['summarized_turns']} 轮进摘要"
+        return line
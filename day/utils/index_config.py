@@ -0,0 +1,131 @@
+# utils/index_config.py
+"""
+Chroma 集合的 HNSW 索引配置。
+
+以前 get_or_create_collection 全用 Chroma 默认值 (L2 距离、M=16、ef 都是 100)，
+RAG 脚本里的 “距离 < 30”、“距离 < 25” 这种阈值也是照着 L2 距离拍出来的。
+现在把距离空间和 HNSW 参数写成一个 IndexConfig，建集合时统一传进去，阈值也跟着距离空间走：
+    space: "l2" (默认，和老库兼容) / "cosine"
+    M: 每个节点的邻居数，越大召回越高、索引越大
+    construction_ef: 建索引时的候选队列长度，越大建得越慢、图质量越好
+    search_ef: 查询时的候选队列长度，越大召回越高、查询越慢 (建好之后也能改)
+也可以用环境变量覆盖：RAG_HNSW_SPACE / RAG_HNSW_M / RAG_HNSW_CONSTRUCTION_EF / RAG_HNSW_SEARCH_EF。
+调参用 day10_04_hnsw_tuning.py。
+"""
+import os
+from dataclasses import dataclass, replace
+
+SPACES = ("l2", "cosine")
+
+# 每种距离空间下 “算相关” 的最大距离 (经验值，根据模型调整)
+# l2 是 Chroma 的平方 L2 距离；cosine 是 1 - 余弦相似度
+DEFAULT_MAX_DISTANCE = {"l2": 30.0, "cosine": 0.5}
+
+
+@dataclass(frozen=True)
+class IndexConfig:
+    """一个集合的索引配置 (距离空间 + HNSW 参数)"""
+
+    space: str = "l2"
+    M: int = 16
+    construction_ef: int = 100
+    search_ef: int = 100
+    max_distance: float = None  # None 表示用 DEFAULT_MAX_DISTANCE[space]
+
+    def __post_init__(self):
+        if self.space not in SPACES:
+            raise ValueError(f"未知的距离空间: {self.space} (可选: {' / '.join(SPACES)})")
+
+    @classmethod
+    def from_env(cls, **overrides) -> "IndexConfig":
+        """读环境变量，没设置的用默认值"""
+        config = cls(
+            space=os.environ.get("RAG_HNSW_SPACE", cls.space),
+            M=int(os.environ.get("RAG_HNSW_M", cls.M)),
+            construction_ef=int(
+                os.environ.get("RAG_HNSW_CONSTRUCTION_EF", cls.construction_ef)
+            ),
+            search_ef=int(os.environ.get("RAG_HNSW_SEARCH_EF", cls.search_ef)),
+        )
+        return replace(config, **overrides)
+
+    @property
+    def distance_threshold(self) -> float:
+        """距离小于这个值才算相关"""
+        if self.max_distance is not None:
+            return self.max_distance
+        return DEFAULT_MAX_DISTANCE[self.space]
+
+    def to_chroma(self) -> dict:
+        """转成 get_or_create_collection(configuration=...) 的参数"""
+        return {
+            "hnsw": {
+                "space": self.space,
+                "max_neighbors": self.M,
+                "ef_construction": self.construction_ef,
+                "ef_search": self.search_ef,
+            }
+        }
+
+
+# 进程默认配置
+DEFAULT_INDEX_CONFIG = IndexConfig.from_env()
+
+
+def _existing_hnsw(collection) -> dict:
+    """读已有集合的 HNSW 配置；老版本 Chroma 读不到时返回空 dict"""
+    try:
+        return dict((collection.configuration or {}).get("hnsw") or {})
+    except Exception:
+        return {}
+
+
+def get_or_create_collection(client, name, embedding_function, config=None):
+    """
+    按 IndexConfig 建集合 / 打开已有集合。
+    距离空间、M、construction_ef 建好之后就改不了了：已有集合和配置不一致时只打印提示
+    (要生效得删掉集合重建)；search_ef 可以在线修改，不一致时直接改过来。
+    """
+    config = config or DEFAULT_INDEX_CONFIG
+    collection = client.get_or_create_collection(
+        name=name,
+        embedding_function=embedding_function,
+        configuration=config.to_chroma(),
+    )
+
+    existing = _existing_hnsw(collection)
+    wanted = config.to_chroma()["hnsw"]
+    frozen = [
+        key
+        for key in ("space", "max_neighbors", "ef_construction")
+        if key in existing and existing[key] != wanted[key]
+    ]
+    if frozen:
+        print(
+            f"⚠️ 集合 '{name}' 已按旧配置建好 ({', '.join(f'{k}={existing[k]}' for k in frozen)})，"
+            f"新配置要删掉集合重建后才生效"
+        )
+    if existing.get("ef_search", wanted["ef_search"]) != wanted["ef_search"]:
+        collection.modify(configuration={"hnsw": {"ef_search": wanted["ef_search"]}})
+        print(f"🔧 集合 '{name}' 的 search_ef 已调整为 {wanted['ef_search']}")
+    return collection
+
+
+def collection_space(collection, default: str = None) -> str:
+    """集合实际使用的距离空间；读不到时用 default (省略则用默认配置的 space)"""
+    # NumPy 内存索引自带 space 属性 (固定是 cosine)
+    space = getattr(collection, "space", None)
+    if isinstance(space, str):
+        return space
+    return _existing_hnsw(collection).get("space", default or DEFAULT_INDEX_CONFIG.space)
+
+
+def distance_threshold_for(collection, config=None) -> float:
+    """
+    按集合实际的距离空间给出相关性阈值 (老库是 L2 建的，就算配置改成 cosine 也还得用 L2 阈值)
+    """
+    config = config or DEFAULT_INDEX_CONFIG
+    space = collection_space(collection, config.space)
+    if space == config.space:
+        return config.distance_threshold
+    return DEFAULT_MAX_DISTANCE.get(space, config.distance_threshold)
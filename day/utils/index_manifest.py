@@ -0,0 +1,113 @@
+# utils/index_manifest.py
+"""
+增量索引用的清单 (manifest)。
+
+记录每个源文件的 大小 / 修改时间 / 内容哈希，以及它上次写进向量库的碎片 id。
+重建索引时只处理新增或改过的文件，文件变短或被删掉留下的旧 id 统一批量删除。
+"""
+import hashlib
+import json
+import os
+
+
+def file_sha256(file_path: str) -> str:
+    """分块读取文件计算 sha256，大文件也不会一次性读进内存"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IndexManifest:
+    """
+    参数:
+        path: 清单文件路径，默认放在 rst/chroma_db 旁边
+              (故意不用 .json 后缀，免得被日记索引的 *.json 扫进去)
+        config: 切片配置 (例如 {"chunking": "tokens"})，和上次不一样时所有文件都要重切
+    """
+
+    def __init__(self, path: str = "rst/chroma_db.manifest", config: dict = None):
+        self.path = path
+        self.config = config or {}
+        self.files = {}
+        # is_unchanged 里算过的指纹先暂存，update 时直接用，避免重复哈希
+        self._pending = {}
+        self._config_changed = False
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            self.files = saved.get("files", {})
+            # 切片方式变了：旧 id 还留着 (好在重切后删掉多余的)，但不能再跳过任何文件
+            self._config_changed = bool(self.files) and (
+                saved.get("config", {}) != self.config
+            )
+
+    @staticmethod
+    def _key(file_path: str) -> str:
+        return os.path.normpath(file_path)
+
+    def is_unchanged(self, file_path: str) -> bool:
+        """
+        判断文件自上次索引以来有没有变化。
+        先比 大小+mtime (便宜)，不一致再比内容哈希 (touch 过但内容没变也算没变)。
+        """
+        key = self._key(file_path)
+        stat = os.stat(file_path)
+        fingerprint = {"size": stat.st_size, "mtime": stat.st_mtime}
+
+        entry = None if self._config_changed else self.files.get(key)
+        if entry and entry["size"] == fingerprint["size"]:
+            if entry["mtime"] == fingerprint["mtime"]:
+                return True
+
+        fingerprint["sha256"] = file_sha256(file_path)
+        if entry and entry["sha256"] == fingerprint["sha256"]:
+            # 内容没变，只刷新一下 mtime，下次就走快速路径
+            entry.update(fingerprint)
+            return True
+
+        self._pending[key] = fingerprint
+        return False
+
+    def update(self, file_path: str, ids: list) -> list:
+        """
+        记录文件本次写入的碎片 id，返回上次有、这次没有的孤儿 id (需要从库里删除)。
+        """
+        key = self._key(file_path)
+        fingerprint = self._pending.pop(key, None)
+        if fingerprint is None:
+            stat = os.stat(file_path)
+            fingerprint = {
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "sha256": file_sha256(file_path),
+            }
+
+        old_ids = self.files.get(key, {}).get("ids", [])
+        self.files[key] = {**fingerprint, "ids": list(ids)}
+
+        new_ids = set(ids)
+        return [i for i in old_ids if i not in new_ids]
+
+    def forget_missing(self, existing_paths: list) -> list:
+        """把磁盘上已经不存在的文件移出清单，返回它们留下的所有 id"""
+        existing = {self._key(p) for p in existing_paths}
+        orphan_ids = []
+        for key in list(self.files):
+            if key not in existing:
+                orphan_ids.extend(self.files.pop(key).get("ids", []))
+        return orphan_ids
+
+    def save(self) -> None:
+        """先写临时文件再替换，避免中途崩溃把清单写坏"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"config": self.config, "files": self.files},
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+        os.replace(tmp_path, self.path)
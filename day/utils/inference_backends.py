@@ -0,0 +1,292 @@
+# utils/inference_backends.py
+"""
+本地 Embedding 模型的 CPU 推理后端。
+
+索引时大部分时间都花在 SentenceTransformer.encode 上 (默认线程数、eager 模式)，机器又没有 GPU。
+这里提供几种可切换的后端 (环境变量 RAG_EMBED_BACKEND，或 get_embedding_function(backend=...))：
+    torch (默认): 原来的 SentenceTransformer.encode
+    torch-opt: inference_mode + 调好的 intra-op 线程数 + torch.jit.trace 过的 Transformer (缓存到磁盘)
+    onnx-int8: 导出 ONNX 后做动态 int8 量化，用 ONNX Runtime 跑 (需要 pip install onnx onnxruntime)
+非默认后端第一次创建时会自动做一致性检查：和 torch 后端的向量余弦相似度 >= 0.99 才启用，
+否则打印警告并退回 torch 后端。吞吐对比用 day07_embedding_backends.py。
+"""
+import os
+import threading
+import time
+
+import numpy as np
+
+BACKENDS = ("torch", "torch-opt", "onnx-int8")
+DEFAULT_BACKEND = os.environ.get("RAG_EMBED_BACKEND", "torch")
+# 导出的 ONNX / TorchScript 模型放这里，下次启动直接加载
+MODEL_CACHE_DIR = os.environ.get("RAG_MODEL_CACHE_DIR", "rst/model_cache")
+# intra-op 线程数，默认用满所有核
+NUM_THREADS = int(os.environ.get("RAG_EMBED_THREADS", os.cpu_count() or 1))
+PARITY_MIN_COSINE = 0.99
+
+# 一致性检查用的样例 (日记、技术文档、中英混合、长短都有)
+PARITY_TEXTS = [
+    "胖墩墩最爱吃的是水煮鸡胸肉，每次看到都会流口水。",
+    "今天天气不错，赵一清带胖墩墩在草地上接到了三次飞盘。",
+    "胖墩墩非常讨厌洗澡，每次去宠物店都要躲在床底下。",
+    "Redis 的 Lua 脚本可以保证多个命令的原子性执行。",
+    "ChromaDB 默认用 HNSW 索引，距离空间是 L2。",
+    "RAG = Retrieval Augmented Generation，先检索再生成。",
+    "系统架构分为接入层、服务层和存储层，服务之间通过消息队列解耦。",
+    "How do I tune the HNSW search_ef parameter?",
+    "好",
+    "时间: 2026-01-10 16:19\n事件: 胖墩墩在小区楼下去公园散步，特别开心。",
+]
+
+_ENCODER_REGISTRY = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _mean_pool(token_embeddings: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """和 sentence-transformers 的 mean pooling 一致：只对有效 token 求平均"""
+    mask = attention_mask[..., None].astype(np.float32)
+    summed = (token_embeddings * mask).sum(axis=1)
+    return summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+
+def _l2_normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.clip(norms, 1e-12, None)
+
+
+class TorchEncoder:
+    """原来的 SentenceTransformer.encode (参照基准)"""
+
+    backend = "torch"
+
+    def __init__(self, model):
+        self.model = model
+
+    def encode(self, texts: list, normalize: bool = False) -> np.ndarray:
+        embeddings = self.model.encode(
+            texts, convert_to_numpy=True, normalize_embeddings=normalize
+        )
+        return np.asarray(embeddings, dtype=np.float32)
+
+
+class _TokenizedEncoder:
+    """自己分词 + 跑 Transformer + mean pooling 的后端的公共部分"""
+
+    batch_size = 64
+
+    def __init__(self, model):
+        pooling = model[1]
+        if getattr(pooling, "get_pooling_mode_str", lambda: "mean")() != "mean":
+            raise ValueError("只支持 mean pooling 的模型")
+        self.tokenizer = model.tokenizer
+        self.max_seq_length = model.max_seq_length
+
+    def _tokenize(self, texts: list, return_tensors: str):
+        return self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors=return_tensors,
+        )
+
+    def encode(self, texts: list, normalize: bool = False) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        # 按长度排序后分批，padding 最少；最后按原顺序放回
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        chunks = []
+        for start in range(0, len(order), self.batch_size):
+            batch = [texts[i] for i in order[start : start + self.batch_size]]
+            chunks.append(self._encode_batch(batch))
+        embeddings = np.empty((len(texts), chunks[0].shape[1]), dtype=np.float32)
+        embeddings[order] = np.vstack(chunks)
+        return _l2_normalize(embeddings) if normalize else embeddings
+
+
+class TorchOptimizedEncoder(_TokenizedEncoder):
+    """inference_mode + 固定线程数 + TorchScript (trace 一次，缓存到磁盘)"""
+
+    backend = "torch-opt"
+
+    def __init__(self, model, model_name: str, num_threads: int = None):
+        import torch
+
+        super().__init__(model)
+        torch.set_num_threads(num_threads or NUM_THREADS)
+        self._torch = torch
+        self._module = self._load_traced(model, model_name)
+
+    def _load_traced(self, model, model_name):
+        torch = self._torch
+        path = os.path.join(MODEL_CACHE_DIR, model_name.replace("/", "_"), "traced.pt")
+        if os.path.exists(path):
+            return torch.jit.load(path, map_location="cpu").eval()
+
+        print(f"🔧 正在 trace {model_name} (只需一次)...")
+        transformer = model[0].auto_model.eval()
+        example = self._tokenize(PARITY_TEXTS[:2], "pt")
+        with torch.inference_mode():
+            traced = torch.jit.trace(
+                transformer,
+                (example["input_ids"], example["attention_mask"]),
+                strict=False,
+                check_trace=False,
+            )
+        traced = torch.jit.freeze(traced.eval())
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再原子替换：别的进程同时加载时不会读到写了一半的文件
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        torch.jit.save(traced, tmp_path)
+        os.replace(tmp_path, path)
+        return traced
+
+    def _encode_batch(self, batch: list) -> np.ndarray:
+        features = self._tokenize(batch, "pt")
+        with self._torch.inference_mode():
+            output = self._module(features["input_ids"], features["attention_mask"])
+        # HF 模型 trace 后输出是 dict 或 tuple，第一个都是 last_hidden_state
+        hidden = output["last_hidden_state"] if isinstance(output, dict) else output[0]
+        return _mean_pool(hidden.numpy(), features["attention_mask"].numpy())
+
+
+class OnnxInt8Encoder(_TokenizedEncoder):
+    """ONNX Runtime + 动态 int8 量化 (权重 int8，激活运行时量化)"""
+
+    backend = "onnx-int8"
+
+    def __init__(self, model, model_name: str, num_threads: int = None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError(
+                "onnx-int8 后端需要 onnx 和 onnxruntime：pip install onnx onnxruntime"
+            ) from e
+
+        super().__init__(model)
+        path = self._export(model, model_name)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads or NUM_THREADS
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = ort.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self._session.get_inputs()}
+
+    def _export(self, model, model_name) -> str:
+        directory = os.path.join(MODEL_CACHE_DIR, model_name.replace("/", "_"))
+        fp32_path = os.path.join(directory, "model.onnx")
+        int8_path = os.path.join(directory, "model.int8.onnx")
+        if os.path.exists(int8_path):
+            return int8_path
+
+        import torch
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print(f"🔧 正在导出 {model_name} 为 ONNX 并做 int8 量化 (只需一次)...")
+        os.makedirs(directory, exist_ok=True)
+        transformer = model[0].auto_model.eval()
+        example = self._tokenize(PARITY_TEXTS[:2], "pt")
+        dynamic = {0: "batch", 1: "sequence"}
+        # 先写临时文件，量化完再原子替换：别的进程看到 int8_path 存在时它一定是完整的
+        tmp_fp32, tmp_int8 = (f"{p}.{os.getpid()}.tmp" for p in (fp32_path, int8_path))
+        with torch.inference_mode():
+            torch.onnx.export(
+                transformer,
+                (example["input_ids"], example["attention_mask"]),
+                tmp_fp32,
+                input_names=["input_ids", "attention_mask"],
+                output_names=["last_hidden_state"],
+                dynamic_axes={
+                    "input_ids": dynamic,
+                    "attention_mask": dynamic,
+                    "last_hidden_state": dynamic,
+                },
+                opset_version=14,
+            )
+        quantize_dynamic(tmp_fp32, tmp_int8, weight_type=QuantType.QInt8)
+        os.replace(tmp_fp32, fp32_path)
+        os.replace(tmp_int8, int8_path)
+        return int8_path
+
+    def _encode_batch(self, batch: list) -> np.ndarray:
+        features = self._tokenize(batch, "np")
+        inputs = {
+            name: features[name].astype(np.int64)
+            for name in ("input_ids", "attention_mask")
+            if name in self._input_names
+        }
+        hidden = self._session.run(["last_hidden_state"], inputs)[0]
+        return _mean_pool(hidden, features["attention_mask"])
+
+
+def parity_check(encoder, reference, texts=PARITY_TEXTS) -> dict:
+    """和参照后端逐条比余弦相似度"""
+    a = _l2_normalize(encoder.encode(list(texts)))
+    b = _l2_normalize(reference.encode(list(texts)))
+    cosine = (a * b).sum(axis=1)
+    return {
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+        "passed": bool(cosine.min() >= PARITY_MIN_COSINE),
+    }
+
+
+def throughput(encoder, texts: list, repeat: int = 3) -> float:
+    """每秒能 encode 多少条 (取 repeat 次里最快的一次)"""
+    encoder.encode(texts[:8])  # 预热
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encoder.encode(texts)
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / best
+
+
+def create_encoder(model, model_name: str, backend: str):
+    """新建一个后端 (不走注册表、不做一致性检查)"""
+    if backend == "torch":
+        return TorchEncoder(model)
+    if backend == "torch-opt":
+        return TorchOptimizedEncoder(model, model_name)
+    if backend == "onnx-int8":
+        return OnnxInt8Encoder(model, model_name)
+    raise ValueError(f"未知的推理后端: {backend} (可选: {' / '.join(BACKENDS)})")
+
+
+def get_encoder(model, model_name: str, backend: str = None):
+    """
+    获取共享的推理后端 (同一个模型 + 后端只建一次)。
+    非默认后端第一次创建时做一致性检查，不达标就退回 torch。
+    """
+    backend = backend or DEFAULT_BACKEND
+    key = (model_name, backend)
+    encoder = _ENCODER_REGISTRY.get(key)
+    if encoder is not None:
+        return encoder
+
+    with _REGISTRY_LOCK:
+        encoder = _ENCODER_REGISTRY.get(key)
+        if encoder is None:
+            reference = TorchEncoder(model)
+            if backend == "torch":
+                encoder = reference
+            else:
+                try:
+                    encoder = create_encoder(model, model_name, backend)
+                    report = parity_check(encoder, reference)
+                    if report["passed"]:
+                        print(
+                            f"✅ [{backend}] 一致性检查通过 (最小余弦 {report['min_cosine']:.4f})"
+                        )
+                    else:
+                        print(
+                            f"⚠️ [{backend}] 一致性检查没通过 (最小余弦 {report['min_cosine']:.4f} "
+                            f"< {PARITY_MIN_COSINE})，退回 torch 后端"
+                        )
+                        encoder = reference
+                except Exception as e:
+                    print(f"⚠️ [{backend}] 后端初始化失败，退回 torch 后端: {e}")
+                    encoder = reference
+            _ENCODER_REGISTRY[key] = encoder
+    return encoder
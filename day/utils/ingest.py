@@ -0,0 +1,217 @@
+# utils/ingest.py
+"""
+跨文件的批量入库。
+
+以前索引脚本每个文件 upsert 一次，小日记文件一次只 encode 1~5 条，CPU 的向量化能力根本吃不满。
+BulkIngestor 把多个文件的碎片攒成大批 (默认 512 条)，按长度排序后一次 encode、一次 upsert。
+run_file_pipeline 把 读文件 / 解析切片 / 写库 拆成三段流水线，前两段并行，写库只有一个线程。
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .chunking import STREAMING_CHUNKERS, build_chunks
+
+
+class BulkIngestor:
+    """
+    参数:
+        collection: 目标 Chroma 集合
+        embedding_fn: 用来算向量的 Embedding 函数 (一般就是集合自己的那个)
+        batch_size: 攒够多少条碎片就写一次库，建议 256~1024
+        lexical_index: 可选的关键词倒排索引 (utils.lexical_index)，和向量库同步写入
+    """
+
+    def __init__(
+        self, collection, embedding_fn, batch_size: int = 512, lexical_index=None
+    ):
+        self.collection = collection
+        self.embedding_fn = embedding_fn
+        self.batch_size = batch_size
+        self.lexical_index = lexical_index
+
+        self._ids = []
+        self._documents = []
+        self._metadatas = []
+
+        self.total_docs = 0
+        self.total_batches = 0
+        self.encode_seconds = 0.0
+        self.upsert_seconds = 0.0
+        self._started_at = None
+
+    def add(self, ids: list, documents: list, metadatas: list) -> None:
+        """加入一批碎片 (通常是一个文件的全部碎片)，攒够 batch_size 就自动写库"""
+        if self._started_at is None:
+            self._started_at = time.perf_counter()
+
+        self._ids.extend(ids)
+        self._documents.extend(documents)
+        self._metadatas.extend(metadatas)
+
+        while len(self._ids) >= self.batch_size:
+            self._flush_batch(self.batch_size)
+
+    def flush(self) -> None:
+        """把缓冲区里剩下的碎片全部写库"""
+        while self._ids:
+            self._flush_batch(self.batch_size)
+
+    def _flush_batch(self, size: int) -> None:
+        ids = self._ids[:size]
+        documents = self._documents[:size]
+        metadatas = self._metadatas[:size]
+        del self._ids[:size], self._documents[:size], self._metadatas[:size]
+
+        # 按文本长度排序：长度相近的放一起，encode 时 padding 最少
+        order = sorted(range(len(documents)), key=lambda i: len(documents[i]))
+        ids = [ids[i] for i in order]
+        documents = [documents[i] for i in order]
+        metadatas = [metadatas[i] for i in order]
+
+        start = time.perf_counter()
+        embeddings = self.embedding_fn(documents)
+        self.encode_seconds += time.perf_counter() - start
+
+        # 已经算好向量了 (float32 矩阵)，直接传给 upsert，Chroma 不会再 encode 一遍
+        start = time.perf_counter()
+        self.collection.upsert(
+            ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings
+        )
+        if self.lexical_index is not None:
+            self.lexical_index.upsert(ids, documents, metadatas)
+        self.upsert_seconds += time.perf_counter() - start
+
+        self.total_docs += len(ids)
+        self.total_batches += 1
+        print(f"   📦 第 {self.total_batches} 批入库: {len(ids)} 条碎片")
+
+    def report(self) -> dict:
+        """吞吐量统计"""
+        elapsed = (
+            time.perf_counter() - self._started_at if self._started_at else 0.0
+        )
+        return {
+            "docs": self.total_docs,
+            "batches": self.total_batches,
+            "seconds": elapsed,
+            "encode_seconds": self.encode_seconds,
+            "upsert_seconds": self.upsert_seconds,
+            "docs_per_sec": self.total_docs / elapsed if elapsed else 0.0,
+        }
+
+
+def _read_text(file_path: str) -> str:
+    with open(file_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _empty_result(partial: bool) -> dict:
+    return {"ids": [], "documents": [], "metadatas": [], "skip": None, "partial": partial}
+
+
+def _iter_file_results(file_path: str, kind: str, parse, streaming_chunkers):
+    """
+    把一个文件变成一串结果：流式类型边读边产出 partial=True 的分片，最后补一个 partial=False 收尾；
+    其他类型整读后交给 parse (本地函数或进程池) 一次性切完。
+    """
+    if kind in streaming_chunkers:
+        for piece in streaming_chunkers[kind](file_path):
+            yield {**piece, "partial": True}
+        yield _empty_result(partial=False)
+    else:
+        result = parse(kind, os.path.basename(file_path), _read_text(file_path))
+        yield {**result, "partial": False}
+
+
+def run_file_pipeline(
+    tasks,
+    on_result,
+    workers: int = 4,
+    queue_size: int = 64,
+    streaming_chunkers: dict = None,
+):
+    """
+    分阶段并行处理文件：
+        线程池 (读文件, I/O 密集) -> 进程池 (JSON 解析 + 切片, CPU 密集) -> 有界队列 -> 单一写入方
+    Markdown 这类流式类型不进进程池，读文件线程边读边切，切出一批就往队列里送一批。
+    参数:
+        tasks: [(file_path, kind), ...]，kind 为 "tech" / "diary"
+        on_result: 写入回调 on_result(file_path, kind, result, error)，只在调用方线程里执行，
+                   Embedding 和 Chroma upsert 都在这里做，不需要加锁。
+                   同一个文件可能收到多次 result["partial"] = True 的分片，
+                   最后一定会收到一次 partial = False (或 error) 表示这个文件结束
+        workers: 读文件线程数 / 解析进程数
+        queue_size: 队列里最多积压多少批结果，写库慢时前面的阶段会被阻塞 (背压)
+        streaming_chunkers: 文件类型 -> 流式切片函数，默认按字符切 (STREAMING_CHUNKERS)
+    """
+    if streaming_chunkers is None:
+        streaming_chunkers = STREAMING_CHUNKERS
+
+    if workers <= 1:
+        # 单核模式：不开池子，按顺序处理，省掉进程间传输的开销
+        for file_path, kind in tasks:
+            pieces = _iter_file_results(file_path, kind, build_chunks, streaming_chunkers)
+            while True:
+                # 只有读文件 / 切片出错才算这个文件的错；on_result (写库) 的异常直接往上抛，
+                # 否则一批 upsert 失败会被记在碰巧触发 flush 的文件头上，同批的其他文件却已记进清单
+                try:
+                    result = next(pieces)
+                except StopIteration:
+                    break
+                except Exception as e:
+                    on_result(file_path, kind, None, e)
+                    break
+                on_result(file_path, kind, result, None)
+        return
+
+    results = queue.Queue(maxsize=queue_size)
+    # 写入方出错时置位：读文件线程不再往队列里塞结果，尽快退出，池子才能正常关闭
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        """队列满了就等着 (背压)，但每隔一会儿看一眼 stop；返回 False 表示该停了"""
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    with ProcessPoolExecutor(max_workers=workers) as parse_pool:
+
+        def parse_in_pool(kind, filename, content):
+            return parse_pool.submit(build_chunks, kind, filename, content).result()
+
+        def read_and_parse(file_path, kind):
+            # 跑在读文件线程里：结果放进有界队列，队列满了就在这里等着
+            try:
+                for result in _iter_file_results(
+                    file_path, kind, parse_in_pool, streaming_chunkers
+                ):
+                    if not put((file_path, kind, result, None)):
+                        return
+            except Exception as e:
+                put((file_path, kind, None, e))
+
+        with ThreadPoolExecutor(max_workers=workers) as read_pool:
+            for file_path, kind in tasks:
+                read_pool.submit(read_and_parse, file_path, kind)
+
+            # 单一写入方：按到达顺序消费，直到每个文件都收尾
+            finished = 0
+            try:
+                while finished < len(tasks):
+                    file_path, kind, result, error = results.get()
+                    if error is not None or not result["partial"]:
+                        finished += 1
+                    on_result(file_path, kind, result, error)
+            except BaseException:
+                # 写库失败 / Ctrl+C：还没开始的文件不读了，正在等队列的线程收到 stop 后退出，
+                # 否则 with 退出时的 shutdown(wait=True) 会一直等着塞不进满队列的读线程
+                stop.set()
+                read_pool.shutdown(wait=False, cancel_futures=True)
+                raise
@@ -0,0 +1,387 @@
+# utils/lexical_index.py
+"""
+关键词倒排索引 (BM25) + 向量检索的混合检索。
+
+“胖墩墩”、“赵一清”、“Redis Lua” 这种专有名词，MiniLM 的向量检索经常找不准，只能把 n_results 调大，
+prompt 也跟着变长。这里给 categorized_memory 的每个碎片同时建一份倒排索引：
+    - 中文：连续汉字切成 2 字组 (bigram)，单字词保留单字
+    - 英文/数字：按单词切，统一小写
+查询时把 BM25 和向量检索的排名用 RRF (Reciprocal Rank Fusion) 融合；
+如果关键词已经能确定答案 (有足够多的碎片包含全部查询词)，就直接返回，连 encode 都省了。
+要过相关性闸门的调用方 (day11 的 query_rag_system) 传 fill_distances=True：
+只有关键词命中的碎片按入库时的向量补算出和问题的距离，闸门看的始终是向量距离
+(只共享了 “怎么”、“什么” 这种常见 2 字组的离题问题照样会被拦下)；代价是这些问题要 encode 一次。
+索引存成 SQLite (rst/lexical_index.sqlite3)，支持增量 upsert / delete。
+"""
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+import numpy as np
+
+from .embedding_cache import normalize_text
+from .index_config import collection_space
+from .query_cache import cached_query_batch
+
+DEFAULT_LEXICAL_INDEX_PATH = "rst/lexical_index.sqlite3"
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+# RRF 融合常数：越大，排名靠后的结果权重衰减越慢
+RRF_K = 60
+
+_CJK_RUN_RE = re.compile(r"[一-鿿]+")
+_WORD_RE = re.compile(r"[a-z0-9_]+")
+
+
+def tokenize(text: str) -> list:
+    """中文按 2 字组切，英文按单词切"""
+    text = normalize_text(text).lower()
+    terms = _WORD_RE.findall(text)
+    for run in _CJK_RUN_RE.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+class LexicalIndex:
+    """
+    参数:
+        path: SQLite 文件路径
+    """
+
+    def __init__(self, path: str = DEFAULT_LEXICAL_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stats = None  # (data_version, 文档数, 平均长度)，库被写过就失效
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS docs (
+                rowid INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                category TEXT,
+                length INTEGER NOT NULL,
+                document TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, doc)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings(doc);
+            """
+        )
+        self._conn.commit()
+
+    # --- 写入 ---
+    def upsert(self, ids: list, documents: list, metadatas: list) -> None:
+        with self._lock:
+            self._delete_locked(ids)
+            for doc_id, document, metadata in zip(ids, documents, metadatas):
+                terms = Counter(tokenize(document))
+                cursor = self._conn.execute(
+                    "INSERT INTO docs (id, category, length, document, metadata) VALUES (?, ?, ?, ?, ?)",
+                    (
+                        doc_id,
+                        metadata.get("category"),
+                        sum(terms.values()),
+                        document,
+                        json.dumps(metadata, ensure_ascii=False),
+                    ),
+                )
+                self._conn.executemany(
+                    "INSERT INTO postings (term, doc, tf) VALUES (?, ?, ?)",
+                    [(term, cursor.lastrowid, tf) for term, tf in terms.items()],
+                )
+            self._conn.commit()
+            self._stats = None
+
+    def delete(self, ids: list) -> None:
+        with self._lock:
+            self._delete_locked(ids)
+            self._conn.commit()
+            self._stats = None
+
+    def clear(self) -> None:
+        """清空索引 (向量集合重建时一起清，免得留下指向已不存在碎片的孤儿行)"""
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM docs")
+            self._conn.commit()
+            self._stats = None
+
+    def _delete_locked(self, ids: list) -> None:
+        for start in range(0, len(ids), 500):
+            batch = ids[start : start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT rowid FROM docs WHERE id IN ({placeholders})", batch
+            ).fetchall()
+            if rows:
+                self._conn.executemany(
+                    "DELETE FROM postings WHERE doc = ?", rows
+                )
+                self._conn.executemany("DELETE FROM docs WHERE rowid = ?", rows)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    # --- 查询 ---
+    def search(self, query: str, n_results: int = 10, category: str = None) -> list:
+        """
+        BM25 检索。
+        返回 [{"id", "document", "metadata", "score", "coverage"}, ...]，按分数降序；
+        coverage 是这个碎片包含了多少比例的查询词 (1.0 表示全部命中)。
+        """
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not query_terms:
+            return []
+
+        with self._lock:
+            # data_version 在别的连接 (比如正在跑的索引脚本) 提交后会变
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if self._stats is None or self._stats[0] != data_version:
+                n_docs, avg_len = self._conn.execute(
+                    "SELECT COUNT(*), AVG(length) FROM docs"
+                ).fetchone()
+                self._stats = (data_version, n_docs, avg_len or 1.0)
+            _, n_docs, avg_len = self._stats
+
+            scores = Counter()
+            matched = Counter()
+            for term in query_terms:
+                sql = "SELECT p.doc, p.tf, d.length FROM postings p JOIN docs d ON d.rowid = p.doc WHERE p.term = ?"
+                rows = self._conn.execute(sql, (term,)).fetchall()
+                if not rows:
+                    continue
+                idf = math.log(1 + (n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+                for doc, tf, length in rows:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len)
+                    scores[doc] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+                    matched[doc] += 1
+
+            if category is not None and scores:
+                placeholders = ",".join("?" * len(scores))
+                allowed = {
+                    row[0]
+                    for row in self._conn.execute(
+                        f"SELECT rowid FROM docs WHERE rowid IN ({placeholders}) AND category = ?",
+                        [*scores, category],
+                    )
+                }
+                scores = Counter({d: s for d, s in scores.items() if d in allowed})
+
+            top = scores.most_common(n_results)
+            hits = []
+            for doc, score in top:
+                doc_id, document, metadata = self._conn.execute(
+                    "SELECT id, document, metadata FROM docs WHERE rowid = ?", (doc,)
+                ).fetchone()
+                hits.append(
+                    {
+                        "id": doc_id,
+                        "document": document,
+                        "metadata": json.loads(metadata),
+                        "score": score,
+                        "coverage": matched[doc] / len(query_terms),
+                    }
+                )
+            return hits
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_LEXICAL_REGISTRY = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_lexical_index(path: str = DEFAULT_LEXICAL_INDEX_PATH, create: bool = False):
+    """获取共享的倒排索引；文件不存在且 create=False 时返回 None (检索退回纯向量)"""
+    if not create and not os.path.exists(path):
+        return None
+    with _REGISTRY_LOCK:
+        index = _LEXICAL_REGISTRY.get(path)
+        if index is None:
+            index = LexicalIndex(path)
+            _LEXICAL_REGISTRY[path] = index
+    return index
+
+
+def _category_of(where):
+    """只有 {"category": x} 这种简单过滤能下推到倒排索引；返回 (能否下推, 分类)"""
+    if not where:
+        return True, None
+    if set(where) == {"category"} and isinstance(where["category"], str):
+        return True, where["category"]
+    return False, None
+
+
+def hybrid_query_batch(
+    handle,
+    lexical_index,
+    queries: list,
+    n_results: int = 3,
+    wheres: list = None,
+    candidates: int = 10,
+    use_cache: bool = True,
+    fill_distances: bool = False,
+) -> list:
+    """
+    混合检索，返回格式同 query_cache.cached_query_batch：
+        [{"ids", "documents", "metadatas", "distances"}, ...]
+    只有关键词命中的碎片默认没有向量距离，distances 里对应位置为 None。
+    参数:
+        lexical_index: 倒排索引；None 时直接走纯向量检索
+        candidates: 两路各取多少候选参与融合
+        use_cache: 向量检索是否走结果缓存 (同 cached_query_batch)
+        fill_distances: 给只有关键词命中的碎片补算向量距离 (同一个距离空间)；
+                        结果要过相关性闸门时传 True，否则别传 (关键词确定的问题会多一次 encode)
+    """
+    if wheres is None:
+        wheres = [None] * len(queries)
+    if lexical_index is None:
+        return cached_query_batch(handle, queries, n_results, wheres, use_cache)
+
+    results = [None] * len(queries)
+    lexical_hits = [None] * len(queries)
+    need_vector = []
+    for i, (query, where) in enumerate(zip(queries, wheres)):
+        pushdown, category = _category_of(where)
+        if not pushdown:
+            need_vector.append(i)
+            continue
+        hits = lexical_index.search(query, candidates, category)
+        lexical_hits[i] = hits
+        # 关键词足够确定：有 n_results 个碎片包含了全部查询词，直接返回，省掉 encode
+        confident = [h for h in hits if h["coverage"] >= 1.0]
+        if len(confident) >= n_results:
+            results[i] = {
+                "ids": [h["id"] for h in confident[:n_results]],
+                "documents": [h["document"] for h in confident[:n_results]],
+                "metadatas": [h["metadata"] for h in confident[:n_results]],
+                "distances": [None] * n_results,
+            }
+        else:
+            need_vector.append(i)
+
+    if need_vector:
+        vector_results = cached_query_batch(
+            handle,
+            [queries[i] for i in need_vector],
+            candidates,
+            [wheres[i] for i in need_vector],
+            use_cache,
+        )
+        for i, vector in zip(need_vector, vector_results):
+            results[i] = _fuse(vector, lexical_hits[i] or [], n_results)
+    if fill_distances:
+        _fill_distances(handle, queries, results)
+    return results
+
+
+def _vector_distances(space: str, query: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """和 Chroma 一样的距离定义：l2 是平方欧氏距离，cosine 是 1 - cos，ip 是 1 - 内积"""
+    if space == "l2":
+        return ((vectors - query) ** 2).sum(axis=1)
+    if space == "cosine":
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+        return 1.0 - (vectors @ query) / np.maximum(norms, 1e-12)
+    return 1.0 - vectors @ query
+
+
+def _fill_distances(handle, queries: list, results: list) -> None:
+    """只有关键词命中的碎片 (distance 为 None) 按入库时的向量补算距离，原地写回 results"""
+    pending = [i for i, r in enumerate(results) if None in r["distances"]]
+    if not pending:
+        return
+    collection = handle.get()
+    ids = sorted(
+        {
+            doc_id
+            for i in pending
+            for doc_id, d in zip(results[i]["ids"], results[i]["distances"])
+            if d is None
+        }
+    )
+    stored = collection.get(ids=ids, include=["embeddings"])
+    vectors = dict(zip(stored["ids"], np.asarray(stored["embeddings"], dtype=np.float32)))
+    embeddings = np.asarray(
+        handle.embedding_function([queries[i] for i in pending]), dtype=np.float32
+    )
+    space = collection_space(collection)
+    for i, query in zip(pending, embeddings):
+        result = results[i]
+        rows = [
+            j
+            for j, d in enumerate(result["distances"])
+            if d is None and result["ids"][j] in vectors
+        ]
+        if not rows:
+            continue
+        distances = _vector_distances(
+            space, query, np.stack([vectors[result["ids"][j]] for j in rows])
+        )
+        for j, distance in zip(rows, distances):
+            result["distances"][j] = float(distance)
+
+
+def _fuse(vector: dict, hits: list, n_results: int) -> dict:
+    """RRF 融合：score = Σ 1 / (RRF_K + 排名)，两路都靠前的碎片排最前"""
+    scores = Counter()
+    entries = {}
+    # 按碎片 id 融合：文本一样的不同碎片 (重复的标题、日记里的套话) 各算各的
+    for rank, (doc_id, doc, meta, dist) in enumerate(
+        zip(vector["ids"], vector["documents"], vector["metadatas"], vector["distances"])
+    ):
+        scores[doc_id] += 1.0 / (RRF_K + rank + 1)
+        entries[doc_id] = (doc, meta, dist)
+    for rank, hit in enumerate(hits):
+        scores[hit["id"]] += 1.0 / (RRF_K + rank + 1)
+        entries.setdefault(hit["id"], (hit["document"], hit["metadata"], None))
+
+    top = [doc_id for doc_id, _ in scores.most_common(n_results)]
+    return {
+        "ids": top,
+        "documents": [entries[doc_id][0] for doc_id in top],
+        "metadatas": [entries[doc_id][1] for doc_id in top],
+        "distances": [entries[doc_id][2] for doc_id in top],
+    }
+
+
+def hybrid_query(
+    handle,
+    lexical_index,
+    query: str,
+    n_results: int = 3,
+    where: dict = None,
+    use_cache: bool = True,
+    fill_distances: bool = False,
+) -> dict:
+    """混合检索单条问题，返回格式同 hybrid_query_batch 的单个元素"""
+    return hybrid_query_batch(
+        handle,
+        lexical_index,
+        [query],
+        n_results,
+        [where],
+        use_cache=use_cache,
+        fill_distances=fill_distances,
+    )[0]
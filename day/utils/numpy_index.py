@@ -0,0 +1,497 @@
+# utils/numpy_index.py
+"""
+纯 NumPy 的内存向量索引，可以替代 Chroma 做检索。
+
+几十万条碎片以内，一个归一化的 float32 矩阵 + argpartition 取 top-k，
+比走一遍 Chroma 的 SQLite + HNSW 还快，而且结果是精确的 (不是近似)。
+磁盘格式：vectors.npy (mmap 加载) + meta.json (ids / documents / metadatas)。
+query() 的参数和返回格式都和 Chroma 的 collection.query 保持一致，调用方不用改。
+
+可选的量化模式 (quantization)，给日记越攒越多、Streamlit 进程内存吃紧的时候用：
+    int8: 每维一个缩放系数的标量量化，常驻内存是 float32 的 1/4
+    binary: 只保留每维的正负号 (packbits)，常驻内存是 float32 的 1/32，用汉明距离粗排
+粗排先在量化向量上选出 k * rerank_factor 条候选，再从 mmap 的 float32 向量里只读这些行精排，
+最终的 distances 仍然是精确的余弦距离。
+"""
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_INDEX_PATH = "rst/numpy_index"
+# 预先为这些 metadata 字段建好布尔掩码，where 过滤时直接按位与
+DEFAULT_MASK_FIELDS = ("category",)
+QUANTIZATION_MODES = ("none", "int8", "binary")
+# 粗排候选数 = k * RERANK_FACTOR
+RERANK_FACTOR = 10
+# 量化粗排时每次算多少行，避免把整张量化表一次性转成 float32
+SCORE_BLOCK_ROWS = 16384
+# 0~255 每个字节里有几个 1，算汉明距离用
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+def quantize_int8(matrix: np.ndarray):
+    """对称标量量化：每一维按该维最大绝对值缩放到 [-127, 127]，返回 (codes, scale)"""
+    scale = np.abs(matrix).max(axis=0) if len(matrix) else np.ones(matrix.shape[1])
+    scale = np.where(scale == 0, 1.0, scale).astype(np.float32) / 127.0
+    codes = np.round(matrix / scale).astype(np.int8)
+    return codes, scale
+
+
+def quantize_binary(matrix: np.ndarray) -> np.ndarray:
+    """只保留正负号，每 8 维压成 1 个字节"""
+    return np.packbits(matrix > 0, axis=1)
+
+
+def export_from_chroma(collection, path: str = DEFAULT_INDEX_PATH, page_size=5000):
+    """
+    把 Chroma 集合导出成 NumPy 索引 (分页读取，避免一次 get 全部)。
+    返回导出的条数。
+    """
+    ids, documents, metadatas, vectors = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(
+            include=["embeddings", "documents", "metadatas"],
+            limit=page_size,
+            offset=offset,
+        )
+        if not page["ids"]:
+            break
+        ids += page["ids"]
+        documents += page["documents"]
+        metadatas += page["metadatas"]
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        offset += len(page["ids"])
+
+    matrix = np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+    save_index(path, ids, documents, metadatas, matrix)
+    return len(ids)
+
+
+def save_index(path: str, ids, documents, metadatas, matrix: np.ndarray) -> None:
+    """
+    写入 vectors.npy + 量化向量 (int8 / binary) + meta.json。
+    整个索引先写进临时目录，再原子替换旧目录：别的进程要么读到完整的旧索引，要么读到完整的新索引；
+    空矩阵不写量化文件，旧目录整个换掉，也就不会留下过期的量化文件
+    """
+    path = os.path.normpath(path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    old_path = f"{path}.{os.getpid()}.old"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    matrix = _normalize_rows(matrix)
+    np.save(os.path.join(tmp_path, "vectors.npy"), matrix)
+    if matrix.size:
+        codes, scale = quantize_int8(matrix)
+        np.save(os.path.join(tmp_path, "vectors_int8.npy"), codes)
+        np.save(os.path.join(tmp_path, "int8_scale.npy"), scale)
+        np.save(os.path.join(tmp_path, "vectors_binary.npy"), quantize_binary(matrix))
+    # meta.json 的修改时间就是索引版本，新目录里的 meta.json 一定比旧的新
+    with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(
+            {"ids": ids, "documents": documents, "metadatas": metadatas},
+            f,
+            ensure_ascii=False,
+        )
+
+    # 目录不能直接 os.replace 到非空目录上：先把旧目录挪开，换上新目录，再删旧的
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def get_numpy_index_version(path: str) -> int:
+    try:
+        return os.stat(os.path.join(path, "meta.json")).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+class NumpyVectorIndex:
+    """
+    参数:
+        vectors: (n, dim) 已归一化的 float32 矩阵 (可以是 mmap)
+        ids / documents / metadatas: 和矩阵行一一对应
+        embedding_function: 把 query_texts 变成向量
+        mask_fields: 预先建布尔掩码的 metadata 字段
+        quantization: "none" / "int8" / "binary"，非 none 时先在量化向量上粗排再精排
+        codes: 量化向量 (int8 时是 (codes, scale))，省略时从 vectors 现算
+        rerank_factor: 粗排候选数 = k * rerank_factor
+    """
+
+    # 距离空间：query() 返回的 distances 是余弦距离
+    space = "cosine"
+
+    def __init__(
+        self,
+        vectors,
+        ids,
+        documents,
+        metadatas,
+        embedding_function,
+        mask_fields=DEFAULT_MASK_FIELDS,
+        quantization: str = "none",
+        codes=None,
+        rerank_factor: int = RERANK_FACTOR,
+    ):
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(
+                f"未知的量化模式: {quantization} (可选: {' / '.join(QUANTIZATION_MODES)})"
+            )
+        self.vectors = vectors
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.embedding_function = embedding_function
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+
+        self.codes = None
+        self.int8_scale = None
+        if quantization == "int8":
+            codes, scale = codes if codes is not None else quantize_int8(vectors)
+            self.codes, self.int8_scale = np.asarray(codes), np.asarray(scale)
+        elif quantization == "binary":
+            self.codes = np.asarray(
+                codes if codes is not None else quantize_binary(vectors)
+            )
+
+        # 掩码表：{字段: {取值: bool 数组}}
+        self.masks = {}
+        for field in mask_fields:
+            values = np.array([str(m.get(field)) for m in metadatas])
+            self.masks[field] = {v: values == v for v in np.unique(values)}
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        embedding_function,
+        mmap: bool = True,
+        quantization: str = "none",
+        **kwargs,
+    ):
+        """
+        从磁盘加载；mmap=True 时向量矩阵按需分页读入，不占常驻内存。
+        量化模式下量化向量整个读进内存，float32 向量只在精排时按行读取。
+        """
+        vectors = np.load(
+            os.path.join(path, "vectors.npy"), mmap_mode="r" if mmap else None
+        )
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        codes = None
+        try:
+            if quantization == "int8":
+                codes = (
+                    np.load(os.path.join(path, "vectors_int8.npy")),
+                    np.load(os.path.join(path, "int8_scale.npy")),
+                )
+            elif quantization == "binary":
+                codes = np.load(os.path.join(path, "vectors_binary.npy"))
+        except FileNotFoundError:
+            # 老版本导出的索引没有量化文件，加载时现算
+            codes = None
+        return cls(
+            vectors,
+            meta["ids"],
+            meta["documents"],
+            meta["metadatas"],
+            embedding_function,
+            quantization=quantization,
+            codes=codes,
+            **kwargs,
+        )
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def get(self, ids: list, include=None) -> dict:
+        """按 id 取碎片，返回格式同 collection.get (不存在的 id 跳过)；include 可带 "embeddings" """
+        if getattr(self, "_rows", None) is None:
+            self._rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        rows = [self._rows[doc_id] for doc_id in ids if doc_id in self._rows]
+        include = include or ["documents", "metadatas"]
+        result = {"ids": [self.ids[row] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [self.documents[row] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self.metadatas[row] for row in rows]
+        if "embeddings" in include:
+            # mmap 上按行号取，只读这几行
+            result["embeddings"] = np.asarray(self.vectors[np.array(rows, dtype=np.int64)])
+        return result
+
+    def resident_bytes(self) -> int:
+        """检索时常驻内存的向量字节数 (量化模式下 float32 向量走 mmap，不算在内)"""
+        if self.quantization == "none":
+            return self.vectors.nbytes
+        extra = self.int8_scale.nbytes if self.int8_scale is not None else 0
+        return self.codes.nbytes + extra
+
+    def _where_mask(self, where: dict):
+        """把 Chroma 风格的 where 条件转成布尔掩码；None 表示不过滤"""
+        if not where:
+            return None
+        if "$and" in where:
+            mask = None
+            for cond in where["$and"]:
+                sub = self._where_mask(cond)
+                mask = sub if mask is None else mask & sub
+            return mask
+        if "$or" in where:
+            mask = None
+            for cond in where["$or"]:
+                sub = self._where_mask(cond)
+                mask = sub if mask is None else mask | sub
+            return mask
+
+        mask = None
+        for field, cond in where.items():
+            if isinstance(cond, dict) and "$in" in cond:
+                values = cond["$in"]
+            elif isinstance(cond, dict) and "$eq" in cond:
+                values = [cond["$eq"]]
+            elif isinstance(cond, dict):
+                raise ValueError(f"NumPy 索引暂不支持的过滤条件: {cond}")
+            else:
+                values = [cond]
+            sub = self._field_mask(field, values)
+            mask = sub if mask is None else mask & sub
+        return mask
+
+    def _field_mask(self, field, values):
+        field_masks = self.masks.get(field)
+        if field_masks is None:
+            # 没预建掩码的字段，临时算一次
+            return np.array(
+                [m.get(field) in values for m in self.metadatas], dtype=bool
+            )
+        mask = np.zeros(len(self.ids), dtype=bool)
+        for v in values:
+            if str(v) in field_masks:
+                mask |= field_masks[str(v)]
+        return mask
+
+    def query(
+        self,
+        query_texts=None,
+        query_embeddings=None,
+        n_results: int = 10,
+        where: dict = None,
+        include=None,
+    ) -> dict:
+        """
+        和 collection.query 一样的用法；distances 为余弦距离 (1 - cos)，越小越相似。
+        """
+        if isinstance(query_texts, str):
+            query_texts = [query_texts]
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(query_texts)
+        queries = _normalize_rows(np.asarray(query_embeddings, dtype=np.float32))
+
+        # 只在过滤后的行上算分，代价和分区大小成正比
+        mask = self._where_mask(where)
+        candidates = None if mask is None else np.flatnonzero(mask)
+
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        k = min(n_results, self.count() if candidates is None else len(candidates))
+        if k == 0:
+            for key in result:
+                result[key] = [[] for _ in range(len(queries))]
+            return result
+
+        for query in queries:
+            rows, sims = self._search(query, candidates, k)
+            result["ids"].append([self.ids[i] for i in rows])
+            result["documents"].append([self.documents[i] for i in rows])
+            result["metadatas"].append([self.metadatas[i] for i in rows])
+            result["distances"].append((1.0 - sims).tolist())
+        return result
+
+    def _search(self, query: np.ndarray, candidates, k: int):
+        """返回 (行号, 余弦相似度)，按相似度降序；candidates 为 None 表示全表"""
+        if self.quantization == "none":
+            matrix = self.vectors if candidates is None else self.vectors[candidates]
+            rows, sims = _top_k(matrix @ query, k)
+            return (rows if candidates is None else candidates[rows]), sims
+
+        # 1. 粗排：在量化向量上选出 k * rerank_factor 条候选
+        approx = self._approx_scores(query, candidates)
+        shortlist, _ = _top_k(approx, min(k * self.rerank_factor, len(approx)))
+        if candidates is not None:
+            shortlist = candidates[shortlist]
+        # 2. 精排：只从 mmap 里读候选行的 float32 向量，算精确余弦
+        shortlist = np.sort(shortlist)  # 按行号顺序读，磁盘访问更连续
+        top, sims = _top_k(self.vectors[shortlist] @ query, k)
+        return shortlist[top], sims
+
+    def _approx_scores(self, query: np.ndarray, candidates) -> np.ndarray:
+        """量化向量上的近似分数，越大越相似"""
+        codes = self.codes if candidates is None else self.codes[candidates]
+        scores = np.empty(len(codes), dtype=np.float32)
+        if self.quantization == "int8":
+            scaled = query * self.int8_scale
+            for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+                block = codes[start : start + SCORE_BLOCK_ROWS]
+                scores[start : start + len(block)] = block.astype(np.float32) @ scaled
+        else:
+            bits = quantize_binary(query[None, :])[0]
+            for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+                block = codes[start : start + SCORE_BLOCK_ROWS]
+                # 转成有符号整数再取负，uint 取负会溢出
+                hamming = _POPCOUNT[np.bitwise_xor(block, bits)].sum(
+                    axis=1, dtype=np.int32
+                )
+                scores[start : start + len(block)] = -hamming
+        return scores
+
+
+def _top_k(scores: np.ndarray, k: int):
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return top, scores[top]
+
+
+def exact_top_k(vectors, queries, k: int, space: str = "cosine", candidates=None) -> list:
+    """
+    暴力检索的 top-k 行号 (逐条查询算分，百万级语料也不会一次占满内存)，
+    给 HNSW 调参 / 检索基准当 recall 的基准。
+    参数:
+        space: "cosine" 或 "l2" (平方 L2 距离)
+        candidates: 只在这些行里找 (where 过滤后的行号)，None 表示全表
+    """
+    matrix = vectors if candidates is None else vectors[candidates]
+    if space == "cosine":
+        matrix = _normalize_rows(np.asarray(matrix, dtype=np.float32))
+        queries = _normalize_rows(np.asarray(queries, dtype=np.float32))
+        bias = 0.0
+    else:
+        # 平方 L2 距离 = |q|^2 - 2 q·v + |v|^2，对同一个 q 只需比较 2 q·v - |v|^2
+        bias = (np.asarray(matrix, dtype=np.float32) ** 2).sum(axis=1)
+        queries = 2 * np.asarray(queries, dtype=np.float32)
+    k = min(k, len(matrix))
+    results = []
+    for query in queries:
+        top, _ = _top_k(matrix @ query - bias, k)
+        results.append(top if candidates is None else candidates[top])
+    return results
+
+
+def recall_report(
+    path: str = DEFAULT_INDEX_PATH,
+    embedding_function=None,
+    query_texts=None,
+    k: int = 3,
+    sample: int = 200,
+    modes=("int8", "binary"),
+    seed: int = 0,
+) -> dict:
+    """
+    量化检索 vs 精确检索的 recall@k 报告。
+    参数:
+        query_texts: 测试问题；省略时从索引里随机抽 sample 条向量当问题
+    返回:
+        {模式: {"recall", "resident_bytes", "compression", "avg_ms"}, ...}，
+        其中 "none" 是精确检索本身 (recall 恒为 1)
+    """
+    exact = NumpyVectorIndex.load(path, embedding_function)
+    if exact.count() == 0:
+        return {}
+    if query_texts:
+        queries = np.asarray(embedding_function(query_texts), dtype=np.float32)
+    else:
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(exact.count(), min(sample, exact.count()), replace=False)
+        queries = np.asarray(exact.vectors[np.sort(rows)])
+    k = min(k, exact.count())
+
+    def run(index):
+        start = time.perf_counter()
+        found = index.query(query_embeddings=queries, n_results=k)["ids"]
+        return found, (time.perf_counter() - start) * 1000 / len(queries)
+
+    truth, exact_ms = run(exact)
+    report = {
+        "none": {
+            "recall": 1.0,
+            "resident_bytes": exact.resident_bytes(),
+            "compression": 1.0,
+            "avg_ms": exact_ms,
+        }
+    }
+    for mode in modes:
+        index = NumpyVectorIndex.load(path, embedding_function, quantization=mode)
+        found, ms = run(index)
+        hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+        report[mode] = {
+            "recall": hits / (k * len(queries)),
+            "resident_bytes": index.resident_bytes(),
+            "compression": exact.resident_bytes() / max(index.resident_bytes(), 1),
+            "avg_ms": ms,
+        }
+    return report
+
+
+class NumpyIndexHandle:
+    """
+    和 vector_store.CollectionHandle 一样的接口 (get / warm_up / close / version)，
+    索引文件被重新导出后自动重新加载。
+    """
+
+    def __init__(
+        self, path, embedding_function, check_interval=1.0, quantization="none"
+    ):
+        self.path = path
+        self.embedding_function = embedding_function
+        self.check_interval = check_interval
+        self.quantization = quantization
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+        self._last_check = 0.0
+
+    @property
+    def version(self):
+        return self._version
+
+    def get(self) -> NumpyVectorIndex:
+        now = time.monotonic()
+        with self._lock:
+            if self._index is not None and now - self._last_check < self.check_interval:
+                return self._index
+            self._last_check = now
+            version = get_numpy_index_version(self.path)
+            if self._index is None or version != self._version:
+                if self._index is not None:
+                    print("🔁 [NumpyIndex] 检测到索引更新，重新加载")
+                self._index = NumpyVectorIndex.load(
+                    self.path, self.embedding_function, quantization=self.quantization
+                )
+                self._version = version
+            return self._index
+
+    def warm_up(self):
+        index = self.get()
+        if index.count() > 0:
+            # 把 mmap 的页读进来
+            index.query(query_texts=["warm up"], n_results=1)
+        return index
+
+    def close(self):
+        with self._lock:
+            self._index = None
+            self._version = None
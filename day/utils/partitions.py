@@ -0,0 +1,338 @@
+# utils/partitions.py
+"""
+按分类分区的集合 + 查询路由。
+
+以前日记和技术文档都塞在一个 categorized_memory 集合里，按分类查时靠 where={"category": ...}
+在同一张 HNSW 图上做后过滤：一个分类的数据越多，另一个分类的查询召回越差、越慢。
+分区模式 (day10_02_indexer.py --partition) 下每个分类是一个独立的 Chroma 集合：
+    categorized_memory__diary / categorized_memory__tech
+PartitionedCollection 把它们包成一个集合对外，用法和 Chroma 集合一样 (query / get / upsert / delete / count)：
+    where 能确定分类 ({"category": x} / {"category": {"$in": [...]}} / $and 里带分类条件)
+        -> 只查对应分区，分类条件去掉，剩下的条件照常下推；耗时只和分区大小有关
+    其他情况 (不过滤 / 按别的字段过滤)
+        -> 每个分区各查 top-k，按距离合并成全局 top-k
+vector_store 打开集合时发现有分区就自动走路由，调用方 (query_rag_system / search_knowledge_base) 不用改。
+分类值直接拼进集合名，Chroma 的集合名只能是字母数字和 . _ -：不符合的分类值 (中文等)
+编码成 x.{utf-8 的十六进制}，list_partitions 读回来时再解码。
+"""
+import re
+
+from .index_config import get_or_create_collection
+
+PARTITION_KEY = "category"
+PARTITION_SEPARATOR = "__"
+# 能原样放进集合名的分类值：字母数字开头和结尾，中间可以有 _ -
+_PLAIN_VALUE_RE = re.compile(r"[A-Za-z0-9](?:[A-Za-z0-9_-]*[A-Za-z0-9])?")
+_ENCODED_PREFIX = "x."
+# 老版本 Chroma 的集合名上限
+MAX_COLLECTION_NAME_LENGTH = 63
+
+# 合并结果时要对齐的字段 (Chroma query 返回的 include 字段)
+_RESULT_FIELDS = ("ids", "documents", "metadatas", "distances", "embeddings")
+
+
+def _encode_value(value: str) -> str:
+    if _PLAIN_VALUE_RE.fullmatch(value):
+        return value
+    return _ENCODED_PREFIX + value.encode("utf-8").hex()
+
+
+def _decode_value(suffix: str) -> str:
+    if suffix.startswith(_ENCODED_PREFIX):
+        try:
+            return bytes.fromhex(suffix[len(_ENCODED_PREFIX) :]).decode("utf-8")
+        except ValueError:
+            pass  # 不是我们编码出来的名字，原样当分类
+    return suffix
+
+
+def partition_name(base_name: str, value: str) -> str:
+    """分区的集合名；分类值不符合 Chroma 命名规则时先编码，编码后还太长就报错 (别等写到一半才失败)"""
+    if not value:
+        raise ValueError("分区模式下分类不能是空字符串")
+    name = f"{base_name}{PARTITION_SEPARATOR}{_encode_value(value)}"
+    if len(name) > MAX_COLLECTION_NAME_LENGTH:
+        raise ValueError(
+            f"分类 '{value}' 对应的集合名 {name} 超过 {MAX_COLLECTION_NAME_LENGTH} 个字符，换个短一点的分类名"
+        )
+    return name
+
+
+def list_partitions(client, base_name: str) -> dict:
+    """库里已有的分区：{分类: 集合名}"""
+    prefix = base_name + PARTITION_SEPARATOR
+    partitions = {}
+    for collection in client.list_collections():
+        # 老版本 Chroma 返回集合对象，新版本可能直接返回名字
+        name = getattr(collection, "name", collection)
+        if name.startswith(prefix):
+            partitions[_decode_value(name[len(prefix) :])] = name
+    return partitions
+
+
+def delete_partitions(client, base_name: str) -> list:
+    """删掉所有分区，返回删掉的集合名"""
+    names = list(list_partitions(client, base_name).values())
+    for name in names:
+        client.delete_collection(name)
+    return names
+
+
+def _partition_values(condition):
+    """分类字段上的条件能确定是哪几个分区时返回分类列表，否则返回 None"""
+    if isinstance(condition, str):
+        return [condition]
+    if isinstance(condition, dict) and len(condition) == 1:
+        op, value = next(iter(condition.items()))
+        if op == "$eq" and isinstance(value, str):
+            return [value]
+        if op == "$in" and isinstance(value, list) and all(isinstance(v, str) for v in value):
+            return list(value)
+    return None
+
+
+class PartitionedCollection:
+    """
+    参数:
+        name: 逻辑集合名 (例如 categorized_memory)
+        partitions: {分类: Chroma 集合}
+        embedding_function: 查询时用 query_texts 就先 encode 一次，所有分区共用
+        create_partition: 写入新分类时用来建分区的回调 value -> 集合；None 表示只读
+        key: 按哪个 metadata 字段分区
+    """
+
+    def __init__(
+        self,
+        name: str,
+        partitions: dict,
+        embedding_function,
+        create_partition=None,
+        key: str = PARTITION_KEY,
+    ):
+        self.name = name
+        self.partitions = dict(partitions)
+        self.embedding_function = embedding_function
+        self.create_partition = create_partition
+        self.key = key
+
+    @property
+    def configuration(self):
+        # 所有分区按同一个 IndexConfig 建，取任意一个即可 (distance_threshold_for 用它判断距离空间)
+        for collection in self.partitions.values():
+            return collection.configuration
+        return {}
+
+    def route(self, where: dict = None):
+        """返回 (要查的分区列表, 下推给分区的剩余 where 条件)"""
+        if where and self.key in where:
+            values = _partition_values(where[self.key])
+            if values is not None:
+                rest = {k: v for k, v in where.items() if k != self.key}
+                return values, rest or None
+        if where and "$and" in where:
+            conditions = where["$and"]
+            for i, condition in enumerate(conditions):
+                values = (
+                    _partition_values(condition[self.key])
+                    if set(condition) == {self.key}
+                    else None
+                )
+                if values is not None:
+                    rest = conditions[:i] + conditions[i + 1 :]
+                    if not rest:
+                        return values, None
+                    return values, rest[0] if len(rest) == 1 else {"$and": rest}
+        return list(self.partitions), where
+
+    # --- 读 ---
+    def query(
+        self,
+        query_embeddings=None,
+        query_texts=None,
+        n_results: int = 10,
+        where: dict = None,
+        include=None,
+    ) -> dict:
+        """和 Chroma collection.query 一样的用法；多个分区的结果按距离合并"""
+        if query_embeddings is None:
+            # 和 Chroma 一样，单个字符串当一条问题 (list("问题") 会拆成一个个字)
+            if isinstance(query_texts, str):
+                query_texts = [query_texts]
+            query_embeddings = self.embedding_function(list(query_texts))
+        n_queries = len(query_embeddings)
+        values, rest = self.route(where)
+
+        kwargs = {"query_embeddings": query_embeddings, "n_results": n_results}
+        if rest:
+            kwargs["where"] = rest
+        if include is not None:
+            # 合并时要按距离排序：调用方没要 distances 也得取回来，合并完再去掉
+            kwargs["include"] = list(include)
+            if "distances" not in include:
+                kwargs["include"].append("distances")
+        # 分区不存在 (还没写过这个分类) 就当作没有结果
+        raws = [
+            self.partitions[value].query(**kwargs)
+            for value in values
+            if value in self.partitions
+        ]
+
+        if raws:
+            fields = [f for f in _RESULT_FIELDS if raws[0].get(f) is not None]
+        else:
+            fields = ["ids", "documents", "metadatas", "distances"]
+        merged = {f: [] for f in fields}
+        for row in range(n_queries):
+            candidates = []
+            for raw in raws:
+                for j in range(len(raw["ids"][row])):
+                    candidates.append({f: raw[f][row][j] for f in fields})
+            if len(raws) > 1:
+                candidates.sort(key=lambda c: c["distances"])
+                candidates = candidates[:n_results]
+            for field in fields:
+                merged[field].append([c[field] for c in candidates])
+        if include is not None and "distances" not in include:
+            merged.pop("distances", None)
+        return merged
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=None) -> dict:
+        """和 Chroma collection.get 一样；limit / offset 按 分区顺序拼起来的全表 计算"""
+        values, rest = self.route(where)
+        collections = [self.partitions[v] for v in values if v in self.partitions]
+        kwargs = {}
+        if ids is not None:
+            kwargs["ids"] = ids
+        if rest:
+            kwargs["where"] = rest
+        if include is not None:
+            kwargs["include"] = include
+
+        merged = {}
+        skip = offset or 0
+        remaining = limit
+        for collection in collections:
+            if remaining is not None and remaining <= 0:
+                break
+            if ids is None and rest is None:
+                # 没有过滤时分区的条数就是行数，整块跳过不用读
+                size = collection.count()
+                if skip >= size:
+                    skip -= size
+                    continue
+                page = collection.get(limit=remaining, offset=skip or None, **kwargs)
+                skip = 0
+            else:
+                page = collection.get(**kwargs)
+                rows = len(page["ids"])
+                start = min(skip, rows)
+                end = rows if remaining is None else min(rows, start + remaining)
+                skip -= start
+                for field in _RESULT_FIELDS:
+                    if page.get(field) is not None:
+                        page[field] = page[field][start:end]
+            for field, value in page.items():
+                if field in _RESULT_FIELDS and value is not None:
+                    merged.setdefault(field, []).extend(list(value))
+                else:
+                    merged.setdefault(field, value)
+            if remaining is not None:
+                remaining -= len(page["ids"])
+        merged.setdefault("ids", [])
+        return merged
+
+    def count(self) -> int:
+        return sum(collection.count() for collection in self.partitions.values())
+
+    # --- 写 ---
+    def upsert(self, ids, documents=None, metadatas=None, embeddings=None) -> None:
+        """按 metadata 里的分类拆开，分别写进各自的分区 (没有的分区自动建)"""
+        groups = {}
+        for i, metadata in enumerate(metadatas):
+            value = (metadata or {}).get(self.key)
+            if not isinstance(value, str):
+                raise ValueError(f"分区模式下每个碎片都要有字符串类型的 '{self.key}' 字段: {ids[i]}")
+            groups.setdefault(value, []).append(i)
+        # 新分类的集合名先全部检查一遍，不合法就整批不写
+        for value in groups:
+            if value not in self.partitions:
+                partition_name(self.name, value)
+
+        for value, rows in groups.items():
+            collection = self.partitions.get(value)
+            if collection is None:
+                if self.create_partition is None:
+                    raise ValueError(f"分区 '{value}' 不存在 (只读)")
+                collection = self.partitions[value] = self.create_partition(value)
+            kwargs = {
+                "ids": [ids[i] for i in rows],
+                "metadatas": [metadatas[i] for i in rows],
+            }
+            if documents is not None:
+                kwargs["documents"] = [documents[i] for i in rows]
+            if embeddings is not None:
+                kwargs["embeddings"] = [embeddings[i] for i in rows]
+            collection.upsert(**kwargs)
+
+    def delete(self, ids=None, where=None) -> None:
+        """id 不知道在哪个分区，每个分区都删一遍 (不存在的 id 会被忽略)"""
+        values, rest = self.route(where)
+        for value in values:
+            if value not in self.partitions:
+                continue
+            kwargs = {}
+            if ids is not None:
+                kwargs["ids"] = ids
+            if rest:
+                kwargs["where"] = rest
+            self.partitions[value].delete(**kwargs)
+
+    def modify(self, **kwargs) -> None:
+        for collection in self.partitions.values():
+            collection.modify(**kwargs)
+
+
+def open_partitioned_collection(
+    client, base_name: str, embedding_function, config=None, create: bool = False
+):
+    """
+    打开按分类分区的集合。
+    create=False (检索端)：库里没有分区时返回 None，调用方退回单集合
+    create=True (索引端)：已有分区按 IndexConfig 打开，新分类写入时自动建分区
+    """
+    names = list_partitions(client, base_name)
+    if not names and not create:
+        return None
+
+    if create:
+
+        def create_partition(value):
+            print(f"🧱 新建分区 {partition_name(base_name, value)}")
+            return get_or_create_collection(
+                client, partition_name(base_name, value), embedding_function, config
+            )
+
+        partitions = {
+            value: get_or_create_collection(client, name, embedding_function, config)
+            for value, name in names.items()
+        }
+    else:
+        create_partition = None
+        partitions = {
+            value: client.get_collection(name=name, embedding_function=embedding_function)
+            for value, name in names.items()
+        }
+    return PartitionedCollection(
+        base_name, partitions, embedding_function, create_partition=create_partition
+    )
+
+
+def open_collection(client, name: str, embedding_function=None):
+    """
+    检索端打开 name 对应的集合：库是按分类分区建的 (--partition) 就返回分区路由，
+    否则打开单集合。所有读 categorized_memory 的脚本都走这里，换布局不用改调用方。
+    """
+    partitioned = open_partitioned_collection(client, name, embedding_function)
+    if partitioned is not None:
+        return partitioned
+    return client.get_collection(name=name, embedding_function=embedding_function)
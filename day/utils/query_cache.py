@@ -0,0 +1,159 @@
+# utils/query_cache.py
+"""
+知识库检索结果缓存 (进程内 LRU + TTL)。
+
+侧边栏的示例问题、同一会话里反复问的问题，每次都要重新 encode 查询再跑一遍向量检索。
+这里按 (哪个索引, 规范化后的问题, n_results, where 条件, 索引版本) 缓存检索结果：
+索引一被重写，版本号就变了，旧结果自然失效。版本按索引分别记，
+同一个进程里开着好几个索引 (chroma / numpy、单集合 / 分区) 时互不影响。
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from .embedding_cache import normalize_text
+
+
+def handle_identity(handle) -> tuple:
+    """句柄对应的是哪个索引：Chroma 是 (库路径, 集合名)，NumPy 是 (导出目录, 量化模式)"""
+    if hasattr(handle, "collection_name"):
+        return ("chroma", os.path.abspath(handle.db_path), handle.collection_name)
+    return ("numpy", os.path.abspath(handle.path), getattr(handle, "quantization", None))
+
+
+def make_query_key(
+    query: str, n_results: int, where: dict, version, index: tuple = None
+) -> tuple:
+    """index 是 handle_identity() 的结果；两个集合共用一个 chroma.sqlite3 (版本号相同) 时靠它区分"""
+    # where 是 dict，转成排好序的 JSON 才能当 key
+    where_key = json.dumps(where, sort_keys=True, ensure_ascii=False) if where else ""
+    return (index, normalize_text(query), n_results, where_key, version)
+
+
+class QueryResultCache:
+    """
+    参数:
+        max_entries: 最多缓存多少个查询结果，超出后淘汰最久没用的
+        ttl: 每条结果最多保留多少秒
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (写入时间, 结果)
+        self._versions = {}  # 索引 (key[0]) -> 最近写入时的版本号
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]  # 过期了
+            self.misses += 1
+            return None
+
+    def put(self, key, value, version=None) -> None:
+        index = key[0]
+        with self._lock:
+            if index in self._versions and self._versions[index] != version:
+                # 这个索引的版本变了，它旧版本的结果都不会再命中，清掉腾内存 (别的索引的结果保留)
+                for stale in [k for k in self._entries if k[0] == index]:
+                    del self._entries[stale]
+            self._versions[index] = version
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+        }
+
+
+# 进程级共享的结果缓存
+query_cache = QueryResultCache()
+
+
+def cached_query_batch(
+    handle, queries: list, n_results: int = 3, wheres: list = None, use_cache: bool = True
+) -> list:
+    """
+    带缓存的批量检索：N 个问题只 encode 一次，相同过滤条件的问题合并成一次向量检索。
+    参数:
+        handle: vector_store.open_knowledge_base 返回的句柄
+        queries: 问题列表
+        wheres: 和 queries 一一对应的 where 条件 (可以是 None)，省略表示都不过滤
+        use_cache: False 时不读也不写缓存 (跑基准测试时用，测的是真实检索)
+    返回:
+        [{"ids": [...], "documents": [...], "metadatas": [...], "distances": [...]}, ...]，
+        顺序和 queries 一致 (不要原地修改，结果可能来自缓存)
+    """
+    if wheres is None:
+        wheres = [None] * len(queries)
+
+    # 先 get() 一下：句柄会检查磁盘版本，必要时重开，这样拿到的 version 是最新的
+    collection = handle.get()
+    version = handle.version
+    index = handle_identity(handle)
+    keys = [
+        make_query_key(q, n_results, w, version, index) for q, w in zip(queries, wheres)
+    ]
+
+    results = [query_cache.get(key) if use_cache else None for key in keys]
+    missing = [i for i, r in enumerate(results) if r is None]
+    if not missing:
+        return results
+
+    # 所有没命中的问题一次性 encode
+    embeddings = np.asarray(handle.embedding_function([queries[i] for i in missing]))
+
+    # 按 where 条件分组，每组一次向量检索
+    groups = {}
+    for pos, i in enumerate(missing):
+        groups.setdefault(keys[i][3], []).append((pos, i))
+
+    for group in groups.values():
+        where = wheres[group[0][1]]
+        kwargs = {
+            "query_embeddings": embeddings[[pos for pos, _ in group]],
+            "n_results": n_results,
+        }
+        if where:
+            kwargs["where"] = where
+        raw = collection.query(**kwargs)
+        for row, (_, i) in enumerate(group):
+            result = {
+                "ids": raw["ids"][row],
+                "documents": raw["documents"][row],
+                "metadatas": raw["metadatas"][row],
+                "distances": raw["distances"][row],
+            }
+            if use_cache:
+                query_cache.put(keys[i], result, version=version)
+            results[i] = result
+    return results
+
+
+def cached_query(handle, query: str, n_results: int = 3, where: dict = None) -> dict:
+    """带缓存的单条检索，返回格式同 cached_query_batch 的单个元素"""
+    return cached_query_batch(handle, [query], n_results, [where])[0]
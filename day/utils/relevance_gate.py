@@ -0,0 +1,204 @@
+# utils/relevance_gate.py
+"""
+检索置信度闸门：检索结果都不够相关时，直接在本地回答“没找到”，不再调用 Gemini。
+
+以前 day09 用写死的 “距离 < 30” 过滤，过滤完啥也没剩还是带着 “无” 去调一次大模型；
+day11 干脆不看距离。闭门造车的阈值换个模型、换个距离空间就不准了，
+这里按集合校准：
+    正样本：从库里随机抽碎片截一段当问题 (肯定能找到)
+    负样本：一批和知识库无关的问题 (股市、菜谱、地理……)
+分别看 top-1 距离的分布，取区分两者最好的那个距离 (Youden J = 命中率 - 误放率 最大) 作为阈值，
+和索引放在一起：{索引目录}/relevance_gate.json，按 集合名 -> 距离空间 存。
+没校准过的集合退回 utils/index_config.py 里的经验阈值。
+混合检索 (utils/lexical_index.py) 传 fill_distances=True 时给只有关键词命中的碎片也补算向量距离，
+所以阈值对融合后的结果同样适用：
+离题问题的向量 top-1 都过不了阈值，其他碎片的距离只会更大。
+校准命令：python day10_02_indexer.py --calibrate-gate
+"""
+import json
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from .index_config import collection_space, distance_threshold_for
+
+GATE_FILENAME = "relevance_gate.json"
+
+# 和知识库 (胖墩墩日记 + 技术笔记) 无关的问题，做负样本
+OFF_TOPIC_QUERIES = [
+    "今天上证指数收盘多少点？",
+    "红烧肉怎么做才不腻？",
+    "法国的首都是哪里？",
+    "推荐几部好看的科幻电影",
+    "怎么申请美国签证？",
+    "明天北京会下雪吗？",
+    "世界上最高的山是哪座？",
+    "如何缓解颈椎疼痛？",
+    "周杰伦最新的专辑叫什么？",
+    "二手车过户需要哪些材料？",
+    "光合作用的原理是什么？",
+    "马拉松比赛前一天应该吃什么？",
+    "iPhone 怎么截长图？",
+    "梵高的代表作有哪些？",
+    "高考数学怎么提分？",
+    "What is the capital of Australia?",
+    "How do I bake sourdough bread?",
+    "Who won the 2018 World Cup?",
+    "怎么给多肉植物浇水？",
+    "房贷提前还款划算吗？",
+]
+
+
+class RelevanceGate:
+    """
+    参数:
+        threshold: 距离 <= threshold 的结果才算相关
+        space: 阈值对应的距离空间 ("l2" / "cosine")
+        stats: 校准时的统计信息 (样本数、命中率、误放率……)
+    """
+
+    def __init__(self, threshold: float, space: str, stats: dict = None):
+        self.threshold = threshold
+        self.space = space
+        self.stats = stats or {}
+
+    def is_relevant(self, distance) -> bool:
+        # 算不出向量距离的结果 (None) 没法判断，不放行
+        return distance is not None and distance <= self.threshold
+
+    def filter(self, results: dict) -> dict:
+        """只保留相关的结果，返回格式同 cached_query 的单个元素"""
+        keep = [i for i, d in enumerate(results["distances"]) if self.is_relevant(d)]
+        return {key: [results[key][i] for i in keep] for key in results}
+
+    def to_dict(self) -> dict:
+        return {"threshold": self.threshold, "space": self.space, "stats": self.stats}
+
+
+def _sample_documents(collection, n: int, rng) -> list:
+    """从集合里随机抽 n 条碎片的文本 (Chroma 集合或 NumPy 索引都行)"""
+    documents = getattr(collection, "documents", None)
+    if documents is None:
+        total = collection.count()
+        offset = int(rng.integers(0, max(total - n * 5, 0) + 1))
+        documents = collection.get(limit=n * 5, offset=offset, include=["documents"])[
+            "documents"
+        ]
+    if not documents:
+        return []
+    rows = rng.choice(len(documents), min(n, len(documents)), replace=False)
+    return [documents[i] for i in rows]
+
+
+def _snippet(document: str, rng, length: int = 16) -> str:
+    """从碎片里最长的一行截一段，模拟用户提问"""
+    line = max(document.split("\n"), key=len)
+    start = int(rng.integers(0, max(len(line) - length, 0) + 1))
+    return line[start : start + length]
+
+
+def _top1_distances(collection, queries: list) -> np.ndarray:
+    results = collection.query(query_texts=queries, n_results=1)
+    return np.array([d[0] for d in results["distances"] if d], dtype=np.float64)
+
+
+def calibrate_gate(
+    collection, samples: int = 200, negatives: list = None, seed: int = 0
+) -> RelevanceGate:
+    """
+    在集合上跑正负样本，学出阈值。
+    参数:
+        collection: Chroma 集合或 NumpyVectorIndex (都支持 query(query_texts=...))
+        samples: 正样本数
+        negatives: 负样本问题，省略时用 OFF_TOPIC_QUERIES
+    """
+    rng = np.random.default_rng(seed)
+    positives = [_snippet(doc, rng) for doc in _sample_documents(collection, samples, rng)]
+    positives = [q for q in positives if q.strip()]
+    if not positives:
+        raise ValueError("集合是空的，没法校准")
+    pos = _top1_distances(collection, positives)
+    neg = _top1_distances(collection, negatives or OFF_TOPIC_QUERIES)
+
+    # 在所有出现过的距离上找 命中率 - 误放率 最大的阈值，平手时取更大的 (宁可多放，别漏答)
+    observed = np.unique(np.concatenate([pos, neg]))
+    best, best_j = len(observed) - 1, -1.0
+    for i, t in enumerate(observed):
+        tpr = float(np.mean(pos <= t))
+        fpr = float(np.mean(neg <= t)) if len(neg) else 0.0
+        if tpr - fpr >= best_j:
+            best, best_j = i, tpr - fpr
+    # 阈值放在最佳点和下一个观测值的中间，给没见过的问题留点余量
+    best_threshold = float(observed[best])
+    if best + 1 < len(observed):
+        best_threshold = float((observed[best] + observed[best + 1]) / 2)
+
+    stats = {
+        "positives": len(pos),
+        "negatives": len(neg),
+        "tpr": float(np.mean(pos <= best_threshold)),
+        "fpr": float(np.mean(neg <= best_threshold)) if len(neg) else 0.0,
+        "positive_p50": float(np.percentile(pos, 50)),
+        "positive_p95": float(np.percentile(pos, 95)),
+        "negative_p5": float(np.percentile(neg, 5)) if len(neg) else None,
+        "negative_p50": float(np.percentile(neg, 50)) if len(neg) else None,
+        "calibrated_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    return RelevanceGate(best_threshold, collection_space(collection), stats)
+
+
+def save_gate(index_dir: str, collection_name: str, gate: RelevanceGate) -> str:
+    """写入 {index_dir}/relevance_gate.json，同一个集合的其他距离空间的阈值保留"""
+    path = os.path.join(index_dir, GATE_FILENAME)
+    data = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    data.setdefault(collection_name, {})[gate.space] = gate.to_dict()
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+_GATE_CACHE = {}  # path -> (mtime_ns, 文件内容)
+_CACHE_LOCK = threading.Lock()
+
+
+def load_gate(index_dir: str, collection_name: str, space: str):
+    """读校准好的闸门；没校准过返回 None。文件按修改时间缓存，重新校准后自动生效"""
+    path = os.path.join(index_dir, GATE_FILENAME)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _CACHE_LOCK:
+        cached = _GATE_CACHE.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, "r", encoding="utf-8") as f:
+                cached = (mtime, json.load(f))
+            _GATE_CACHE[path] = cached
+    entry = cached[1].get(collection_name, {}).get(space)
+    if entry is None:
+        return None
+    return RelevanceGate(entry["threshold"], entry["space"], entry.get("stats"))
+
+
+def get_gate(index_dir: str, collection_name: str, collection) -> RelevanceGate:
+    """拿到集合的闸门：优先用校准值，没校准过就用距离空间对应的经验阈值"""
+    space = collection_space(collection)
+    gate = load_gate(index_dir, collection_name, space)
+    if gate is None:
+        gate = RelevanceGate(distance_threshold_for(collection), space, {"default": True})
+    return gate
+
+
+def get_gate_for_handle(handle) -> RelevanceGate:
+    """vector_store.open_knowledge_base 返回的句柄 (Chroma / NumPy) 对应的闸门"""
+    collection = handle.get()
+    if hasattr(handle, "collection_name"):
+        return get_gate(handle.db_path, handle.collection_name, collection)
+    # NumPy 索引：阈值存在导出目录里
+    return get_gate(handle.path, "numpy_index", collection)
@@ -0,0 +1,356 @@
+# utils/response_cache.py
+"""
+generate_content 响应的磁盘缓存 (SQLite)，默认关闭，按需开启。
+
+Agent 都用 temperature=0.0，day05_retrybuild.py 每次运行又把同一份 project_tasks_db 原样发一遍：
+一模一样的请求反复付费。预发环境和批处理任务里大部分调用都是完全重复的。
+key = sha256(规范化后的 模型名 + contents + config)，config 里包含 system_instruction、tools 和生成参数；
+value = 完整的 GenerateContentResponse (JSON)，命中时原样还原，response.text / function_calls 照常用。
+    容量：条数上限 + 字节上限，超出按最久没用过的淘汰
+    TTL：过期的条目读到时当作没命中
+    只缓存确定性的请求：默认只有 temperature=0 的请求走缓存 (Agent 都是)；没设 temperature 的请求
+        (day05 的几个助手) 每次本来就该得到不同的回复，缓存了反而让重试拿到同一个 (可能解析不了的) 回复
+    按次控制：generate_content(..., cache=False) 绕过；cache=True 不看 temperature 也缓存
+    统计：命中率、按 usage_metadata 算出省下的输入 / 输出 token
+开启方式：环境变量 RAG_RESPONSE_CACHE=1 (路径 RAG_RESPONSE_CACHE_PATH，TTL 秒数 RAG_RESPONSE_CACHE_TTL)，
+然后 client = with_response_cache(get_genai_client())；没开启时原样返回 client。
+⚠️ 开启了自动函数调用 (tools 里有 Python 函数且没 disable) 的请求不缓存：SDK 会在请求内部执行工具，
+   缓存命中会把工具调用也跳过。
+"""
+import enum
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from google.genai import types
+
+DEFAULT_RESPONSE_CACHE_PATH = os.environ.get(
+    "RAG_RESPONSE_CACHE_PATH", "rst/response_cache.sqlite3"
+)
+RESPONSE_CACHE_ENABLED = os.environ.get("RAG_RESPONSE_CACHE", "0") not in ("", "0", "false")
+DEFAULT_TTL = float(os.environ.get("RAG_RESPONSE_CACHE_TTL", 7 * 24 * 3600))
+# key 的格式变了就改这个版本号，旧条目自然失效
+KEY_VERSION = 1
+
+
+def _canonical(value):
+    """把 contents / config 转成稳定的 JSON 结构：dict 和 pydantic 对象写法不同但内容相同时得到同一个 key"""
+    if hasattr(value, "model_dump"):
+        return _canonical(value.model_dump(exclude_none=True))
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, bytes):
+        # 图片等二进制内容只取哈希，不把原始字节塞进 key
+        return {"bytes_sha256": hashlib.sha256(value).hexdigest()}
+    if isinstance(value, enum.Enum):
+        return value.value
+    if callable(value):
+        # Python 函数当工具：SDK 按 函数名 + 签名 + docstring 生成声明，改了哪个都算新请求
+        return {
+            "callable": f"{getattr(value, '__module__', '')}.{getattr(value, '__qualname__', repr(value))}",
+            "signature": str(inspect.signature(value)),
+            "doc": inspect.getdoc(value) or "",
+        }
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def make_request_key(model: str, contents, config=None) -> str:
+    """请求的内容寻址 key"""
+    payload = {
+        "v": KEY_VERSION,
+        "model": model,
+        "contents": _canonical(contents),
+        "config": _canonical(config or {}),
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(config, opt_in: bool = False) -> bool:
+    """
+    开启了自动函数调用的请求一律不缓存 (工具在 SDK 内部执行，缓存会把它们跳过)；
+    其余请求要 temperature=0 才缓存，opt_in=True (调用方显式要求) 时不看 temperature
+    """
+    config = _canonical(config or {})
+    has_callable = any(
+        isinstance(tool, dict) and "callable" in tool for tool in config.get("tools") or []
+    )
+    afc_disabled = (config.get("automatic_function_calling") or {}).get("disable", False)
+    if has_callable and not afc_disabled:
+        return False
+    return opt_in or config.get("temperature") == 0
+
+
+def _usage(data: dict) -> tuple:
+    usage = data.get("usage_metadata") or {}
+    return (
+        usage.get("prompt_token_count") or 0,
+        (usage.get("candidates_token_count") or 0) + (usage.get("thoughts_token_count") or 0),
+    )
+
+
+class ResponseCache:
+    """
+    参数:
+        path: 缓存文件路径，例如 "rst/response_cache.sqlite3"
+        max_entries: 最多保存多少条响应
+        max_bytes: 响应 JSON 的总字节上限
+        ttl: 条目有效期 (秒)，None 表示永不过期
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_RESPONSE_CACHE_PATH,
+        max_entries: int = 10_000,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl: float = DEFAULT_TTL,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.saved_prompt_tokens = 0
+        self.saved_output_tokens = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # 同步 / 异步 Agent 可能在不同线程里调用，关掉同线程检查，自己加锁
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                output_tokens INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        """命中返回 GenerateContentResponse，没命中 / 过期返回 None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, prompt_tokens, output_tokens, created_at FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is not None and self.ttl is not None and now - row[3] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            self.saved_prompt_tokens += row[1]
+            self.saved_output_tokens += row[2]
+        return types.GenerateContentResponse.model_validate(json.loads(row[0]))
+
+    def put(self, key: str, model: str, response) -> None:
+        """写入一条响应 (没有候选结果的响应，比如被安全策略拦截的，不缓存)"""
+        data = response.model_dump(mode="json", exclude_none=True)
+        if not data.get("candidates"):
+            return
+        text = json.dumps(data, ensure_ascii=False)
+        prompt_tokens, output_tokens = _usage(data)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO responses
+                    (key, model, response, size, prompt_tokens, output_tokens, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, model, text, len(text.encode("utf-8")), prompt_tokens, output_tokens, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        """先删过期的，再按条数 / 字节上限删最久没用过的 (调用方持有锁)"""
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        doomed = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_used ASC"
+        ):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self.bypassed += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """命中率和省下的 token"""
+        with self._lock:
+            size, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "saved_prompt_tokens": self.saved_prompt_tokens,
+            "saved_output_tokens": self.saved_output_tokens,
+            "size": size,
+            "bytes": total_bytes,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_CACHE_REGISTRY = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_response_cache(path: str = DEFAULT_RESPONSE_CACHE_PATH) -> ResponseCache:
+    """同一个缓存文件在进程里只打开一次"""
+    path = os.path.abspath(path)
+    with _REGISTRY_LOCK:
+        cache = _CACHE_REGISTRY.get(path)
+        if cache is None:
+            cache = ResponseCache(path)
+            _CACHE_REGISTRY[path] = cache
+    return cache
+
+
+class CachedModels:
+    """包一层 client.models：generate_content 先查缓存，其他方法原样转发"""
+
+    def __init__(self, models, cache: ResponseCache):
+        self._models = models
+        self.cache = cache
+
+    def generate_content(self, *, model: str, contents, config=None, cache: bool = None):
+        """cache: None 按 is_cacheable 自动判断，False 绕过，True 显式要求缓存"""
+        if cache is False or not is_cacheable(config, opt_in=cache is True):
+            self.cache.record_bypass()
+            return self._models.generate_content(model=model, contents=contents, config=config)
+        key = make_request_key(model, contents, config)
+        response = self.cache.get(key)
+        if response is None:
+            response = self._models.generate_content(model=model, contents=contents, config=config)
+            self.cache.put(key, model, response)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class AsyncCachedModels:
+    """包一层 client.aio.models (SQLite 读写都是毫秒级，直接在事件循环里做)"""
+
+    def __init__(self, models, cache: ResponseCache):
+        self._models = models
+        self.cache = cache
+
+    async def generate_content(self, *, model: str, contents, config=None, cache: bool = None):
+        """参数同 CachedModels.generate_content"""
+        if cache is False or not is_cacheable(config, opt_in=cache is True):
+            self.cache.record_bypass()
+            return await self._models.generate_content(
+                model=model, contents=contents, config=config
+            )
+        key = make_request_key(model, contents, config)
+        response = self.cache.get(key)
+        if response is None:
+            response = await self._models.generate_content(
+                model=model, contents=contents, config=config
+            )
+            self.cache.put(key, model, response)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class _CachedAio:
+    def __init__(self, aio, cache: ResponseCache):
+        self._aio = aio
+        self.models = AsyncCachedModels(aio.models, cache)
+
+    def __getattr__(self, name):
+        return getattr(self._aio, name)
+
+
+class CachedClient:
+    """genai.Client 的代理：client.models / client.aio.models 的 generate_content 走缓存，其余原样转发"""
+
+    def __init__(self, client, cache: ResponseCache):
+        self._client = client
+        self.cache = cache
+        self.models = CachedModels(client.models, cache)
+        self.aio = _CachedAio(client.aio, cache)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def with_response_cache(client, cache: ResponseCache = None):
+    """
+    给 client 挂上响应缓存。
+    参数:
+        cache: 指定缓存时一定开启；省略时看环境变量 RAG_RESPONSE_CACHE，没开启就原样返回 client
+    """
+    if cache is None:
+        if not RESPONSE_CACHE_ENABLED:
+            return client
+        cache = get_response_cache()
+    return CachedClient(client, cache)
+
+
+def format_cache_stats(client) -> str:
+    """缓存统计的一行摘要；client 没挂缓存时返回空字符串"""
+    if not isinstance(client, CachedClient):
+        return ""
+    stats = client.cache.stats()
+    return (
+        f"💰 响应缓存: 命中 {stats['hits']} / 未命中 {stats['misses']} / 绕过 {stats['bypassed']} "
+        f"(命中率 {stats['hit_ratio']:.1%})，省下输入 {stats['saved_prompt_tokens']} tokens、"
+        f"输出 {stats['saved_output_tokens']} tokens，共 {stats['size']} 条"
+    )
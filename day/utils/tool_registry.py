@@ -0,0 +1,209 @@
+# utils/tool_registry.py
+"""
+工具注册表 + 工具结果缓存。
+
+ReAct 循环里模型经常反复要同一个工具、同一组参数 (同一段对话里问两次常州天气、查两次同一篇日记)，
+以前 _execute_tool_calls 每次都老老实实重跑一遍。现在工具用装饰器声明自己能不能缓存：
+    @tool(cache="pure")                    纯函数：同样的参数永远同样的结果 (calculate_dog_food)
+    @tool(ttl=600)                         变化慢：结果缓存 600 秒 (get_current_weather)
+    @tool(cache="index", version=fn)       跟着索引走：version() 变了 (索引重建) 缓存自动失效 (search_knowledge_base)
+    没装饰 / @tool() 的工具每次都执行
+装饰器原样返回函数，交给模型的函数声明 (名字、签名、docstring) 不变。
+所有 Agent 的工具执行都走 call_tool：参数先规范化 (补默认值、Unicode 统一、8.0 当 8)，
+再查进程共享的缓存；命中率按工具统计 (tool_cache_stats)。
+"""
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from .embedding_cache import normalize_text
+
+CACHE_MODES = ("pure", "ttl", "index")
+
+# 工具名 -> ToolSpec
+TOOL_REGISTRY = {}
+
+
+class ToolSpec:
+    """
+    参数:
+        fn: 工具函数
+        cache: None (不缓存) / "pure" / "ttl" / "index"
+        ttl: 缓存秒数 (cache="ttl" 时必填，其他模式可选，作为额外的过期时间)
+        version: 返回当前版本号的函数 (cache="index" 时必填)，版本变了旧结果全部作废
+        cache_if: 判断结果能不能缓存的函数，例如把 "搜索失败" 排除掉；省略表示都能缓存
+    """
+
+    def __init__(self, fn, cache=None, ttl=None, version=None, cache_if=None):
+        if cache is not None and cache not in CACHE_MODES:
+            raise ValueError(f"未知的缓存模式: {cache} (可选: {' / '.join(CACHE_MODES)})")
+        if cache == "ttl" and not ttl:
+            raise ValueError(f"{fn.__name__}: cache='ttl' 需要指定 ttl 秒数")
+        if cache == "index" and version is None:
+            raise ValueError(f"{fn.__name__}: cache='index' 需要指定 version 函数")
+        self.fn = fn
+        self.name = fn.__name__
+        self.cache = cache
+        self.ttl = ttl
+        self.version = version
+        self.cache_if = cache_if
+        self.signature = inspect.signature(fn)
+
+    def normalize_args(self, args: dict) -> str:
+        """参数规范化成稳定的字符串：补上默认值，参数顺序、全角半角、8 和 8.0 的差别都不影响 key"""
+        try:
+            bound = self.signature.bind(**args)
+            bound.apply_defaults()
+            args = bound.arguments
+        except TypeError:
+            pass  # 参数对不上时照原样当 key，执行时会报错给模型
+        return json.dumps(_normalize(args), sort_keys=True, ensure_ascii=False)
+
+
+def _normalize(value):
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, str):
+        return normalize_text(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def tool(cache=None, ttl=None, version=None, cache_if=None):
+    """注册工具并声明缓存方式 (参数同 ToolSpec)，原样返回函数"""
+
+    def decorator(fn):
+        if cache is None and ttl is not None:
+            mode = "ttl"
+        else:
+            mode = cache
+        TOOL_REGISTRY[fn.__name__] = ToolSpec(fn, mode, ttl, version, cache_if)
+        return fn
+
+    return decorator
+
+
+class ToolResultCache:
+    """
+    进程共享的工具结果缓存 (内存 LRU)，按工具统计命中率。
+    参数:
+        max_entries: 最多缓存多少条结果
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (结果, 过期时间)
+        self._stats = {}  # 工具名 -> {"hits", "misses", "uncached"}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str, field: str) -> None:
+        stats = self._stats.setdefault(name, {"hits": 0, "misses": 0, "uncached": 0})
+        stats[field] += 1
+
+    def get(self, name: str, key):
+        """返回 (是否命中, 结果)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._count(name, "misses")
+                return False, None
+            self._entries.move_to_end(key)
+            self._count(name, "hits")
+            return True, entry[0]
+
+    def put(self, key, result, ttl=None) -> None:
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (result, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_uncached(self, name: str) -> None:
+        with self._lock:
+            self._count(name, "uncached")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """{工具名: {"hits", "misses", "uncached", "hit_ratio"}}"""
+        with self._lock:
+            report = {}
+            for name, stats in self._stats.items():
+                lookups = stats["hits"] + stats["misses"]
+                report[name] = {**stats, "hit_ratio": stats["hits"] / lookups if lookups else 0.0}
+            return report
+
+
+# 进程级共享的工具结果缓存
+tool_cache = ToolResultCache()
+
+
+def cache_key(name: str, args: dict):
+    """返回 (工具规格, 缓存 key)；工具不可缓存时 key 为 None"""
+    spec = TOOL_REGISTRY.get(name)
+    if spec is None or spec.cache is None:
+        return spec, None
+    version = spec.version() if spec.cache == "index" else None
+    return spec, (name, spec.normalize_args(args), version)
+
+
+def lookup(name: str, args: dict):
+    """查缓存，返回 (是否命中, 结果, key)；key 为 None 表示这个工具不缓存"""
+    spec, key = cache_key(name, args)
+    if key is None:
+        tool_cache.record_uncached(name)
+        return False, None, None
+    hit, result = tool_cache.get(name, key)
+    if hit:
+        print(f"♻️ [ToolCache] {name} 命中缓存，跳过执行")
+    return hit, result, key
+
+
+def store(name: str, key, result) -> None:
+    """把执行结果写进缓存 (key 为 None 或 cache_if 不通过时不写)"""
+    spec = TOOL_REGISTRY.get(name)
+    if key is None or spec is None:
+        return
+    if spec.cache_if is not None and not spec.cache_if(result):
+        return
+    tool_cache.put(key, result, spec.ttl)
+
+
+def call_tool(function_map: dict, name: str, args: dict):
+    """
+    执行工具 (Agent 的 _execute_tool_calls 统一走这里)：可缓存的工具先查缓存，没命中再执行并写回。
+    工具抛出的异常原样抛给调用方，不会被缓存。
+    """
+    args = dict(args or {})
+    hit, result, key = lookup(name, args)
+    if hit:
+        return result
+    result = function_map[name](**args)
+    store(name, key, result)
+    return result
+
+
+def tool_cache_stats() -> dict:
+    return tool_cache.stats()
+
+
+def format_tool_cache_stats() -> str:
+    """一行摘要：每个工具的命中 / 执行次数"""
+    parts = []
+    for name, stats in tool_cache_stats().items():
+        if stats["hits"] + stats["misses"]:
+            parts.append(f"{name} {stats['hits']}/{stats['hits'] + stats['misses']} ({stats['hit_ratio']:.0%})")
+        else:
+            parts.append(f"{name} 不缓存 ({stats['uncached']} 次)")
+    return "🧰 工具缓存命中: " + ("，".join(parts) if parts else "暂无调用")
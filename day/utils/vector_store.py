@@ -0,0 +1,176 @@
+# utils/vector_store.py
+"""
+进程级共享的 Chroma 客户端 / 集合句柄。
+
+以前 search_knowledge_base 每调用一次就 new 一个 PersistentClient 再 get_collection，
+每轮对话都要重新建 SQLite 连接、加载 HNSW 段。现在句柄懒加载、线程安全、整个进程共用，
+索引脚本重写了磁盘上的库 (chroma.sqlite3 的修改时间变了) 时自动重开。
+
+检索后端可以按部署切换 (环境变量 RAG_BACKEND)：
+    chroma (默认): 直接查 Chroma 集合
+    numpy: 查 day10_02_indexer --export-numpy 导出的内存矩阵 (utils/numpy_index.py)
+           RAG_NUMPY_QUANTIZATION=int8 / binary 时常驻内存只放量化向量，float32 向量走 mmap 精排
+两种句柄都有 get() / warm_up() / close()，get() 返回的对象都支持 collection.query 的用法。
+索引脚本用 --partition 按分类分区建库时，Chroma 句柄打开的是 utils/partitions.py 的路由集合
+(按分类过滤的查询只查对应分区，不过滤的查询所有分区合并)，用法不变。
+"""
+import atexit
+import os
+import threading
+import time
+
+import chromadb
+
+from .partitions import open_collection
+
+# 检索后端开关
+RAG_BACKEND = os.environ.get("RAG_BACKEND", "chroma")
+NUMPY_INDEX_PATH = os.environ.get("RAG_NUMPY_INDEX_PATH", "rst/numpy_index")
+NUMPY_QUANTIZATION = os.environ.get("RAG_NUMPY_QUANTIZATION", "none")
+
+# 进程级注册表：(db_path, collection_name) -> CollectionHandle / NumpyIndexHandle
+_HANDLE_REGISTRY = {}
+_REGISTRY_LOCK = threading.Lock()
+# Chroma 的 System 缓存是进程全局的，每清一次就 +1，其他句柄据此知道自己也要重开
+_system_generation = 0
+
+
+def get_index_version(db_path: str) -> int:
+    """磁盘上索引的版本号：用 chroma.sqlite3 的修改时间 (纳秒) 表示，库不存在时为 0"""
+    try:
+        return os.stat(os.path.join(db_path, "chroma.sqlite3")).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+class CollectionHandle:
+    """
+    懒加载的集合句柄。
+    参数:
+        db_path: ChromaDB 持久化目录
+        collection_name: 集合名 (相当于表名)
+        embedding_function: 集合使用的 Embedding 函数
+        check_interval: 最多每隔多少秒检查一次磁盘版本，避免每次查询都 stat 文件
+    """
+
+    def __init__(
+        self, db_path, collection_name, embedding_function, check_interval=1.0
+    ):
+        self.db_path = db_path
+        self.collection_name = collection_name
+        self.embedding_function = embedding_function
+        self.check_interval = check_interval
+
+        self._lock = threading.RLock()
+        self._client = None
+        self._collection = None
+        self._version = None
+        self._generation = None
+        self._last_check = 0.0
+
+    @property
+    def version(self):
+        """当前打开的索引版本 (未打开时为 None)"""
+        return self._version
+
+    def get(self):
+        """拿到集合对象；第一次调用或磁盘版本变化时才真正打开"""
+        now = time.monotonic()
+        with self._lock:
+            if self._generation != _system_generation:
+                # 别的句柄清掉了全局缓存，手里的客户端已经失效
+                self._client = None
+                self._collection = None
+
+            if self._collection is not None:
+                if now - self._last_check < self.check_interval:
+                    return self._collection
+                self._last_check = now
+                if get_index_version(self.db_path) == self._version:
+                    return self._collection
+                print(f"🔁 [VectorStore] 检测到索引更新，重新打开 {self.collection_name}")
+                self._release()
+
+            self._version = get_index_version(self.db_path)
+            self._generation = _system_generation
+            self._client = chromadb.PersistentClient(path=self.db_path)
+            self._collection = self._open_collection()
+            self._last_check = now
+            return self._collection
+
+    def _open_collection(self):
+        # 库是按分类分区建的 (collection_name__diary / __tech ...)，就打开分区路由
+        return open_collection(
+            self._client, self.collection_name, self.embedding_function
+        )
+
+    def warm_up(self):
+        """
+        预热：提前打开集合、加载 Embedding 模型并跑一次查询，
+        把 HNSW 段读进内存，这样用户的第一个问题不用等冷启动。
+        """
+        collection = self.get()
+        if collection.count() > 0:
+            collection.query(query_texts=["warm up"], n_results=1)
+        return collection
+
+    def close(self):
+        """显式释放客户端 (进程退出时也会自动调用)"""
+        with self._lock:
+            self._release()
+
+    def _release(self):
+        global _system_generation
+        if self._client is not None and self._generation == _system_generation:
+            # PersistentClient 会按路径缓存底层 System，不清掉的话重开拿到的还是旧状态
+            self._client.clear_system_cache()
+            _system_generation += 1
+        self._client = None
+        self._collection = None
+        self._version = None
+
+
+def get_collection_handle(
+    db_path, collection_name, embedding_function
+) -> CollectionHandle:
+    """获取共享的集合句柄 (同一个库 + 集合名返回同一个实例)"""
+    key = (os.path.abspath(db_path), collection_name)
+    with _REGISTRY_LOCK:
+        handle = _HANDLE_REGISTRY.get(key)
+        if handle is None:
+            handle = CollectionHandle(db_path, collection_name, embedding_function)
+            _HANDLE_REGISTRY[key] = handle
+    return handle
+
+
+def open_knowledge_base(db_path, collection_name, embedding_function, backend=None):
+    """
+    按配置的后端拿到共享的检索句柄。
+    参数:
+        backend: "chroma" / "numpy"，None 表示读环境变量 RAG_BACKEND
+    """
+    backend = backend or RAG_BACKEND
+    if backend == "chroma":
+        return get_collection_handle(db_path, collection_name, embedding_function)
+    if backend == "numpy":
+        from .numpy_index import NumpyIndexHandle
+
+        key = ("numpy", os.path.abspath(NUMPY_INDEX_PATH))
+        with _REGISTRY_LOCK:
+            handle = _HANDLE_REGISTRY.get(key)
+            if handle is None:
+                handle = NumpyIndexHandle(
+                    NUMPY_INDEX_PATH, embedding_function, quantization=NUMPY_QUANTIZATION
+                )
+                _HANDLE_REGISTRY[key] = handle
+        return handle
+    raise ValueError(f"未知的检索后端: {backend} (可选: chroma / numpy)")
+
+
+@atexit.register
+def close_all_handles():
+    """关闭所有句柄"""
+    with _REGISTRY_LOCK:
+        handles = list(_HANDLE_REGISTRY.values())
+    for handle in handles:
+        handle.close()